@@ -0,0 +1,81 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Differential check and benchmark of the signature verification backends of the Lambda
+authorizer (JWT_BACKEND). Every backend must accept and reject the same tokens; the script
+exits with an error otherwise.
+
+    python bench/authorizer_backends.py --invocations 2000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from authorizer_fixtures import LocalIssuer, load_authorizer  # noqa: E402
+
+BACKENDS = ['jose', 'cryptography']
+
+
+def token_cases(issuer, stranger):
+    """Returns (name, token) pairs covering the reasons a token is accepted or rejected."""
+    valid = issuer.sign('user@example.com', ['readers'])
+    header, claims, signature = valid.split('.')
+    other = issuer.sign('other@example.com', ['admins'])
+    return [
+        ('valid', valid),
+        ('expired', issuer.sign('user@example.com', ['readers'], ttl=-60)),
+        ('wrong audience', issuer.sign('user@example.com', ['readers'], audience='another-client')),
+        ('bad signature', f"{header}.{claims}.{other.split('.')[2]}"),
+        ('tampered claims', f"{header}.{other.split('.')[1]}.{signature}"),
+        ('truncated signature', f"{header}.{claims}.{signature[:-8]}"),
+        ('unknown kid', stranger.sign('user@example.com', ['readers'])),
+        ('malformed', 'not-a-jwt'),
+    ]
+
+
+def decisions(index, cases):
+    return {name: bool(index.verify_token(token)) for name, token in cases}
+
+
+def benchmark(index, token, invocations):
+    index.verify_token(token)
+    latencies = []
+    for _ in range(invocations):
+        start = time.perf_counter()
+        index.verify_token(token)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return sorted(latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--invocations', type=int, default=2000)
+    args = parser.parse_args()
+
+    issuer = LocalIssuer()
+    stranger = LocalIssuer()
+    keys_url = issuer.write_jwks()
+    cases = token_cases(issuer, stranger)
+
+    results = {}
+    for backend in BACKENDS:
+        index = load_authorizer(keys_url, JWT_BACKEND=backend, JWKS_MIN_REFRESH_INTERVAL=3600)
+        results[backend] = (decisions(index, cases), benchmark(index, cases[0][1], args.invocations))
+
+    reference = results[BACKENDS[0]][0]
+    mismatches = 0
+    for name, _ in cases:
+        row = {backend: results[backend][0][name] for backend in BACKENDS}
+        agree = len(set(row.values())) == 1
+        mismatches += not agree
+        print(f"{name:<20} " + ' '.join(f"{b}={'accept' if v else 'reject'}" for b, v in row.items())
+              + ('' if agree else '  MISMATCH'))
+    for backend in BACKENDS:
+        latencies = results[backend][1]
+        print(f"{backend:<13} verify_token mean={statistics.mean(latencies):7.1f}us "
+              f"p50={latencies[len(latencies) // 2]:7.1f}us p99={latencies[int(len(latencies) * 0.99)]:7.1f}us")
+    sys.exit(1 if mismatches or not reference['valid'] else 0)
@@ -0,0 +1,198 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Latency and load benchmark of the Lambda authorizer handler.
+
+Synthetic ID tokens are signed with a local RSA key and verified against a JWKS served on a
+local port. The events mix the three Cognito groups and the MLflow routes called by the UI.
+For each scenario the benchmark reports p50/p95/p99 latency, invocations per second and the
+peak memory allocated per invocation, and can compare them against a previous report:
+
+    pip install python-jose[cryptography]
+    python bench/authorizer_bench.py --json baseline.json
+    # ... change the authorizer ...
+    python bench/authorizer_bench.py --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from authorizer_fixtures import ACCOUNT, REGION, REST_API_ID, STAGE, LocalIssuer, load_authorizer, request_event  # noqa: E402
+
+AJAX = '/ajax-api/2.0/mlflow'
+
+# (weight, verb, path, query) of the requests sent by the MLflow UI while browsing
+ROUTE_MIX = [
+    (25, 'POST', f"{AJAX}/runs/search", {}),
+    (10, 'POST', f"{AJAX}/experiments/search", {}),
+    (10, 'GET', f"{AJAX}/runs/get", {'run_id': 'run'}),
+    (15, 'GET', f"{AJAX}/metrics/get-history", {'run_id': 'run', 'metric_key': 'rmse'}),
+    (15, 'GET', '/get-artifact', {'run_id': 'run', 'path': 'model/MLmodel'}),
+    (5, 'GET', f"{AJAX}/artifacts/list", {'run_id': 'run'}),
+    (5, 'GET', f"{AJAX}/registered-models/search", {}),
+    (5, 'GET', f"{AJAX}/model-versions/search", {'filter': "name='model'"}),
+    (5, 'GET', f"{AJAX}/model-versions/get", {'name': 'model', 'version': '1'}),
+    (3, 'GET', '/model-versions/get-artifact', {'name': 'model', 'version': '1', 'path': 'MLmodel'}),
+    (2, 'POST', f"{AJAX}/model-versions/transition-stage", {}),
+]
+
+GROUP_MIX = [(20, ['admins']), (60, ['readers']), (20, ['model-approvers'])]
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))]
+
+
+def make_events(issuer, invocations, users, seed):
+    """Returns a reproducible list of events: each user has one token, and sends the requests
+    of the route mix in a random order, as a browser session does."""
+    rng = random.Random(seed)
+    groups = rng.choices([g for _, g in GROUP_MIX], weights=[w for w, _ in GROUP_MIX], k=users)
+    tokens = [issuer.sign(f"user-{i}@example.com", groups[i]) for i in range(users)]
+    routes = rng.choices(ROUTE_MIX, weights=[r[0] for r in ROUTE_MIX], k=invocations)
+    return [request_event(rng.choice(tokens), verb, path, dict(query)) for _, verb, path, query in routes]
+
+
+def run_scenario(index, events, cached):
+    """Invokes the handler for every event and returns the latencies in microseconds and the
+    throughput in invocations per second."""
+    latencies = []
+    started = time.perf_counter()
+    for event in events:
+        if not cached:
+            index.token_cache.clear()
+        start = time.perf_counter()
+        index.handler(event, None)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies, len(events) / (time.perf_counter() - started)
+
+
+def measure_allocations(index, events, cached):
+    """Returns the mean of the peak bytes allocated by an invocation, and the bytes still
+    allocated after all the invocations (e.g., grown caches)."""
+    peaks = []
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for event in events:
+        if not cached:
+            index.token_cache.clear()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        index.handler(event, None)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return statistics.mean(peaks), retained
+
+
+def run_policy_build(index, invocations, compiled):
+    latencies = []
+    groups = ['readers', 'model-approvers']
+    started = time.perf_counter()
+    for i in range(invocations):
+        if not compiled:
+            index.compile_policy.cache_clear()
+        start = time.perf_counter()
+        index.build_policy(f"user-{i}", groups, REGION, ACCOUNT, REST_API_ID, STAGE)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies, invocations / (time.perf_counter() - started)
+
+
+def summarize(name, latencies, throughput, allocations=None):
+    latencies = sorted(latencies)
+    result = {
+        'scenario': name,
+        'invocations': len(latencies),
+        'mean_us': statistics.mean(latencies),
+        'p50_us': percentile(latencies, 50),
+        'p95_us': percentile(latencies, 95),
+        'p99_us': percentile(latencies, 99),
+        'invocations_per_second': throughput,
+    }
+    if allocations is not None:
+        result['peak_alloc_bytes_per_invocation'], result['retained_bytes'] = allocations
+    return result
+
+
+def print_result(result):
+    line = (f"{result['scenario']:<16} p50={result['p50_us']:8.1f}us p95={result['p95_us']:8.1f}us "
+            f"p99={result['p99_us']:8.1f}us {result['invocations_per_second']:9.0f} inv/s")
+    if 'peak_alloc_bytes_per_invocation' in result:
+        line += (f" alloc={result['peak_alloc_bytes_per_invocation'] / 1024:6.1f}KiB/inv"
+                 f" retained={result['retained_bytes'] / 1024:7.1f}KiB")
+    print(line)
+
+
+def regressions(results, baseline, tolerance):
+    """Returns the (scenario, metric, baseline, current) tuples that are slower than the
+    baseline by more than the tolerance."""
+    previous = {result['scenario']: result for result in baseline['results']}
+    slower = []
+    for result in results:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        for metric in ('p50_us', 'p95_us', 'p99_us'):
+            if result[metric] > before[metric] * (1 + tolerance):
+                slower.append((result['scenario'], metric, before[metric], result[metric]))
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--invocations', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200, help='number of distinct tokens')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', type=str, help='write the report to this file')
+    parser.add_argument('--baseline', type=str, help='report of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    issuer = LocalIssuer()
+    keys_url, jwks_server = issuer.serve_jwks()
+    index = load_authorizer(keys_url)
+    events = make_events(issuer, args.invocations, args.users, args.seed)
+    # the first invocation pays for the lazy imports and key construction
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        index.handler(events[0], None)
+
+    results = []
+    # the EMF metrics lines printed by the handler are part of the measured cost, but not of the output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, cached in (('verify', False), ('token-cache', True)):
+            index.token_cache.clear()
+            latencies, throughput = run_scenario(index, events, cached)
+            index.token_cache.clear()
+            results.append(summarize(name, latencies, throughput, measure_allocations(index, events, cached)))
+    for name, compiled in (('policy-build', False), ('policy-compiled', True)):
+        results.append(summarize(name, *run_policy_build(index, args.invocations, compiled)))
+    jwks_server.shutdown()
+
+    for result in results:
+        print_result(result)
+    print(f"token cache: {index.token_cache.stats()}")
+
+    report = {
+        'python': sys.version.split()[0],
+        'invocations': args.invocations,
+        'users': args.users,
+        'seed': args.seed,
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for scenario, metric, before, after in slower:
+            print(f"REGRESSION {scenario} {metric}: {before:.1f}us -> {after:.1f}us")
+        sys.exit(1 if slower else 0)
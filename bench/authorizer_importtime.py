@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Reports the cold start cost of the Lambda authorizer module by module, using the
+interpreter import profiler (python -X importtime) on a fresh process for each scenario.
+
+    python bench/authorizer_importtime.py --top 15 [--json importtime.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from authorizer_fixtures import APP_CLIENT_ID, AUTHORIZER_DIR, REGION, LocalIssuer, request_event  # noqa: E402
+
+# what the Lambda runtime does during the init phase, followed by a first request
+FIRST_REQUEST = """
+import json, sys, time
+start = time.perf_counter()
+import index
+init = time.perf_counter() - start
+sys.stderr.write({marker!r} + '\\n')
+start = time.perf_counter()
+index.handler(json.loads({event!r}), None)
+first = time.perf_counter() - start
+print(json.dumps({{'init_ms': init * 1000, 'first_request_ms': first * 1000}}))
+"""
+MARKER = '--- first request'
+
+
+def parse_importtime(stderr):
+    """Returns the self time in microseconds of each top-level package imported during the
+    init phase and during the first request."""
+    phases = {'init': defaultdict(int), 'first_request': defaultdict(int)}
+    packages = phases['init']
+    for line in stderr.splitlines():
+        if line == MARKER:
+            packages = phases['first_request']
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us)
+    return {phase: dict(packages) for phase, packages in phases.items()}
+
+
+def profile(scenario, env, token):
+    event = json.dumps(request_event(token, 'POST', '/ajax-api/2.0/mlflow/runs/search'))
+    code = FIRST_REQUEST.format(marker=MARKER, event=event)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=AUTHORIZER_DIR,
+                            env=env, capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process_ms'] = (time.perf_counter() - started) * 1000
+    timings['modules_us'] = parse_importtime(result.stderr)
+    timings['scenario'] = scenario
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--json', type=str, help='write the full report to this file')
+    args = parser.parse_args()
+
+    issuer = LocalIssuer()
+    keys_url = issuer.write_jwks()
+    token = issuer.sign('mlflow-reader@example.com', ['readers'])
+    base_env = dict(os.environ, REGION=REGION, APP_CLIENT_ID=APP_CLIENT_ID, COGNITO_KEYS_URL=keys_url,
+                    JWKS_SNAPSHOT_PATH='')
+    scenarios = {
+        'fetch-jwks': base_env,
+        'snapshot': dict(base_env, JWKS_SNAPSHOT=json.dumps(issuer.jwks())),
+        'snapshot+warm': dict(base_env, JWKS_SNAPSHOT=json.dumps(issuer.jwks()), WARM_ON_INIT='true',
+                              REST_API_ID='abcdef1234', ACCOUNT='123456789012'),
+    }
+    reports = [profile(name, env, token) for name, env in scenarios.items()]
+    for report in reports:
+        print(f"{report['scenario']:<14} init={report['init_ms']:7.1f}ms "
+              f"first request={report['first_request_ms']:7.1f}ms process={report['process_ms']:7.1f}ms")
+        for phase, modules in report['modules_us'].items():
+            modules = sorted(modules.items(), key=lambda item: -item[1])[:args.top]
+            print(f"  {phase}: " + ', '.join(f"{name} {self_us / 1000:.1f}ms" for name, self_us in modules))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
@@ -0,0 +1,179 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Checks the caching proxy (src/mlflow-cache/proxy.py) against a local MLflow server with a
+sqlite store: the MLflow client talks to the proxy, every write must be visible to the next
+read, identical concurrent reads are coalesced, artifacts are served from the cache, and the
+latency of the hot endpoints is compared with and without the proxy.
+
+    pip install mlflow==2.12.2
+    python bench/cache_proxy_check.py
+"""
+
+import argparse
+import concurrent.futures
+import http.client
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+PROXY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'mlflow-cache')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise Exception(f"{url} did not start")
+
+
+def start_mlflow_server(directory, port):
+    command = [sys.executable, '-m', 'mlflow', 'server', '--host', '127.0.0.1', '--port', str(port),
+               '--backend-store-uri', f"sqlite:///{directory}/mlflow.db",
+               '--artifacts-destination', f"{directory}/artifacts", '--workers', '2']
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    wait_for(f"http://127.0.0.1:{port}")
+    return server
+
+
+def start_proxy(upstream, port):
+    os.environ['MLFLOW_UPSTREAM'] = upstream
+    sys.path.insert(0, PROXY_DIR)
+    import proxy
+    server = proxy.ProxyServer(('127.0.0.1', port), proxy.ProxyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return proxy
+
+
+def call(base_url, method, path, payload=None):
+    """Returns (status, X-Cache header, body)."""
+    connection = http.client.HTTPConnection(base_url.split('//')[1], timeout=30)
+    body = json.dumps(payload).encode() if payload is not None else None
+    connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    result = response.status, response.getheader('X-Cache'), response.read()
+    connection.close()
+    return result
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def check_consistency(client, proxy_url, proxy):
+    from mlflow.entities import Metric
+    results = []
+    experiment_id = client.create_experiment('cache-check')
+    search = ('POST', '/api/2.0/mlflow/runs/search', {'experiment_ids': [experiment_id]})
+
+    call(proxy_url, *search)
+    status, cache_status, _ = call(proxy_url, *search)
+    results.append(check(cache_status == 'HIT', 'runs/search is served from the cache'))
+
+    run = client.create_run(experiment_id)
+    run_id = run.info.run_id
+    runs = json.loads(call(proxy_url, *search)[2]).get('runs', [])
+    results.append(check(len(runs) == 1, 'runs/create invalidates runs/search'))
+
+    call(proxy_url, 'GET', f"/api/2.0/mlflow/runs/get?run_id={run_id}")
+    client.log_batch(run_id, metrics=[Metric('rmse', 0.5, int(time.time() * 1000), 0)])
+    fetched = client.get_run(run_id)
+    results.append(check(fetched.data.metrics.get('rmse') == 0.5, 'runs/log-batch invalidates runs/get of the run'))
+
+    other = client.create_run(experiment_id)
+    call(proxy_url, 'GET', f"/api/2.0/mlflow/runs/get?run_id={other.info.run_id}")
+    client.set_tag(run_id, 'stage', 'checked')
+    cache_status = call(proxy_url, 'GET', f"/api/2.0/mlflow/runs/get?run_id={other.info.run_id}")[1]
+    results.append(check(cache_status == 'HIT', 'a write to a run keeps the cached responses of the other runs'))
+
+    client.create_registered_model('cache-check-model')
+    call(proxy_url, 'GET', '/api/2.0/mlflow/registered-models/search')
+    version = client.create_model_version('cache-check-model', f"runs:/{run_id}/model", run_id)
+    client.transition_model_version_stage('cache-check-model', version.version, 'Staging')
+    fetched = client.get_model_version('cache-check-model', version.version)
+    results.append(check(fetched.current_stage == 'Staging', 'model-versions/transition-stage invalidates model-versions/get'))
+    models = json.loads(call(proxy_url, 'GET', '/api/2.0/mlflow/registered-models/search')[2])
+    latest = models['registered_models'][0].get('latest_versions', [])
+    results.append(check(any(v['current_stage'] == 'Staging' for v in latest), 'and registered-models/search'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'model.bin')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(1024 * 1024))
+        client.log_artifact(run_id, path)
+        artifact = f"/get-artifact?path=model.bin&run_uuid={run_id}"
+        first = call(proxy_url, 'GET', artifact)
+        second = call(proxy_url, 'GET', artifact)
+        with open(path, 'rb') as f:
+            expected = f.read()
+    results.append(check(first[2] == expected and second[2] == expected and second[1] == 'HIT',
+                         'get-artifact bytes are served from the artifact cache'))
+
+    proxy.metadata_cache.invalidate((proxy.ALL,))
+    before = proxy.inflight.coalesced
+    with concurrent.futures.ThreadPoolExecutor(32) as executor:
+        statuses = list(executor.map(lambda _: call(proxy_url, *search)[1], range(32)))
+    results.append(check(statuses.count('MISS') == 1 and proxy.inflight.coalesced - before >= 1,
+                         f"32 concurrent identical searches reach the server once "
+                         f"({statuses.count('COALESCED')} coalesced, {statuses.count('HIT')} hits)"))
+    return all(results)
+
+
+def latency(base_url, requests, repeat):
+    timings = []
+    for _ in range(repeat):
+        for method, path, payload in requests:
+            start = time.perf_counter()
+            call(base_url, method, path, payload)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server_url = f"http://127.0.0.1:{free_port()}"
+        proxy_url = f"http://127.0.0.1:{free_port()}"
+        server = start_mlflow_server(directory, int(server_url.rsplit(':', 1)[1]))
+        try:
+            proxy = start_proxy(server_url, int(proxy_url.rsplit(':', 1)[1]))
+            import mlflow
+            from mlflow.tracking import MlflowClient
+            # the mlflow-artifacts URIs are resolved against the global tracking URI
+            mlflow.set_tracking_uri(proxy_url)
+            ok = check_consistency(MlflowClient(), proxy_url, proxy)
+
+            hot = [('POST', '/ajax-api/2.0/mlflow/experiments/search', {'max_results': 20}),
+                   ('POST', '/ajax-api/2.0/mlflow/runs/search', {'experiment_ids': ['1'], 'max_results': 100}),
+                   ('GET', '/ajax-api/2.0/mlflow/registered-models/search', None)]
+            for name, url in (('server', server_url), ('proxy', proxy_url)):
+                p50, p95 = latency(url, hot, args.repeat)
+                print(f"{name:<7} hot endpoints p50={p50:6.2f}ms p95={p95:6.2f}ms")
+            print(json.dumps(proxy.stats()))
+        finally:
+            # mlflow server does not stop its gunicorn workers when terminated
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,464 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""End to end benchmark of the request path, on a local stand-in of the deployed stacks:
+
+    client -> API Gateway (bench/local_api_gateway.py, with the real Lambda authorizer)
+           -> [caching proxy (src/mlflow-cache, --cache)] -> mlflow server (sqlite, local artifacts)
+           -> gateway (src/mlflow-gateway) -> mock provider (src/mlflow-gateway/mock_provider.py)
+
+The ID tokens are signed with a local RSA key, whose JWKS is given to the authorizer. After
+seeding an experiment, runs with metric histories and artifacts, and a registered model, virtual
+users replay the traces of bench/traces at each concurrency level: UI sessions with a Cognito token
+through the authorizer, notebook sessions through the IAM routes. The report breaks the latency
+of the requests down into the authorizer, API Gateway itself, the tracking server or the gateway,
+and the client side (connection and queueing), from the Server-Timing headers of the emulator:
+
+    pip install mlflow[genai]==2.12.2 python-jose[cryptography] psutil
+    python bench/e2e_bench.py --concurrency 1 4 16 --duration 20 --json e2e.json
+    python bench/e2e_bench.py --cache --concurrency 1 4 16 --duration 20 --baseline e2e.json
+
+Traces recorded with `python bench/local_api_gateway.py --record trace.jsonl` (pointing the UI or a
+notebook at it) can be replayed with --trace, against the store they were recorded on
+(--backend-store-uri, --artifacts-destination and --no-seed). Everything runs on this machine, so
+the components compete for the same CPUs: compare runs made on the same host.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from authorizer_fixtures import LocalIssuer  # noqa: E402
+from authorizer_bench import GROUP_MIX  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+TRACES = {'ui': os.path.join(BENCH_DIR, 'traces', 'ui_session.jsonl'),
+          'notebook': os.path.join(BENCH_DIR, 'traces', 'notebook_session.jsonl')}
+EXPERIMENT_NAME = 'e2e-bench'
+MODEL_NAME = 'e2e-bench-model'
+COMPONENTS = ('authorizer', 'proxy', 'tracking', 'gateway', 'client')
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise Exception(f"{' '.join(process.args[:4])} exited with {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise Exception(f"{url} did not start")
+
+
+class LocalStack(object):
+    """Starts the processes of the stack, each on a free local port."""
+
+    def __init__(self, args, directory, keys_url):
+        self.args = args
+        self.directory = directory
+        self.keys_url = keys_url
+        self.processes = []
+        self.output = open(os.path.join(directory, 'stack.log'), 'w')
+
+    def _start(self, command, health_url, env=None):
+        process = subprocess.Popen(command, env={**os.environ, **(env or {})}, stdout=self.output, stderr=self.output,
+                                   start_new_session=True)
+        self.processes.append(process)
+        wait_for(health_url, process)
+        return process
+
+    def start(self):
+        args = self.args
+        backend_store_uri = args.backend_store_uri or f"sqlite:///{self.directory}/mlflow.db"
+        artifacts_destination = args.artifacts_destination or os.path.join(self.directory, 'artifacts')
+        self.tracking_url = f"http://127.0.0.1:{free_port()}"
+        self._start([sys.executable, '-m', 'mlflow', 'server', '--host', '127.0.0.1',
+                     '--port', self.tracking_url.rsplit(':', 1)[1], '--backend-store-uri', backend_store_uri,
+                     # the runs write their artifacts directly, like to the bucket of the stack
+                     '--default-artifact-root', f"file://{os.path.abspath(artifacts_destination)}",
+                     '--artifacts-destination', artifacts_destination, '--workers', str(args.server_workers)],
+                    f"{self.tracking_url}/health")
+        # the NLB target of the tracking server
+        self.target_url = self.tracking_url
+        if args.cache:
+            self.target_url = f"http://127.0.0.1:{free_port()}"
+            self._start([sys.executable, os.path.join(SRC_DIR, 'mlflow-cache', 'proxy.py')],
+                        f"{self.target_url}/health",
+                        {'MLFLOW_UPSTREAM': self.tracking_url, 'PORT': self.target_url.rsplit(':', 1)[1]})
+
+        mock_port = free_port()
+        self._start([sys.executable, os.path.join(SRC_DIR, 'mlflow-gateway', 'mock_provider.py'), '--port', str(mock_port),
+                     '--latency-ms', str(args.provider_latency_ms), '--latency-profile', 'lognormal'],
+                    f"http://127.0.0.1:{mock_port}/stats")
+        config_path = os.path.join(self.directory, 'gateway.yaml')
+        with open(os.path.join(SRC_DIR, 'mlflow-gateway', 'config.mock.yaml')) as f:
+            config = f.read().replace('localhost:8088', f"127.0.0.1:{mock_port}")
+        with open(config_path, 'w') as f:
+            f.write(config)
+        self.gateway_url = f"http://127.0.0.1:{free_port()}"
+        self._start([sys.executable, os.path.join(SRC_DIR, 'mlflow-gateway', 'gateway.py'), '--config-path', config_path,
+                     '--host', '127.0.0.1', '--port', self.gateway_url.rsplit(':', 1)[1],
+                     '--workers', str(args.gateway_workers)],
+                    f"{self.gateway_url}/health", {'STATS_INTERVAL': '0'})
+
+        self.api_url = f"http://127.0.0.1:{free_port()}"
+        command = [sys.executable, os.path.join(BENCH_DIR, 'local_api_gateway.py'), '--port', self.api_url.rsplit(':', 1)[1],
+                   '--keys-url', self.keys_url, '--tracking-url', self.target_url, '--gateway-url', self.gateway_url,
+                   '--authorizer-cache-ttl', str(args.authorizer_cache_ttl)]
+        self._start(command, f"{self.api_url}/api/2.0/mlflow/experiments/search?max_results=1")
+        return self
+
+    def stop(self):
+        # mlflow server does not stop its gunicorn workers when terminated
+        for process in reversed(self.processes):
+            os.killpg(process.pid, signal.SIGTERM)
+        for process in self.processes:
+            process.wait()
+        self.output.close()
+
+
+def seed(tracking_url, runs):
+    """Creates the experiment, the runs and the registered model the traces refer to, directly on
+    the tracking server. Returns the values of the placeholders."""
+    import mlflow
+    from mlflow.entities import Metric, Param, RunTag
+    from mlflow.tracking import MlflowClient
+
+    mlflow.set_tracking_uri(tracking_url)
+    client = MlflowClient()
+    experiment = client.get_experiment_by_name(EXPERIMENT_NAME)
+    experiment_id = experiment.experiment_id if experiment else client.create_experiment(EXPERIMENT_NAME)
+    rng = random.Random(0)
+    run_ids = []
+    with tempfile.TemporaryDirectory() as directory:
+        model_dir = os.path.join(directory, 'model')
+        os.makedirs(model_dir)
+        with open(os.path.join(model_dir, 'MLmodel'), 'w') as f:
+            f.write('artifact_path: model\nflavors:\n  sklearn:\n    pickled_model: model.pkl\n')
+        with open(os.path.join(model_dir, 'model.pkl'), 'wb') as f:
+            f.write(os.urandom(256 * 1024))
+        for i in range(runs):
+            run = client.create_run(experiment_id, run_name=f"run-{i}")
+            now = int(time.time() * 1000)
+            metrics = [Metric(key, rng.uniform(0.3, 0.9), now + step, step) for key in ('rmse', 'mae') for step in range(100)]
+            client.log_batch(run.info.run_id, metrics=metrics[:1000],
+                             params=[Param('n-estimators', str(rng.choice([50, 100, 200]))), Param('min-samples-leaf', '3')],
+                             tags=[RunTag('mlflow.source.name', 'train.py')])
+            client.log_artifacts(run.info.run_id, model_dir, 'model')
+            client.set_terminated(run.info.run_id)
+            run_ids.append(run.info.run_id)
+    if not client.search_registered_models(f"name='{MODEL_NAME}'"):
+        client.create_registered_model(MODEL_NAME)
+        client.create_model_version(MODEL_NAME, f"runs:/{run_ids[0]}/model", run_ids[0])
+    return {'experiment_id': experiment_id, 'experiment_name': EXPERIMENT_NAME, 'model_name': MODEL_NAME,
+            'run_ids': run_ids}
+
+
+def load_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def substitute(value, variables):
+    """Replaces the {placeholders} of the strings of a request, unknown ones are kept."""
+    if isinstance(value, str):
+        return PLACEHOLDER.sub(lambda m: str(variables.get(m.group(1), m.group(0))), value)
+    if isinstance(value, list):
+        return [substitute(v, variables) for v in value]
+    if isinstance(value, dict):
+        return {k: substitute(v, variables) for k, v in value.items()}
+    return value
+
+
+def extract(payload, dotted):
+    for key in dotted.split('.'):
+        payload = payload.get(key, {}) if isinstance(payload, dict) else {}
+    return payload or None
+
+
+def parse_server_timing(header):
+    timings = {}
+    for part in (header or '').split(','):
+        name, _, duration = part.strip().partition(';dur=')
+        if duration:
+            timings[name] = float(duration)
+    return timings
+
+
+class VirtualUser(threading.Thread):
+    """Replays a trace in a loop until the deadline, on one keep-alive connection."""
+
+    def __init__(self, api_url, kind, trace, variables, token, think_scale, deadline, measure_from, samples, seed):
+        super().__init__(daemon=True)
+        self.netloc = urllib.parse.urlsplit(api_url).netloc
+        self.kind = kind
+        self.trace = trace
+        self.variables = variables
+        self.token = token
+        self.think_scale = think_scale
+        self.deadline = deadline
+        self.measure_from = measure_from
+        self.samples = samples
+        self.rng = random.Random(seed)
+        self.connection = None
+
+    def _send(self, method, path, body, headers):
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.netloc, timeout=300)
+            try:
+                start = time.perf_counter()
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                payload = response.read()
+                return response, payload, (time.perf_counter() - start) * 1000, start
+            except (http.client.HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            variables = dict(self.variables, run_id=self.rng.choice(self.variables['run_ids']))
+            for step in self.trace:
+                if time.perf_counter() >= self.deadline:
+                    return
+                time.sleep(step.get('think_ms', 0) * self.think_scale / 1000)
+                variables['now_ms'] = int(time.time() * 1000)
+                path = substitute(step['path'], variables)
+                headers = {}
+                if self.token:
+                    headers['Authorization'] = f"Bearer {self.token}"
+                if 'body' in step:
+                    body = json.dumps(substitute(step['body'], variables)).encode()
+                    headers['Content-Type'] = 'application/json'
+                else:
+                    body = substitute(step['body_text'], variables).encode() if 'body_text' in step else None
+                try:
+                    response, payload, total, start = self._send(step['method'], path, body, headers)
+                except (http.client.HTTPException, OSError):
+                    if time.perf_counter() >= self.measure_from:
+                        self.samples.append({'kind': self.kind, 'status': 'connection-error'})
+                    continue
+                for name, dotted in step.get('save', {}).items():
+                    try:
+                        variables[name] = extract(json.loads(payload), dotted)
+                    except ValueError:
+                        variables[name] = None
+                if start < self.measure_from:
+                    continue
+                timings = parse_server_timing(response.getheader('Server-Timing'))
+                upstream = response.getheader('X-Integration', 'tracking')
+                sample = {
+                    'kind': self.kind,
+                    'route': f"{step['method']} {PLACEHOLDER.sub('', step['path'].split('?')[0])}",
+                    'status': response.status,
+                    'total': total,
+                    'authorizer': timings.get('authorizer', 0.0),
+                    'proxy': timings.get('proxy', 0.0),
+                    'tracking': timings.get('upstream', 0.0) if upstream == 'tracking' else 0.0,
+                    'gateway': timings.get('upstream', 0.0) if upstream == 'gateway' else 0.0,
+                    'authorizer_cache': response.getheader('X-Authorizer-Cache', 'NONE'),
+                }
+                sample['client'] = max(0.0, total - sum(timings.values()))
+                self.samples.append(sample)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else 0.0
+
+
+def summarize(samples, elapsed):
+    timed = [s for s in samples if 'total' in s]
+    ok = [s for s in timed if isinstance(s['status'], int) and s['status'] < 400]
+    statuses = {}
+    for s in samples:
+        statuses[str(s['status'])] = statuses.get(str(s['status']), 0) + 1
+    totals = [s['total'] for s in ok]
+    result = {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'statuses': statuses,
+        'throughput_rps': round(len(ok) / elapsed, 2),
+        'p50_ms': round(percentile(totals, 50), 2),
+        'p95_ms': round(percentile(totals, 95), 2),
+        'p99_ms': round(percentile(totals, 99), 2),
+        'breakdown_ms': {},
+    }
+    for component in COMPONENTS:
+        values = [s[component] for s in ok]
+        result['breakdown_ms'][component] = {
+            'mean': round(statistics.mean(values), 3) if values else 0.0,
+            'p50': round(percentile(values, 50), 3),
+            'p95': round(percentile(values, 95), 3),
+            'share': round(sum(values) / sum(totals), 4) if totals else 0.0,
+        }
+    authorized = [s for s in ok if s['authorizer_cache'] != 'NONE']
+    if authorized:
+        result['authorizer_cache_hit_ratio'] = round(
+            sum(s['authorizer_cache'] == 'HIT' for s in authorized) / len(authorized), 4)
+    return result
+
+
+def run_level(api_url, traces, variables, tokens, concurrency, args):
+    """Runs `concurrency` virtual users for the duration, returns the summaries per trace kind and
+    overall, and the slowest routes."""
+    samples = []
+    measure_from = time.perf_counter() + args.warmup
+    deadline = measure_from + args.duration
+    notebooks = round(concurrency * args.notebook_share)
+    users = []
+    for i in range(concurrency):
+        kind = 'notebook' if i < notebooks else 'ui'
+        # the notebooks call the IAM routes, the UI sends the Cognito token of its user
+        token = None if kind == 'notebook' else tokens[i % len(tokens)]
+        users.append(VirtualUser(api_url, kind, traces[kind], variables, token, args.think_scale, deadline,
+                                 measure_from, samples, seed=i))
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - measure_from
+    results = []
+    for kind in ['all'] + sorted(traces):
+        subset = samples if kind == 'all' else [s for s in samples if s['kind'] == kind]
+        if subset:
+            results.append({'scenario': f"{kind},concurrency={concurrency}", 'trace': kind, 'concurrency': concurrency,
+                            'users': len([u for u in users if kind in ('all', u.kind)]), **summarize(subset, elapsed)})
+    routes = {}
+    for s in samples:
+        if 'total' in s:
+            routes.setdefault(s['route'], []).append(s['total'])
+    slowest = sorted(((route, round(percentile(v, 95), 2), len(v)) for route, v in routes.items()),
+                     key=lambda r: -r[1])[:5]
+    return results, [{'route': r, 'p95_ms': p95, 'requests': n} for r, p95, n in slowest]
+
+
+def print_result(result):
+    breakdown = ' '.join(f"{c}={result['breakdown_ms'][c]['mean']:7.2f}" for c in COMPONENTS)
+    print(f"{result['scenario']:<26} {result['throughput_rps']:7.1f} req/s p50={result['p50_ms']:7.1f}ms "
+          f"p95={result['p95_ms']:7.1f}ms errors={result['errors']:<4d} mean ms: {breakdown}", flush=True)
+
+
+def regressions(results, baseline, tolerance):
+    """Returns the (scenario, metric, baseline, current) tuples worse than the baseline by more
+    than the tolerance."""
+    previous = {result['scenario']: result for result in baseline['results']}
+    worse = []
+    for result in results:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if result[metric] > before[metric] * (1 + tolerance):
+                worse.append((result['scenario'], metric, before[metric], result[metric]))
+    return worse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='virtual users per level')
+    parser.add_argument('--duration', type=float, default=20, help='seconds measured per level')
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--notebook-share', type=float, default=0.25, help='share of the users replaying notebooks')
+    parser.add_argument('--think-scale', type=float, default=0.0,
+                        help='multiplier of the recorded think times, 0 replays back to back')
+    parser.add_argument('--trace', action='append', default=[], metavar='KIND=PATH',
+                        help='replace a trace, e.g. ui=recorded.jsonl')
+    parser.add_argument('--users', type=int, default=20, help='distinct Cognito users of the UI sessions')
+    parser.add_argument('--runs', type=int, default=30, help='runs seeded in the experiment')
+    parser.add_argument('--no-seed', action='store_true')
+    parser.add_argument('--backend-store-uri', type=str)
+    parser.add_argument('--artifacts-destination', type=str)
+    parser.add_argument('--server-workers', type=int, default=2)
+    parser.add_argument('--gateway-workers', type=int, default=1)
+    parser.add_argument('--provider-latency-ms', type=float, default=300)
+    parser.add_argument('--authorizer-cache-ttl', type=float, default=300, help='0 invokes the authorizer on every request')
+    parser.add_argument('--cache', action='store_true', help='put the caching proxy in front of the tracking server')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', type=str, help='write the report to this file')
+    parser.add_argument('--baseline', type=str, help='report of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    traces = {kind: load_trace(path) for kind, path in TRACES.items()}
+    for replacement in args.trace:
+        kind, _, path = replacement.partition('=')
+        traces[kind] = load_trace(path)
+
+    issuer = LocalIssuer()
+    rng = random.Random(args.seed)
+    groups = rng.choices([g for _, g in GROUP_MIX], weights=[w for w, _ in GROUP_MIX], k=args.users)
+    tokens = [issuer.sign(f"user-{i}@example.com", groups[i]) for i in range(args.users)]
+
+    results, slowest = [], {}
+    with tempfile.TemporaryDirectory() as directory:
+        stack = LocalStack(args, directory, issuer.write_jwks(os.path.join(directory, 'jwks.json'))).start()
+        try:
+            if args.no_seed:
+                variables = {'experiment_name': EXPERIMENT_NAME, 'model_name': MODEL_NAME}
+                import mlflow
+                mlflow.set_tracking_uri(stack.tracking_url)
+                experiment = mlflow.get_experiment_by_name(EXPERIMENT_NAME)
+                variables['experiment_id'] = experiment.experiment_id if experiment else '0'
+                variables['run_ids'] = [r.info.run_id for r in mlflow.MlflowClient().search_runs(
+                    [variables['experiment_id']], max_results=100)] or ['']
+            else:
+                variables = seed(stack.tracking_url, args.runs)
+            variables['username'] = 'notebook-user'
+            for concurrency in args.concurrency:
+                level_results, slowest[str(concurrency)] = run_level(stack.api_url, traces, variables, tokens,
+                                                                     concurrency, args)
+                for result in level_results:
+                    print_result(result)
+                results.extend(level_results)
+        finally:
+            stack.stop()
+
+    report = {
+        'python': sys.version.split()[0],
+        'cpus': os.cpu_count(),
+        'stack': {'cache': args.cache, 'server_workers': args.server_workers, 'gateway_workers': args.gateway_workers,
+                  'provider_latency_ms': args.provider_latency_ms, 'authorizer_cache_ttl': args.authorizer_cache_ttl,
+                  'think_scale': args.think_scale, 'notebook_share': args.notebook_share, 'runs': args.runs},
+        'duration': args.duration,
+        'results': results,
+        'slowest_routes': slowest,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report))
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = regressions(results, json.load(f), args.tolerance)
+        for scenario, metric, before, after in worse:
+            print(f"REGRESSION {scenario} {metric}: {before} -> {after}")
+        sys.exit(1 if worse else 0)
@@ -0,0 +1,300 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Throughput benchmark of the MLflow deployments gateway, to size WORKERS and the desired count
+of the gateway service.
+
+The endpoints of src/mlflow-gateway/config.yaml are pointed at the local mock provider
+(src/mlflow-gateway/mock_provider.py) with the given latency profile, and for every worker count
+`mlflow deployments start-server` (or gateway.py with --layer) is started and driven by
+concurrent aiohttp clients for a fixed duration. The report has, per worker count and
+concurrency, the throughput, the latency percentiles, the errors, and the resident memory of
+the gunicorn arbiter and of each worker. With --layer, the MAX_CONCURRENCY and MAX_QUEUE of the
+environment cap the throughput, raise them to measure the overhead of the layer alone:
+
+    pip install mlflow[genai]==2.12.2 psutil
+    python bench/gateway_bench.py --workers 1 2 4 --concurrency 16 64 --json gateway.json
+    # ... change the gateway ...
+    python bench/gateway_bench.py --workers 1 2 4 --concurrency 16 64 --baseline gateway.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import aiohttp
+import psutil
+import yaml
+
+GATEWAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'mlflow-gateway')
+sys.path.insert(0, GATEWAY_DIR)
+
+import mock_provider  # noqa: E402
+
+# a notebook prompt, the size of the payload matters more than its content
+PROMPT = ("You are reviewing the training runs of a regression model. Summarize the metrics of "
+          "run {i} and suggest the next hyperparameters to try.")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def mock_config(config_path, mock_url):
+    """Returns the gateway config with every endpoint served by the mock provider."""
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    for endpoint in config['endpoints']:
+        endpoint['model'] = {
+            'provider': 'openai',
+            'name': endpoint['model']['name'],
+            'config': {'openai_api_key': 'mock', 'openai_api_base': mock_url},
+        }
+    return config
+
+
+def start_mock(args):
+    handler = mock_provider.MockProviderHandler
+    handler.latency_ms = args.latency_ms
+    handler.latency_profile = args.latency_profile
+    handler.latency_spread = args.latency_spread
+    handler.max_concurrency = args.provider_quota
+    server = mock_provider.MockProviderServer(('127.0.0.1', free_port()), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1", handler.stats
+
+
+def start_gateway(config_path, port, workers, layer):
+    if layer:
+        command = [sys.executable, os.path.join(GATEWAY_DIR, 'gateway.py')]
+    else:
+        command = [sys.executable, '-m', 'mlflow', 'deployments', 'start-server']
+    command += ['--config-path', config_path, '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)]
+    gateway = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                break
+        except OSError:
+            time.sleep(0.5)
+    else:
+        gateway.kill()
+        raise Exception('the gateway did not start')
+    return gateway
+
+
+def gunicorn_processes(pid):
+    """Returns the gunicorn arbiter and its workers, `mlflow deployments start-server` runs gunicorn
+    as a child process."""
+    root = psutil.Process(pid)
+    processes = [root] + root.children(recursive=True)
+    arbiters = [p for p in processes if p.children() and 'gunicorn' in ' '.join(p.cmdline())]
+    arbiter = arbiters[0] if arbiters else root
+    return arbiter, arbiter.children()
+
+
+class MemorySampler(object):
+    """Samples the resident memory of the arbiter and of the workers while the load runs."""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_arbiter = 0
+        self.peak_workers = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                arbiter, workers = gunicorn_processes(self.pid)
+                self.peak_arbiter = max(self.peak_arbiter, arbiter.memory_info().rss)
+                for worker in workers:
+                    self.peak_workers[worker.pid] = max(self.peak_workers.get(worker.pid, 0), worker.memory_info().rss)
+            except psutil.Error:
+                pass
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self):
+        workers = [rss / 2 ** 20 for rss in self.peak_workers.values()]
+        return {
+            'arbiter_rss_mb': round(self.peak_arbiter / 2 ** 20, 1),
+            'worker_rss_mb': round(max(workers), 1) if workers else 0.0,
+            'total_rss_mb': round((self.peak_arbiter + sum(self.peak_workers.values())) / 2 ** 20, 1),
+        }
+
+
+async def drive(url, concurrency, duration, warmup, temperature):
+    """Closed loop load: every client sends its next request when the previous one returns."""
+    latencies, errors, statuses = [], 0, {}
+    counter = iter(range(10 ** 9))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        measure_from = started + warmup
+        deadline = measure_from + duration
+
+        async def client():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                payload = {'prompt': PROMPT.format(i=next(counter)), 'temperature': temperature, 'max_tokens': 256}
+                start = time.perf_counter()
+                try:
+                    async with session.post(url, json=payload) as response:
+                        await response.read()
+                        status = response.status
+                except aiohttp.ClientError:
+                    status = 'connection-error'
+                end = time.perf_counter()
+                if start < measure_from:
+                    continue
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 200:
+                    latencies.append((end - start) * 1000)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - measure_from
+    return latencies, errors, statuses, elapsed
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else 0.0
+
+
+def run_scenario(args, config_path, workers, concurrency, provider_stats):
+    port = free_port()
+    gateway = start_gateway(config_path, port, workers, args.layer)
+    try:
+        url = f"http://127.0.0.1:{port}/endpoints/{args.endpoint}/invocations"
+        provider_stats.reset()
+        cpu_before = sum(p.cpu_times().user + p.cpu_times().system
+                         for p in [psutil.Process(gateway.pid)] + psutil.Process(gateway.pid).children(recursive=True))
+        with MemorySampler(gateway.pid) as memory:
+            latencies, errors, statuses, elapsed = asyncio.run(
+                drive(url, concurrency, args.duration, args.warmup, args.temperature))
+        processes = [psutil.Process(gateway.pid)] + psutil.Process(gateway.pid).children(recursive=True)
+        cpu_seconds = sum(p.cpu_times().user + p.cpu_times().system for p in processes) - cpu_before
+    finally:
+        # mlflow deployments start-server does not stop its gunicorn workers when terminated
+        os.killpg(gateway.pid, signal.SIGTERM)
+        gateway.wait()
+    latencies.sort()
+    return {
+        'scenario': f"workers={workers},concurrency={concurrency}",
+        'workers': workers,
+        'concurrency': concurrency,
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'statuses': statuses,
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p90_ms': round(percentile(latencies, 90), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'cpu_seconds_per_1k_requests': round(cpu_seconds * 1000 / max(1, len(latencies) + errors), 3),
+        'provider_max_in_flight': provider_stats.max_in_flight,
+        'provider_throttled': provider_stats.throttled,
+        **memory.report(),
+    }
+
+
+def print_result(result):
+    print(f"{result['scenario']:<28} {result['throughput_rps']:8.1f} req/s p50={result['p50_ms']:8.1f}ms "
+          f"p99={result['p99_ms']:8.1f}ms errors={result['errors']:<5d} worker={result['worker_rss_mb']:6.1f}MB "
+          f"total={result['total_rss_mb']:7.1f}MB", flush=True)
+
+
+def regressions(results, baseline, tolerance):
+    """Returns the (scenario, metric, baseline, current) tuples that are worse than the baseline by
+    more than the tolerance."""
+    previous = {result['scenario']: result for result in baseline['results']}
+    worse = []
+    for result in results:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        if result['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            worse.append((result['scenario'], 'throughput_rps', before['throughput_rps'], result['throughput_rps']))
+        for metric in ('p50_ms', 'p99_ms', 'worker_rss_mb'):
+            if result[metric] > before[metric] * (1 + tolerance):
+                worse.append((result['scenario'], metric, before[metric], result[metric]))
+    return worse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config-path', type=str, default=os.path.join(GATEWAY_DIR, 'config.yaml'))
+    parser.add_argument('--endpoint', type=str, default='completions')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--duration', type=float, default=20, help='seconds of measured load per scenario')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of load before measuring')
+    parser.add_argument('--temperature', type=float, default=0.7)
+    parser.add_argument('--latency-ms', type=float, default=200, help='median latency of the mock provider')
+    parser.add_argument('--latency-profile', type=str, default='lognormal', choices=mock_provider.LATENCY_PROFILES)
+    parser.add_argument('--latency-spread', type=float, default=0.5)
+    parser.add_argument('--provider-quota', type=int, default=0, help='calls in flight the mock accepts, 0 for no quota')
+    parser.add_argument('--layer', action='store_true', help='start gateway.py instead of mlflow deployments start-server')
+    parser.add_argument('--json', type=str, help='write the report to this file')
+    parser.add_argument('--baseline', type=str, help='report of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed degradation against the baseline')
+    args = parser.parse_args()
+
+    mock_url, provider_stats = start_mock(args)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = os.path.join(directory, 'config.yaml')
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(mock_config(args.config_path, mock_url), f)
+        for workers in args.workers:
+            for concurrency in args.concurrency:
+                result = run_scenario(args, config_path, workers, concurrency, provider_stats)
+                print_result(result)
+                results.append(result)
+
+    report = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'server': 'gateway.py' if args.layer else 'mlflow deployments start-server',
+        'endpoint': args.endpoint,
+        'duration': args.duration,
+        'temperature': args.temperature,
+        'provider': {'latency_ms': args.latency_ms, 'latency_profile': args.latency_profile,
+                     'latency_spread': args.latency_spread, 'quota': args.provider_quota},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report))
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = regressions(results, json.load(f), args.tolerance)
+        for scenario, metric, before, after in worse:
+            print(f"REGRESSION {scenario} {metric}: {before} -> {after}")
+        sys.exit(1 if worse else 0)
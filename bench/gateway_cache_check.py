@@ -0,0 +1,151 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Checks the response cache, the coalescing and the endpoint limits of the gateway layer
+(src/mlflow-gateway/gateway.py) against the local mock provider in place of Bedrock.
+
+    pip install mlflow[genai]==2.12.2
+    python bench/gateway_cache_check.py
+"""
+
+import concurrent.futures
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+GATEWAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'mlflow-gateway')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise Exception(f"{url} did not start")
+
+
+def start_mock(port, latency_ms, max_concurrency):
+    sys.path.insert(0, GATEWAY_DIR)
+    import mock_provider
+    mock_provider.MockProviderHandler.latency_ms = latency_ms
+    mock_provider.MockProviderHandler.max_concurrency = max_concurrency
+    server = mock_provider.MockProviderServer(('127.0.0.1', port), mock_provider.MockProviderHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return mock_provider.MockProviderHandler.stats
+
+
+def start_gateway(directory, port, mock_port, env):
+    with open(os.path.join(GATEWAY_DIR, 'config.mock.yaml')) as f:
+        config = f.read().replace('localhost:8088', f"127.0.0.1:{mock_port}")
+    config_path = os.path.join(directory, 'config.yaml')
+    with open(config_path, 'w') as f:
+        f.write(config)
+    command = [sys.executable, os.path.join(GATEWAY_DIR, 'gateway.py'), '--config-path', config_path,
+               '--host', '127.0.0.1', '--port', str(port), '--workers', '1']
+    gateway = subprocess.Popen(command, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for(f"http://127.0.0.1:{port}/health")
+    return gateway
+
+
+def invoke(port, payload, endpoint='completions', headers=None):
+    """Returns (status, X-Cache header, body)."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    connection.request('POST', f"/endpoints/{endpoint}/invocations", body=json.dumps(payload),
+                       headers={'Content-Type': 'application/json', **(headers or {})})
+    response = connection.getresponse()
+    result = response.status, response.getheader('X-Cache'), json.loads(response.read())
+    connection.close()
+    return result
+
+
+def gateway_stats(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/gateway-stats") as response:
+        return json.load(response)
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def check_cache(port, mock_stats):
+    results = []
+    prompt = {'prompt': 'What is MLflow?', 'temperature': 0, 'max_tokens': 64}
+    first = invoke(port, prompt)
+    second = invoke(port, prompt)
+    results.append(check(first[1] == 'MISS' and second[1] == 'HIT' and first[2] == second[2],
+                         'an identical temperature 0 completion is served from the cache'))
+    results.append(check(invoke(port, {'prompt': 'What is MLflow?', 'max_tokens': 64})[1] == 'MISS',
+                         'a different payload is another entry'))
+    results.append(check(invoke(port, prompt, headers={'Cache-Control': 'no-cache'})[1] == 'MISS',
+                         'Cache-Control: no-cache skips the cache'))
+
+    before = mock_stats.requests
+    sampled = [invoke(port, {'prompt': 'Write a haiku', 'temperature': 0.7}) for _ in range(2)]
+    results.append(check(all(s[1] == 'BYPASS' for s in sampled) and mock_stats.requests - before == 2
+                         and sampled[0][2]['choices'] != sampled[1][2]['choices'],
+                         'temperature > 0 completions always reach the provider'))
+    embedding = {'input': ['the same sentence']}
+    results.append(check([invoke(port, embedding, 'embeddings')[1] for _ in range(2)] == ['MISS', 'HIT'],
+                         'embeddings are cached'))
+
+    before = mock_stats.requests
+    burst = {'prompt': 'Summarize the run', 'temperature': 0}
+    with concurrent.futures.ThreadPoolExecutor(16) as executor:
+        statuses = list(executor.map(lambda _: invoke(port, burst)[1], range(16)))
+    results.append(check(mock_stats.requests - before == 1 and statuses.count('MISS') == 1,
+                         f"16 concurrent identical prompts reach the provider once "
+                         f"({statuses.count('COALESCED')} coalesced, {statuses.count('HIT')} hits)"))
+    return all(results)
+
+
+def check_limits(port, mock_stats, concurrency, queue):
+    mock_stats.reset()
+    requests = concurrency + queue + 8
+    with concurrent.futures.ThreadPoolExecutor(requests) as executor:
+        responses = list(executor.map(lambda i: invoke(port, {'prompt': f"prompt {i}", 'temperature': 1}),
+                                      range(requests)))
+    statuses = [status for status, _, _ in responses]
+    endpoint = gateway_stats(port)['endpoints']['completions']
+    results = [
+        check(mock_stats.max_in_flight <= concurrency and mock_stats.throttled == 0,
+              f"at most {concurrency} calls in flight on the provider (saw {mock_stats.max_in_flight}), none throttled"),
+        check(statuses.count(200) >= concurrency + queue and 429 in statuses,
+              f"the requests over the queue are rejected with 429 ({statuses.count(200)} ok, "
+              f"{statuses.count(429)} rejected)"),
+        check(endpoint['rejected'] == statuses.count(429) and endpoint['max_queued'] <= queue,
+              f"the queue metrics match: {json.dumps(endpoint)}"),
+    ]
+    return all(results)
+
+
+if __name__ == '__main__':
+    concurrency, queue = 4, 8
+    with tempfile.TemporaryDirectory() as directory:
+        mock_port, port = free_port(), free_port()
+        mock_stats = start_mock(mock_port, latency_ms=200, max_concurrency=concurrency)
+        gateway = start_gateway(directory, port, mock_port, {
+            'MAX_CONCURRENCY': str(concurrency), 'MAX_QUEUE': str(queue), 'QUEUE_TIMEOUT': '30'})
+        try:
+            ok = check_cache(port, mock_stats)
+            ok = check_limits(port, mock_stats, concurrency, queue) and ok
+            print(json.dumps(gateway_stats(port)['cache']))
+        finally:
+            gateway.terminate()
+            gateway.wait()
+    sys.exit(0 if ok else 1)
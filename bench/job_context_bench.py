@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Compares the storage modes of the SageMaker job context (lab/source_dir/job_context.py) on a
+local sqlite tracking store: rows of the tags table, and latency of runs/search, for the same
+number of runs logged with each mode. Also checks that load_job_context rebuilds the context.
+
+    python bench/job_context_bench.py --runs 500
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lab', 'source_dir'))
+
+import mlflow
+from mlflow.tracking import MlflowClient
+
+from batch_logger import BatchLogger
+from job_context import STORAGE_MODES, load_job_context, log_job_context
+
+
+def training_env(i):
+    """Returns a SM_TRAINING_ENV like the one of a SageMaker scikit-learn training job."""
+    job_name = f"sagemaker-scikit-learn-2024-01-01-00-00-{i:06d}"
+    hyperparameters = {'n-estimators': 100, 'min-samples-leaf': 3, 'features': 'MedInc HouseAge AveRooms',
+                       'target': 'target'}
+    channels = {'train': '/opt/ml/input/data/train', 'test': '/opt/ml/input/data/test'}
+    return {
+        'additional_framework_parameters': {},
+        'channel_input_dirs': channels,
+        'current_host': 'algo-1',
+        'current_instance_group': 'homogeneousCluster',
+        'current_instance_group_hosts': ['algo-1'],
+        'current_instance_type': 'ml.c5.xlarge',
+        'distribution_hosts': [],
+        'distribution_instance_groups': [],
+        'framework_module': 'sagemaker_sklearn_container.training:main',
+        'hosts': ['algo-1'],
+        'hyperparameters': hyperparameters,
+        'input_config_dir': '/opt/ml/input/config',
+        'input_data_config': {name: {'TrainingInputMode': 'File', 'S3DistributionType': 'FullyReplicated',
+                                     'RecordWrapperType': 'None'} for name in channels},
+        'input_dir': '/opt/ml/input',
+        'instance_groups': ['homogeneousCluster'],
+        'instance_groups_dict': {'homogeneousCluster': {'instance_group_name': 'homogeneousCluster',
+                                                        'instance_type': 'ml.c5.xlarge', 'hosts': ['algo-1']}},
+        'is_hetero': False,
+        'is_master': True,
+        'is_modelparallel_enabled': None,
+        'is_smddpmprun_installed': False,
+        'job_name': job_name,
+        'log_level': 20,
+        'master_hostname': 'algo-1',
+        'model_dir': '/opt/ml/model',
+        'module_dir': f"s3://sagemaker-us-west-2-123456789012/{job_name}/source/sourcedir.tar.gz",
+        'module_name': 'train',
+        'network_interface_name': 'eth0',
+        'num_cpus': 4,
+        'num_gpus': 0,
+        'num_neurons': 0,
+        'output_data_dir': '/opt/ml/output/data',
+        'output_dir': '/opt/ml/output',
+        'output_intermediate_dir': '/opt/ml/output/intermediate',
+        'resource_config': {'current_host': 'algo-1', 'current_instance_type': 'ml.c5.xlarge',
+                            'current_group_name': 'homogeneousCluster', 'hosts': ['algo-1'],
+                            'network_interface_name': 'eth0'},
+        'user_entry_point': 'train.py',
+    }
+
+
+def log_runs(experiment_id, mode, runs):
+    client = MlflowClient()
+    for i in range(runs):
+        with mlflow.start_run(experiment_id=experiment_id) as run, BatchLogger(run.info.run_id, client) as batch_logger:
+            batch_logger.log_params({'n-estimators': 100, 'min-samples-leaf': 3})
+            batch_logger.log_metric('rmse', 0.5)
+            log_job_context(training_env(i), batch_logger, mode)
+    return run.info.run_id
+
+
+def search_latency(experiment_id, repeat):
+    """Returns the median latency in ms of a page of runs/search as the UI loads it, and of a
+    search filtered on a searchable tag."""
+    client = MlflowClient()
+    page, filtered = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        client.search_runs([experiment_id], max_results=100)
+        page.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        client.search_runs([experiment_id], "tags.job_name = 'sagemaker-scikit-learn-2024-01-01-00-00-000007'")
+        filtered.append((time.perf_counter() - start) * 1000)
+    return statistics.median(page), statistics.median(filtered)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = os.path.join(directory, 'mlflow.db')
+        mlflow.set_tracking_uri(f"sqlite:///{db}")
+        print(f"{'mode':<10} {'tag rows':>9} {'rows/run':>9} {'search page':>12} {'search tag':>11}")
+        for mode in STORAGE_MODES:
+            experiment_id = mlflow.create_experiment(mode, artifact_location=os.path.join(directory, mode))
+            last_run_id = log_runs(experiment_id, mode, args.runs)
+            with sqlite3.connect(db) as connection:
+                rows = connection.execute(
+                    'SELECT COUNT(*) FROM tags JOIN runs ON tags.run_uuid = runs.run_uuid WHERE runs.experiment_id = ?',
+                    (experiment_id,)).fetchone()[0]
+            page, filtered = search_latency(experiment_id, args.repeat)
+            print(f"{mode:<10} {rows:9d} {rows / args.runs:9.1f} {page:10.1f}ms {filtered:9.1f}ms")
+            if mode != 'tags':
+                assert load_job_context(last_run_id) == training_env(args.runs - 1), mode
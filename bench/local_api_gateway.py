@@ -0,0 +1,235 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Local stand-in for the REST API Gateway of cdk/lib/rest-api-gateway-stack.ts, used by
+bench/e2e_bench.py to measure the whole request path without deploying the stacks.
+
+The routes are the ones of the stack:
+
+* /api/2.0/endpoints/{proxy}, /endpoints/{proxy} -> the gateway (IAM)
+* /api/{proxy}                                   -> the tracking server (IAM)
+* /{proxy}                                       -> the tracking server (Lambda authorizer)
+
+The Lambda authorizer is the real cdk/lambda/authorizer/index.py handler, invoked in process as a
+REQUEST authorizer with the Authorization header as identity source. Its result is cached for
+--authorizer-cache-ttl seconds per Authorization header, and its policy is evaluated against the
+method ARN of every request the way API Gateway does. IAM routes are not signed locally, they are
+authorized without any cost.
+
+Every response has a Server-Timing header with the time spent in the authorizer, in API Gateway
+itself (routing, copying the request and the response) and in the integration, and an
+X-Authorizer-Cache header (HIT, MISS or NONE). With --record, the requests are appended to a
+trace file that bench/e2e_bench.py can replay.
+
+    python bench/local_api_gateway.py --port 8000 --keys-url file:///tmp/jwks.json \\
+        --tracking-url http://127.0.0.1:5000 --gateway-url http://127.0.0.1:5001
+"""
+
+import argparse
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src', 'mlflow-cache'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'tests'))
+
+from authorizer_fixtures import ACCOUNT, REST_API_ID, STAGE, load_authorizer, method_arn  # noqa: E402
+from policy_eval import is_allowed  # noqa: E402
+from proxy import Upstream  # noqa: E402
+
+# headers API Gateway does not forward, or sets itself
+HOP_BY_HOP = {'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer', 'upgrade', 'host', 'content-length'}
+
+
+def route(path):
+    """Returns (integration, authorization, integration path) of a request path."""
+    if path.startswith('/api/2.0/endpoints/') or path.startswith('/endpoints/'):
+        return 'gateway', 'IAM', path
+    if path.startswith('/api/'):
+        return 'tracking', 'IAM', path
+    return 'tracking', 'CUSTOM', path
+
+
+class AuthorizerCache(object):
+    """Results of the authorizer per identity source, like the authorizer cache of a stage."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, identity):
+        with self._lock:
+            entry = self._entries.get(identity)
+            if entry is None or time.monotonic() > entry[0]:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, identity, result):
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[identity] = (time.monotonic() + self.ttl, result)
+
+
+class Recorder(object):
+    """Appends the requests to a trace file, with the time elapsed since the previous request."""
+
+    def __init__(self, path):
+        self.path = path
+        self._last = None
+        self._lock = threading.Lock()
+
+    def record(self, method, path, body):
+        with self._lock:
+            now = time.monotonic()
+            think_ms = 0 if self._last is None else round((now - self._last) * 1000)
+            self._last = now
+            entry = {'method': method, 'path': path, 'think_ms': think_ms}
+            if body:
+                try:
+                    entry['body'] = json.loads(body)
+                except ValueError:
+                    entry['body_text'] = body.decode('utf-8', 'replace')
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+
+class ApiGatewayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are separate writes, without it every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    index = None
+    authorizer_cache = None
+    integrations = {}
+    recorder = None
+    authorizer_lock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload, timings, authorizer_cache='NONE', headers=()):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if not any(name.lower() == 'content-type' for name, _ in headers):
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Server-Timing', ', '.join(f"{name};dur={value:.3f}" for name, value in timings.items()))
+        self.send_header('X-Authorizer-Cache', authorizer_cache)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorize(self, verb, path, query):
+        """Returns (status or None when allowed, cache status)."""
+        identity = self.headers.get('Authorization')
+        if not identity:
+            return 401, 'NONE'
+        result = self.authorizer_cache.get(identity)
+        cache_status = 'HIT'
+        if result is None:
+            cache_status = 'MISS'
+            event = {
+                'type': 'REQUEST',
+                'methodArn': method_arn(verb, path),
+                'resource': '/{proxy+}',
+                'path': path,
+                'httpMethod': verb,
+                'headers': {'Authorization': identity},
+                'queryStringParameters': query,
+                'requestContext': {'accountId': ACCOUNT, 'apiId': REST_API_ID, 'stage': STAGE},
+            }
+            # a Lambda execution environment handles one invocation at a time
+            with self.authorizer_lock:
+                try:
+                    result = self.index.handler(event, None)
+                except Exception as e:
+                    result = str(e)
+            # a 401 is not cached
+            if isinstance(result, dict):
+                self.authorizer_cache.put(identity, result)
+        if result == 'Unauthorized':
+            return 401, cache_status
+        if not isinstance(result, dict):
+            # AuthorizerConfigurationException
+            return 500, cache_status
+        if not is_allowed(result['policyDocument'], method_arn(verb, path)):
+            return 403, cache_status
+        return None, cache_status
+
+    def _handle(self):
+        started = time.perf_counter()
+        timings = {'authorizer': 0.0, 'proxy': 0.0, 'upstream': 0.0}
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        url = urllib.parse.urlsplit(self.path)
+        integration, authorization, integration_path = route(url.path)
+        if self.recorder is not None:
+            self.recorder.record(self.command, self.path, body)
+
+        cache_status = 'NONE'
+        if authorization == 'CUSTOM':
+            authorizer_started = time.perf_counter()
+            status, cache_status = self._authorize(self.command, url.path, dict(urllib.parse.parse_qsl(url.query)))
+            timings['authorizer'] = (time.perf_counter() - authorizer_started) * 1000
+            if status is not None:
+                message = {401: 'Unauthorized', 403: 'User is not authorized to access this resource with an explicit deny',
+                           500: 'AuthorizerConfigurationException'}[status]
+                timings['proxy'] = (time.perf_counter() - started) * 1000 - timings['authorizer']
+                return self._reply(status, {'message': message}, timings, cache_status)
+
+        headers = {name: value for name, value in self.headers.items() if name.lower() not in HOP_BY_HOP}
+        target = integration_path + (f"?{url.query}" if url.query else '')
+        upstream_started = time.perf_counter()
+        try:
+            response = self.integrations[integration].request(self.command, target, body or None, headers)
+            payload = response.read()
+        except OSError:
+            timings['upstream'] = (time.perf_counter() - upstream_started) * 1000
+            timings['proxy'] = (time.perf_counter() - started) * 1000 - timings['authorizer'] - timings['upstream']
+            return self._reply(504, {'message': 'Endpoint request timed out'}, timings, cache_status)
+        timings['upstream'] = (time.perf_counter() - upstream_started) * 1000
+        response_headers = [(name, value) for name, value in response.getheaders() if name.lower() not in HOP_BY_HOP]
+        response_headers.append(('X-Integration', integration))
+        timings['proxy'] = (time.perf_counter() - started) * 1000 - timings['authorizer'] - timings['upstream']
+        self._reply(response.status, payload, timings, cache_status, response_headers)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
+
+
+class ApiGatewayServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--keys-url', type=str, required=True, help='JWKS URL of the local issuer')
+    parser.add_argument('--tracking-url', type=str, required=True, help='tracking server, or its caching proxy')
+    parser.add_argument('--gateway-url', type=str, required=True)
+    parser.add_argument('--authorizer-cache-ttl', type=float, default=300, help='resultsCacheTtl of the authorizer')
+    parser.add_argument('--lambda-concurrency', type=int, default=1,
+                        help='authorizer invocations in parallel, the handler runs in this process')
+    parser.add_argument('--record', type=str, help='append the requests to this trace file')
+    args = parser.parse_args()
+
+    # as configured by the stack
+    ApiGatewayHandler.index = load_authorizer(args.keys_url, AUTHORIZER_CACHE_TTL=args.authorizer_cache_ttl,
+                                              JWT_BACKEND='cryptography', AUTHORIZER_METRICS='false')
+    ApiGatewayHandler.authorizer_cache = AuthorizerCache(args.authorizer_cache_ttl)
+    ApiGatewayHandler.authorizer_lock = threading.BoundedSemaphore(args.lambda_concurrency)
+    ApiGatewayHandler.integrations = {'tracking': Upstream(args.tracking_url, 60), 'gateway': Upstream(args.gateway_url, 300)}
+    if args.record:
+        ApiGatewayHandler.recorder = Recorder(args.record)
+    print(f"API Gateway emulator on http://{args.host}:{args.port}", flush=True)
+    ApiGatewayServer((args.host, args.port), ApiGatewayHandler).serve_forever()
@@ -0,0 +1,146 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Evaluates authorizer policies the way API Gateway does, and checks the policies it caches.
+
+With resultsCacheTtl > 0, API Gateway keeps the policy returned for the first request of a token
+and evaluates it for every following request of the same token, whatever the route. For every
+group set and every first route, the policy returned by the handler is evaluated against all the
+other routes, and compared with the reference decisions of MLFLOW_ROUTES.
+
+    python bench/policy_eval.py
+"""
+
+import logging
+import os
+import re
+import sys
+from functools import lru_cache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from authorizer_fixtures import method_arn, request_event  # noqa: E402
+
+AJAX = '/ajax-api/2.0/mlflow'
+# groups allowed to call a route, besides the admins
+NONE = ()
+READ = ('readers', 'model-approvers')
+APPROVE = ('model-approvers',)
+
+# (verb, path, groups allowed) of the MLflow 2.12 REST API as called by the UI through the proxy resource
+MLFLOW_ROUTES = [
+    ('POST', f"{AJAX}/experiments/create", NONE),
+    ('POST', f"{AJAX}/experiments/search", READ),
+    ('GET', f"{AJAX}/experiments/get", READ),
+    ('GET', f"{AJAX}/experiments/get-by-name", READ),
+    ('POST', f"{AJAX}/experiments/delete", NONE),
+    ('POST', f"{AJAX}/experiments/restore", NONE),
+    ('POST', f"{AJAX}/experiments/update", NONE),
+    ('POST', f"{AJAX}/experiments/set-experiment-tag", NONE),
+    ('POST', f"{AJAX}/runs/create", NONE),
+    ('POST', f"{AJAX}/runs/update", NONE),
+    ('POST', f"{AJAX}/runs/delete", NONE),
+    ('POST', f"{AJAX}/runs/restore", NONE),
+    ('POST', f"{AJAX}/runs/log-metric", NONE),
+    ('POST', f"{AJAX}/runs/log-parameter", NONE),
+    ('POST', f"{AJAX}/runs/log-batch", NONE),
+    ('POST', f"{AJAX}/runs/log-model", NONE),
+    ('POST', f"{AJAX}/runs/log-inputs", NONE),
+    ('POST', f"{AJAX}/runs/set-tag", NONE),
+    ('POST', f"{AJAX}/runs/delete-tag", NONE),
+    ('GET', f"{AJAX}/runs/get", READ),
+    ('POST', f"{AJAX}/runs/search", READ),
+    ('GET', f"{AJAX}/metrics/get-history", READ),
+    ('GET', f"{AJAX}/metrics/get-history-bulk", READ),
+    ('GET', f"{AJAX}/metrics/get-history-bulk-interval", READ),
+    ('GET', f"{AJAX}/artifacts/list", READ),
+    ('POST', f"{AJAX}/registered-models/create", APPROVE),
+    ('PATCH', f"{AJAX}/registered-models/update", NONE),
+    ('POST', f"{AJAX}/registered-models/rename", APPROVE),
+    ('DELETE', f"{AJAX}/registered-models/delete", NONE),
+    ('GET', f"{AJAX}/registered-models/get", READ),
+    ('GET', f"{AJAX}/registered-models/search", READ),
+    ('POST', f"{AJAX}/registered-models/get-latest-versions", APPROVE),
+    ('POST', f"{AJAX}/registered-models/set-tag", APPROVE),
+    ('DELETE', f"{AJAX}/registered-models/delete-tag", NONE),
+    ('POST', f"{AJAX}/registered-models/alias", APPROVE),
+    ('DELETE', f"{AJAX}/registered-models/alias", NONE),
+    ('POST', f"{AJAX}/model-versions/create", APPROVE),
+    ('PATCH', f"{AJAX}/model-versions/update", APPROVE),
+    ('DELETE', f"{AJAX}/model-versions/delete", APPROVE),
+    ('GET', f"{AJAX}/model-versions/get", READ),
+    ('GET', f"{AJAX}/model-versions/search", READ),
+    ('GET', f"{AJAX}/model-versions/get-download-uri", READ),
+    ('POST', f"{AJAX}/model-versions/transition-stage", APPROVE),
+    ('POST', f"{AJAX}/model-versions/set-tag", APPROVE),
+    ('DELETE', f"{AJAX}/model-versions/delete-tag", APPROVE),
+    ('GET', '/get-artifact', READ),
+    ('GET', '/model-versions/get-artifact', READ),
+    ('GET', '/graphql', NONE),
+    ('POST', '/graphql', NONE),
+    ('PUT', '/ajax-api/2.0/mlflow-artifacts/artifacts/model/model.pkl', NONE),
+    ('HEAD', '/get-artifact', NONE),
+    ('OPTIONS', f"{AJAX}/runs/search", NONE),
+]
+
+GROUPS = [['admins'], ['readers'], ['model-approvers'], ['readers', 'model-approvers'], ['admins', 'readers'],
+          ['readers', 'unknown-group'], ['unknown-group']]
+
+
+@lru_cache(maxsize=None)
+def _arn_pattern(resource):
+    # in execute-api ARNs '*' matches any sequence of characters (including '/') and '?' one character
+    return re.compile('^' + re.escape(resource).replace(r'\*', '.*').replace(r'\?', '.') + '$')
+
+
+def _matches(statement, arn):
+    resources = statement['Resource']
+    if isinstance(resources, str):
+        resources = [resources]
+    return any(_arn_pattern(resource).match(arn) for resource in resources)
+
+
+def is_allowed(policy_document, arn):
+    """An explicit Deny wins over any Allow, and anything not allowed is implicitly denied."""
+    statements = policy_document['Statement']
+    if any(s['Effect'] == 'Deny' and _matches(s, arn) for s in statements):
+        return False
+    return any(s['Effect'] == 'Allow' and _matches(s, arn) for s in statements)
+
+
+def expected_decision(groups, verb, path):
+    """Returns the reference decision of MLFLOW_ROUTES for a user of the groups."""
+    allowed = next(allowed for v, p, allowed in MLFLOW_ROUTES if (v, p) == (verb, path))
+    return 'admins' in groups or any(group in allowed for group in groups)
+
+
+def check_cached_policies(index, issuer):
+    """Returns the list of (groups, first verb, first path, verb, path, expected, cached) decisions
+    of a cached policy that differ from the reference decisions."""
+    mismatches = []
+    for groups in GROUPS:
+        token = issuer.sign('user@example.com', groups)
+        for first_verb, first_path, _ in MLFLOW_ROUTES:
+            # the policy is built for this request, not taken from the token cache of the container
+            index.token_cache.clear()
+            response = index.handler(request_event(token, first_verb, first_path), None)
+            for verb, path, _ in MLFLOW_ROUTES:
+                expected = expected_decision(groups, verb, path)
+                cached = bool(response) and is_allowed(response['policyDocument'], method_arn(verb, path))
+                if expected != cached:
+                    mismatches.append((groups, first_verb, first_path, verb, path, expected, cached))
+    return mismatches
+
+
+if __name__ == '__main__':
+    from authorizer_fixtures import LocalIssuer, load_authorizer
+
+    logging.disable(logging.INFO)
+    issuer = LocalIssuer()
+    # as configured by the stack
+    index = load_authorizer(issuer.write_jwks(), AUTHORIZER_CACHE_TTL=300, EXPERIMENT_AUTHZ='false',
+                            AUTHORIZER_METRICS='false')
+    mismatches = check_cached_policies(index, issuer)
+    for mismatch in mismatches[:20]:
+        print('MISMATCH groups={} cached for {} {}, then {} {} expected={} cached={}'.format(*mismatch))
+    print(f"{len(GROUPS) * len(MLFLOW_ROUTES) ** 2} decisions checked, {len(mismatches)} mismatches")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,258 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Experiment-scoped authorization for the Lambda Authorizer.
+
+The runs, model versions and artifacts referenced by a request are resolved to their
+experiment by querying the MLflow tracking server. An experiment tagged with EXPERIMENT_GROUPS_TAG
+(a comma separated list of Cognito groups) can only be accessed by users in one of those groups.
+Experiments without the tag are accessible to every user, according to the group policy.
+
+Only the query string is visible to a Lambda Authorizer, therefore only GET requests
+(runs/get, metrics/get-history*, artifacts/list, get-artifact, model-versions/get*,
+experiments/get-by-name, ...) are scoped to the experiment. The searches select their
+experiments in the request body and return the runs, params, metrics and tags of any
+experiment, so they are denied to the users that are not admins (deny_search). The lookups are
+kept in a bounded TTL cache, so that a warm authorizer adds only a few dictionary lookups to a
+request.
+
+The policies returned are request specific: the authorizer cache of the API Gateway must be
+disabled (resultsCacheTtl set to 0), otherwise the policy of the first request of a token is
+reused for the requests to the other experiments.
+"""
+
+import http.client
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+API_PREFIX = '/api/2.0/mlflow'
+MISSING = object()
+# routes selecting their experiments in the request body
+SEARCH_ROUTES = ('/runs/search', '/experiments/search')
+
+
+class TTLCache(object):
+    """Size bounded LRU cache whose entries expire ttl seconds after they are stored."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() > entry[0]:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class TrackingClient(object):
+    """Minimal client of the MLflow REST API, reusing one keep-alive connection per thread."""
+
+    def __init__(self, base_url, timeout=2):
+        url = urllib.parse.urlsplit(base_url)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self, fresh=False):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or fresh:
+            if connection is not None:
+                connection.close()
+            connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(self.netloc, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def get(self, endpoint, **params):
+        """Calls GET {API_PREFIX}/{endpoint} and returns the (status, decoded JSON body) tuple."""
+        path = f"{self.prefix}{API_PREFIX}/{endpoint}?{urllib.parse.urlencode(params)}"
+        for fresh in (False, True):
+            connection = self._connection(fresh)
+            try:
+                connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # the server closed an idle keep-alive connection, retry once on a new one
+                if fresh:
+                    raise
+        return response.status, json.loads(body or b'{}')
+
+
+class ExperimentAuthz(object):
+    """Resolves the resources referenced by a REQUEST event to their experiments and checks
+    that the experiments are shared with the groups of the user."""
+
+    def __init__(self, client, groups_tag, ttl=300, maxsize=4096, max_workers=8, deny_search=True):
+        self.client = client
+        self.groups_tag = groups_tag
+        self.deny_search = deny_search
+        # runs never move to another experiment, the TTL only bounds the life of deleted ones
+        self.run_cache = TTLCache(maxsize, ttl)
+        self.model_version_cache = TTLCache(maxsize, ttl)
+        self.experiment_cache = TTLCache(maxsize, ttl)
+        self.experiment_name_cache = TTLCache(maxsize, ttl)
+        self.max_workers = max_workers
+        self._executor = None
+
+    def _lookup(self, endpoint, **params):
+        status, body = self.client.get(endpoint, **params)
+        if status == 200:
+            return body
+        if body.get('error_code') in ('RESOURCE_DOES_NOT_EXIST', 'INVALID_PARAMETER_VALUE'):
+            return None
+        raise Exception(f"MLflow lookup {endpoint} failed with status {status}")
+
+    def _fetch_run_experiment(self, run_id):
+        body = self._lookup('runs/get', run_id=run_id)
+        return body['run']['info']['experiment_id'] if body else None
+
+    def run_experiments(self, run_ids):
+        """Returns a dict run_id -> experiment_id (None for unknown runs). The runs that are not
+        cached are fetched concurrently."""
+        result = {}
+        missing = []
+        for run_id in set(run_ids):
+            experiment_id = self.run_cache.get(run_id)
+            if experiment_id is MISSING:
+                missing.append(run_id)
+            else:
+                result[run_id] = experiment_id
+        if len(missing) == 1:
+            fetched = [self._fetch_run_experiment(missing[0])]
+        elif missing:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            fetched = list(self._executor.map(self._fetch_run_experiment, missing))
+        else:
+            fetched = []
+        for run_id, experiment_id in zip(missing, fetched):
+            self.run_cache.put(run_id, experiment_id)
+            result[run_id] = experiment_id
+        return result
+
+    def model_version_run(self, name, version):
+        """Returns the run_id the model version was created from, or None."""
+        key = (name, version)
+        run_id = self.model_version_cache.get(key)
+        if run_id is MISSING:
+            body = self._lookup('model-versions/get', name=name, version=version)
+            run_id = body['model_version'].get('run_id') if body else None
+            run_id = run_id or None
+            self.model_version_cache.put(key, run_id)
+        return run_id
+
+    def _shared_groups(self, experiment):
+        tags = {tag['key']: tag['value'] for tag in experiment.get('tags', [])}
+        value = tags.get(self.groups_tag)
+        return frozenset(group.strip() for group in value.split(',')) if value is not None else None
+
+    def experiment_groups(self, experiment_id):
+        """Returns the groups the experiment is shared with, or None if it is shared with everybody."""
+        groups = self.experiment_cache.get(experiment_id)
+        if groups is MISSING:
+            body = self._lookup('experiments/get', experiment_id=experiment_id)
+            groups = self._shared_groups(body['experiment']) if body else None
+            self.experiment_cache.put(experiment_id, groups)
+        return groups
+
+    def experiment_id_by_name(self, name):
+        """Returns the id of the experiment with the name, or None."""
+        experiment_id = self.experiment_name_cache.get(name)
+        if experiment_id is MISSING:
+            body = self._lookup('experiments/get-by-name', experiment_name=name)
+            experiment_id = body['experiment']['experiment_id'] if body else None
+            if body:
+                self.experiment_cache.put(experiment_id, self._shared_groups(body['experiment']))
+            self.experiment_name_cache.put(name, experiment_id)
+        return experiment_id
+
+    def referenced_experiments(self, event):
+        """Returns the ids of the experiments the resources in the request query string belong to."""
+        query = dict(event.get('multiValueQueryStringParameters') or {})
+        for key, value in (event.get('queryStringParameters') or {}).items():
+            query.setdefault(key, [value])
+        experiment_ids = set(query.get('experiment_id', []))
+        for name in query.get('experiment_name', []):
+            experiment_id = self.experiment_id_by_name(name)
+            if experiment_id is not None:
+                experiment_ids.add(experiment_id)
+        run_ids = query.get('run_id', []) + query.get('run_uuid', []) + query.get('run_ids', [])
+        if 'model-versions/' in event.get('path', '') and 'name' in query and 'version' in query:
+            run_id = self.model_version_run(query['name'][0], query['version'][0])
+            if run_id is not None:
+                run_ids.append(run_id)
+        if run_ids:
+            experiment_ids.update(e for e in self.run_experiments(run_ids).values() if e is not None)
+        return experiment_ids
+
+    def denied_experiment(self, event, groups):
+        """Returns the first referenced experiment the user may not access, or None."""
+        groups = set(groups)
+        for experiment_id in sorted(self.referenced_experiments(event)):
+            allowed_groups = self.experiment_groups(experiment_id)
+            if allowed_groups is not None and not allowed_groups & groups:
+                return experiment_id
+        return None
+
+    def is_search(self, event):
+        return event.get('path', '').rstrip('/').endswith(SEARCH_ROUTES)
+
+    def authorize(self, event, groups, authResponse):
+        """Returns the group policy, with an explicit Deny of the invoked method if the request
+        references an experiment that is not shared with the user, or is a search. Lookup errors
+        deny the request."""
+        if event.get('type') != 'REQUEST' or 'admins' in groups:
+            return authResponse
+        if self.deny_search and self.is_search(event):
+            logging.info('Searches are not scoped to the experiments shared with the user')
+            return self._deny(event, authResponse)
+        try:
+            experiment_id = self.denied_experiment(event, groups)
+        except Exception as e:
+            logging.warning(f"Could not resolve the experiment of the request: {e}")
+            experiment_id = 'unknown'
+        if experiment_id is None:
+            return authResponse
+        logging.info(f"Experiment {experiment_id} is not shared with the groups of the user")
+        return self._deny(event, authResponse)
+
+    def _deny(self, event, authResponse):
+        policyDocument = dict(authResponse['policyDocument'])
+        policyDocument['Statement'] = policyDocument['Statement'] + [{
+            'Action': 'execute-api:Invoke',
+            'Effect': 'Deny',
+            'Resource': [event['methodArn']]
+        }]
+        return dict(authResponse, policyDocument=policyDocument)
@@ -10,14 +10,17 @@
 # License for the specific language governing permissions and limitations under the License.
 from __future__ import print_function
 
+import base64
 import json
 import time
 import os
-import urllib.request
-from jose import jwk, jwt
-from jose.utils import base64url_decode
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 import re
 import logging
+# the libraries verifying the signatures are imported on first use, see construct_key()
 
 logging.basicConfig(level=logging.INFO) # change me to DEBUG and redeploy if needed
 
@@ -26,54 +29,351 @@ APP_CLIENT_ID = os.environ['APP_CLIENT_ID']
 KEYS_URL = os.environ['COGNITO_KEYS_URL']
 BEARER_PREFIX = 'Bearer '
 AJAX_API_PREFIX = '/ajax-api/2.0/mlflow'
+# maximum number of verified tokens kept in memory by a warm Lambda container
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '1024'))
+# an unknown kid triggers a refetch of the public keys at most once every JWKS_MIN_REFRESH_INTERVAL seconds
+JWKS_MIN_REFRESH_INTERVAL = float(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', '30'))
+# public keys older than JWKS_MAX_AGE seconds are refreshed in the background
+JWKS_MAX_AGE = float(os.environ.get('JWKS_MAX_AGE', '3600'))
+JWKS_FETCH_TIMEOUT = float(os.environ.get('JWKS_FETCH_TIMEOUT', '5'))
+# resultsCacheTtl of the API Gateway authorizer, in seconds, as configured by the stack
+AUTHORIZER_CACHE_TTL = float(os.environ.get('AUTHORIZER_CACHE_TTL', '0'))
+# when enabled, the runs, model versions and artifacts referenced by a request are resolved to their
+# experiment through the tracking server, and denied if the experiment is not shared with the user groups
+EXPERIMENT_AUTHZ = os.environ.get('EXPERIMENT_AUTHZ', 'false').lower() == 'true'
+EXPERIMENT_GROUPS_TAG = os.environ.get('EXPERIMENT_GROUPS_TAG', 'mlflow.authorizer.groups')
+# the searches (runs/search, experiments/search) select their experiments in the request body, which the
+# authorizer cannot see: they are denied to the users that are not admins unless this is set to false
+EXPERIMENT_AUTHZ_DENY_SEARCH = os.environ.get('EXPERIMENT_AUTHZ_DENY_SEARCH', 'true').lower() == 'true'
+# a snapshot of the JWKS (the JSON document itself, or a file bundled with the function) lets the
+# cold start skip the network call. The JWKS is then refreshed in the background
+JWKS_SNAPSHOT = os.environ.get('JWKS_SNAPSHOT')
+JWKS_SNAPSHOT_PATH = os.environ.get('JWKS_SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jwks.json'))
+# library verifying the token signatures: 'jose' (python-jose) or 'cryptography' (RSA keys of the
+# cryptography package, used directly)
+JWT_BACKEND = os.environ.get('JWT_BACKEND', 'jose')
+# emit the phase timings, the cache hits and the deny reason of every invocation as
+# CloudWatch Embedded Metric Format log lines
+AUTHORIZER_METRICS = os.environ.get('AUTHORIZER_METRICS', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'MLflowAuthorizer')
+# warm the handler during the init phase, always done for provisioned concurrency environments
+WARM_ON_INIT = (os.environ.get('WARM_ON_INIT', 'false').lower() == 'true' or
+                os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency')
+
+class TokenCache(object):
+    """LRU cache of tokens that already passed verification, so that the RSA signature check
+    is paid only once per token in a warm container. Entries are keyed by a digest of the token
+    (the raw token is never kept as a key) and expire together with the token ('exp' claim)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token, scope=''):
+        """Returns the cache key for a token. The scope is used to separate policies built for
+        different API Gateway stages with the same token."""
+        return hashlib.sha256(f"{scope}|{token}".encode('utf-8')).digest()
+
+    def get(self, key):
+        """Returns the (claims, policy) tuple cached for the key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            exp, claims, policy = entry
+            if time.time() > exp:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims, policy
+
+    def put(self, key, claims, policy):
+        """Stores the verified claims and the policy built for them until the token expires."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (claims['exp'], claims, policy)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+class CryptographyRSAKey(object):
+    """RS256 public key of a JWK, verified with the cryptography package directly."""
+
+    def __init__(self, key):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+        from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicNumbers
+        if key.get('kty') != 'RSA' or key.get('alg', 'RS256') != 'RS256':
+            raise ValueError(f"Unsupported key type {key.get('kty')} {key.get('alg')}")
+        n = int.from_bytes(base64url_decode(key['n']), 'big')
+        e = int.from_bytes(base64url_decode(key['e']), 'big')
+        self.public_key = RSAPublicNumbers(e, n).public_key()
+        self._invalid_signature = InvalidSignature
+        self._padding = padding.PKCS1v15()
+        self._hash = hashes.SHA256()
+
+    def verify(self, message, signature):
+        try:
+            self.public_key.verify(signature, message, self._padding, self._hash)
+            return True
+        except self._invalid_signature:
+            return False
+
+def construct_key(key, backend=None):
+    """Constructs the public key object of a JWK with the configured backend."""
+    backend = backend or JWT_BACKEND
+    if backend == 'cryptography':
+        return CryptographyRSAKey(key)
+    if backend == 'jose':
+        from jose import jwk
+        return jwk.construct(key)
+    raise ValueError(f"Unknown JWT_BACKEND {backend}")
+
+def base64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+def decode_segment(segment):
+    """Decodes a JSON segment (header or claims) of a JWT without verifying it."""
+    return json.loads(base64url_decode(segment))
+
+class JwksKeyStore(object):
+    """Index of the Cognito User Pool public keys, constructed on first use and looked up by kid.
+    When Cognito rotates its keys, a token signed with an unknown kid triggers a refetch of
+    the JWKS. Concurrent refetches are collapsed into one and rate limited, and the last
+    good key set is kept if the refetch fails."""
+
+    def __init__(self, url, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL, max_age=JWKS_MAX_AGE,
+                 timeout=JWKS_FETCH_TIMEOUT):
+        self.url = url
+        self.min_refresh_interval = min_refresh_interval
+        self.max_age = max_age
+        self.timeout = timeout
+        self.fetched_at = 0
+        self.fetch_count = 0
+        self._jwks = {}
+        self._keys = {}
+        self._last_attempt = 0
+        self._lock = threading.Lock()
+        self._background = None
+
+    def _fetch(self):
+        import urllib.request
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as f:
+            response = f.read()
+        return json.loads(response.decode('utf-8'))['keys']
+
+    def load(self, keys, fetched_at=None):
+        """Replaces the key index with the given list of JWKs."""
+        self._jwks = {key['kid']: key for key in keys}
+        self._keys = {}
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def load_snapshot(self, snapshot=JWKS_SNAPSHOT, path=JWKS_SNAPSHOT_PATH):
+        """Loads the keys from a JWKS snapshot, if any. Returns True if a snapshot was loaded."""
+        if snapshot is None and path and os.path.exists(path):
+            with open(path) as f:
+                snapshot = f.read()
+        if not snapshot:
+            return False
+        # the snapshot can be stale, it is refreshed as soon as possible
+        self.load(json.loads(snapshot)['keys'], fetched_at=0)
+        return True
+
+    def construct_all(self):
+        """Constructs the public keys of all the known kids."""
+        for kid in list(self._jwks):
+            self.get(kid)
+
+    def refresh(self, force=False):
+        """Refetches the JWKS. Returns True if the key index was updated."""
+        started = time.time()
+        with self._lock:
+            # another caller refreshed the keys while we were waiting for the lock
+            if self.fetched_at >= started:
+                return True
+            if not force and self._jwks and started - self._last_attempt < self.min_refresh_interval:
+                logging.debug('JWKS refresh skipped, rate limited')
+                return False
+            self._last_attempt = started
+            self.fetch_count += 1
+            try:
+                self.load(self._fetch())
+            except Exception as e:
+                logging.warning(f"Could not refresh JWKS, keeping {len(self._jwks)} known keys: {e}")
+                return False
+            return True
+
+    def _refresh_in_background(self):
+        if self._background is not None and self._background.is_alive():
+            return
+        self._background = threading.Thread(target=self.refresh, daemon=True)
+        self._background.start()
+
+    def get(self, kid):
+        """Returns the constructed public key for the kid, or None if it is unknown."""
+        key = self._keys.get(kid)
+        if key is not None:
+            if time.time() - self.fetched_at > self.max_age:
+                self._refresh_in_background()
+            return key
+        if kid not in self._jwks and not self.refresh():
+            return None
+        jwks, keys = self._jwks, self._keys
+        if kid not in jwks:
+            return None
+        key = keys[kid] = construct_key(jwks[kid])
+        return key
+
 # instead of re-downloading the public keys every time
-# we download them only on cold start
+# we download them only on cold start, and again only when Cognito rotates them
 # https://aws.amazon.com/blogs/compute/container-reuse-in-lambda/
-with urllib.request.urlopen(KEYS_URL) as f:
-  response = f.read()
-keys = json.loads(response.decode('utf-8'))['keys']
-
-def verify_token(token):
-    # get the kid from the headers prior to verification
-    headers = jwt.get_unverified_headers(token)
-    kid = headers['kid']
+key_store = JwksKeyStore(KEYS_URL)
+# a snapshot is refreshed in the background by the first request using it
+if not key_store.load_snapshot():
+    key_store.refresh(force=True)
+
+experiment_authz = None
+if EXPERIMENT_AUTHZ:
+    # a cached policy would be reused for the requests to the other experiments: fail closed
+    if AUTHORIZER_CACHE_TTL > 0:
+        raise Exception('EXPERIMENT_AUTHZ returns request specific policies, it cannot be enabled with '
+                        f"AUTHORIZER_CACHE_TTL={AUTHORIZER_CACHE_TTL:g}. Disable the API Gateway authorizer cache "
+                        '(resultsCacheTtl 0) and set AUTHORIZER_CACHE_TTL=0')
+    from experiment_authz import ExperimentAuthz, TrackingClient
+    experiment_authz = ExperimentAuthz(
+        TrackingClient(os.environ['MLFLOW_TRACKING_INTERNAL_URI']),
+        EXPERIMENT_GROUPS_TAG,
+        ttl=float(os.environ.get('EXPERIMENT_AUTHZ_CACHE_TTL', '300')),
+        maxsize=int(os.environ.get('EXPERIMENT_AUTHZ_CACHE_SIZE', '4096')),
+        deny_search=EXPERIMENT_AUTHZ_DENY_SEARCH
+    )
+
+class InvocationMetrics(object):
+    """Phase timings and counters of one invocation, emitted as a single CloudWatch Embedded
+    Metric Format line. Timing a phase costs two perf_counter calls, so it is always on."""
+
+    UNITS = {'Milliseconds': ('Decode', 'KeyLookup', 'SignatureVerification', 'Claims', 'PolicyBuild',
+                              'ExperimentAuthz', 'Total'),
+             'Count': ('TokenCacheHit', 'TokenCacheMiss', 'Denied')}
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.values = {'TokenCacheHit': 0, 'TokenCacheMiss': 0, 'Denied': 0}
+        self.deny_reason = None
+
+    def lap(self, phase, since):
+        """Records the time elapsed since the given perf_counter value and returns the current one."""
+        now = time.perf_counter()
+        self.values[phase] = self.values.get(phase, 0) + (now - since) * 1000
+        return now
+
+    def count(self, name):
+        self.values[name] += 1
+
+    def deny(self, reason):
+        logging.info(reason)
+        self.values['Denied'] = 1
+        self.deny_reason = reason
+
+    def serialize(self):
+        """Serializes the EMF document of the invocation. The metric declarations are the same
+        for every invocation, and are serialized only once."""
+        self.values['Total'] = (time.perf_counter() - self.started) * 1000
+        values = ''.join(f',"{name}":{value}' for name, value in self.values.items())
+        if self.deny_reason is not None:
+            values += f',"DenyReason":{json.dumps(self.deny_reason)}'
+        return f'{{"_aws":{{"Timestamp":{int(time.time() * 1000)},"CloudWatchMetrics":{EMF_DECLARATIONS}}},"Service":"mlflow-authorizer"{values}}}'
+
+    def emit(self):
+        # EMF lines must be printed as they are, without the logging prefix
+        print(self.serialize())
+
+# metrics declared but missing from a document (e.g., a phase that did not run) are skipped by CloudWatch
+EMF_DECLARATIONS = json.dumps([{
+    'Namespace': METRICS_NAMESPACE,
+    'Dimensions': [['Service']],
+    'Metrics': [{'Name': name, 'Unit': unit} for unit, names in InvocationMetrics.UNITS.items() for name in names]
+}], separators=(',', ':'))
+
+def verify_token(token, metrics=None):
+    metrics = metrics or InvocationMetrics()
+    started = time.perf_counter()
+    try:
+        encoded_headers, encoded_claims, encoded_signature = str(token).split('.')
+        # get the kid from the headers prior to verification
+        kid = decode_segment(encoded_headers)['kid']
+        # decode the signature
+        decoded_signature = base64url_decode(encoded_signature)
+    except (ValueError, KeyError, TypeError):
+        metrics.deny('Malformed token')
+        return None
+    started = metrics.lap('Decode', started)
     # search for the kid in the downloaded public keys
-    key_index = -1
-    for i in range(len(keys)):
-        if kid == keys[i]['kid']:
-            key_index = i
-            break
-    if key_index == -1:
-        logging.info('Public key not found in jwks.json')
-        return False
-    # construct the public key
-    public_key = jwk.construct(keys[key_index])
+    public_key = key_store.get(kid)
+    started = metrics.lap('KeyLookup', started)
+    if public_key is None:
+        metrics.deny('Public key not found in jwks.json')
+        return None
     # get the last two sections of the token,
     # message and signature (encoded in base64)
-    message, encoded_signature = str(token).rsplit('.', 1)
-    # decode the signature
-    decoded_signature = base64url_decode(encoded_signature.encode('utf-8'))
+    message = f"{encoded_headers}.{encoded_claims}"
     # verify the signature
-    if not public_key.verify(message.encode("utf8"), decoded_signature):
-        logging.info('Signature verification failed')
-        return False
+    verified = public_key.verify(message.encode("utf8"), decoded_signature)
+    started = metrics.lap('SignatureVerification', started)
+    if not verified:
+        metrics.deny('Signature verification failed')
+        return None
 
     # since we passed the verification, we can now safely
     # use the unverified claims
-    claims = jwt.get_unverified_claims(token)
+    claims = decode_segment(encoded_claims)
+    metrics.lap('Claims', started)
     # additionally we can verify the token expiration
     if time.time() > claims['exp']:
-        logging.info('Token is expired')
-        return False
+        metrics.deny('Token is expired')
+        return None
     # and the Audience  (use claims['client_id'] if verifying an access token)
     if claims['aud'] != APP_CLIENT_ID:
-        logging.info('Token was not issued for this audience')
-        return False
+        metrics.deny('Token was not issued for this audience')
+        return None
     # now we can use the claims: DO NOT PRINT FOR PRODUCTION
     # print(claims)
-    return True
+    return claims
 
 def handler(event, context):
+    metrics = InvocationMetrics()
+    try:
+        return authorize(event, metrics)
+    finally:
+        if AUTHORIZER_METRICS:
+            metrics.emit()
+
+def authorize(event, metrics):
     # the event contains sensitive information. Should not be logged
     # print(event)
     request_type = event['type']
@@ -88,66 +388,67 @@ def handler(event, context):
     if token.startswith(BEARER_PREFIX):
         token = token[len(BEARER_PREFIX):]
 
-    if not verify_token(token):
-        raise Exception('Unauthorized')
-    
-    claims = jwt.get_unverified_claims(token)
-    principalId=claims['cognito:username']
-
     tmp = event['methodArn'].split(':')
     apiGatewayArnTmp = tmp[5].split('/')
     awsAccountId = tmp[4]
 
-    policy = AuthPolicy(principalId, awsAccountId)
-    policy.restApiId = apiGatewayArnTmp[0]
-    policy.region = tmp[3]
-    policy.stage = apiGatewayArnTmp[1]
-    
-    groups = claims['cognito:groups']
-    logging.debug(f"cognito group extracted: {groups}")
-    # Add your custom logic here
-    # For example, you could depict a strategy based on experiment. However,
-    # to verify if an individual run, or a model-version, or an artifact belongs to a run,
-    # you must query the MLFlow api again to cross check, and only then authorize or not the
-    # request.
-    if 'admins' in groups:
-        policy.allowAllMethods()
-    elif 'readers' in groups:
-        policy.allowMethod(HttpVerb.POST, f"{AJAX_API_PREFIX}/runs/search")
-        policy.allowMethod(HttpVerb.POST, f"{AJAX_API_PREFIX}/experiments/search")
-        policy.allowMethod(HttpVerb.GET, f"{AJAX_API_PREFIX}/*")
-        policy.allowMethod(HttpVerb.GET, f"/get-artifact")
-        policy.allowMethod(HttpVerb.GET, f"/model-versions/*")
-    elif 'model-approvers' in groups:
-        # user cannot do anything
-        policy.allowMethod(HttpVerb.POST, f"{AJAX_API_PREFIX}/runs/search")
-        policy.allowMethod(HttpVerb.POST, f"{AJAX_API_PREFIX}/experiments/search")
-        policy.allowMethod(HttpVerb.POST, f"{AJAX_API_PREFIX}/registered-models/*")
-        policy.allowMethod(HttpVerb.ALL, f"{AJAX_API_PREFIX}/model-versions/*")
-        policy.allowMethod(HttpVerb.GET, f"{AJAX_API_PREFIX}/*")
-        policy.allowMethod(HttpVerb.GET, f"/get-artifact")
-        policy.allowMethod(HttpVerb.GET, f"/model-versions/*")
+    # the group policy does not depend on the invoked method, only on the token and the API stage,
+    # so a token seen before by this container can skip verification and policy building
+    cache_key = TokenCache.key(token, f"{tmp[3]}:{awsAccountId}:{apiGatewayArnTmp[0]}/{apiGatewayArnTmp[1]}")
+    cached = token_cache.get(cache_key)
+    if cached is not None:
+        metrics.count('TokenCacheHit')
+        claims, authResponse = cached
     else:
-        logging.info('Unknown user group')
-        return False
+        metrics.count('TokenCacheMiss')
+        claims = verify_token(token, metrics)
+        if not claims:
+            raise Exception('Unauthorized')
+
+        started = time.perf_counter()
+        authResponse = build_group_policy(claims, tmp[3], awsAccountId, apiGatewayArnTmp[0], apiGatewayArnTmp[1])
+        metrics.lap('PolicyBuild', started)
+        if authResponse is None:
+            metrics.deny('Unknown user group')
+            return False
+        token_cache.put(cache_key, claims, authResponse)
+
+    # to verify if an individual run, or a model-version, or an artifact belongs to an experiment
+    # the user may access, we query the MLFlow api again to cross check
+    if experiment_authz is not None:
+        started = time.perf_counter()
+        groupResponse = authResponse
+        authResponse = experiment_authz.authorize(event, claims.get('cognito:groups', []), groupResponse)
+        metrics.lap('ExperimentAuthz', started)
+        if authResponse is not groupResponse:
+            searching = experiment_authz.deny_search and experiment_authz.is_search(event)
+            metrics.deny('Search not scoped to experiments' if searching else 'Experiment not shared with the user groups')
+
+    # Check policy generated for this request
+    logging.debug(f"policy built for this request: {authResponse}")
+    return authResponse
+
+def build_group_policy(claims, region, awsAccountId, restApiId, stage):
+    """Returns the authorizer response granting the permissions of the groups in the claims,
+    or None if the user does not belong to any known group."""
+    principalId=claims['cognito:username']
+
+    groups = claims.get('cognito:groups', [])
+    logging.debug(f"cognito group extracted: {groups}")
+    # Add your custom logic here, or change the permissions of each group in ROLE_RULES
+    authResponse = build_policy(principalId, groups, region, awsAccountId, restApiId, stage)
+    if authResponse is None:
+        return None
 
-    # Finally, build the policy
-    authResponse = policy.build()
- 
     # new! -- add additional key-value pairs associated with the authenticated principal
     # these are made available by APIGW like so: $context.authorizer.<key>
     # additional context is cached
-    # context = {
-    #     'key': 'value', # $context.authorizer.key -> value
-    #     'number' : 1,
-    #     'bool' : True
-    # }
     # context['arr'] = ['foo'] <- this is invalid, APIGW will not accept it
     # context['obj'] = {'foo':'bar'} <- also invalid
-    #authResponse['context'] = context
-
-    # Check policy generated for this request
-    logging.debug(f"policy built for this request: {authResponse}")
+    authResponse['context'] = {
+        'username': principalId, # $context.authorizer.username
+        'groups': ','.join(sorted(group for group in groups if group in ROLE_RULES))
+    }
     return authResponse
 
 class HttpVerb:
@@ -169,6 +470,7 @@ class AuthPolicy(object):
     """The policy version used for the evaluation. This should always be '2012-10-17'"""
     pathRegex = "^[/.a-zA-Z0-9-\*]+$"
     """The regular expression used to validate resource paths for the policy"""
+    pathPattern = re.compile(pathRegex)
 
     """these are the internal lists of allowed and denied methods. These are lists
     of objects and each object has 2 properties: A resource ARN and a nullable
@@ -206,20 +508,13 @@ class AuthPolicy(object):
         statement can be null."""
         if verb != "*" and not hasattr(HttpVerb, verb):
             raise NameError("Invalid HTTP verb " + verb + ". Allowed verbs in HttpVerb class")
-        resourcePattern = re.compile(self.pathRegex)
-        if not resourcePattern.match(resource):
+        if not self.pathPattern.match(resource):
             raise NameError("Invalid resource path: " + resource + ". Path should match " + self.pathRegex)
 
         if resource[:1] == "/":
             resource = resource[1:]
 
-        resourceArn = ("arn:aws:execute-api:" +
-            self.region + ":" +
-            self.awsAccountId + ":" +
-            self.restApiId + "/" +
-            self.stage + "/" +
-            verb + "/" +
-            resource)
+        resourceArn = f"arn:aws:execute-api:{self.region}:{self.awsAccountId}:{self.restApiId}/{self.stage}/{verb}/{resource}"
 
         if effect.lower() == "allow":
             self.allowMethods.append({
@@ -316,6 +611,84 @@ class AuthPolicy(object):
 
         return policy
         
+# Permissions of each Cognito group, as (HTTP verb, resource path) pairs.
+# A user belonging to several groups gets the union of the permissions of the groups.
+ROLE_RULES = {
+    'admins': [
+        (HttpVerb.ALL, "*"),
+    ],
+    'readers': [
+        (HttpVerb.POST, f"{AJAX_API_PREFIX}/runs/search"),
+        (HttpVerb.POST, f"{AJAX_API_PREFIX}/experiments/search"),
+        (HttpVerb.GET, f"{AJAX_API_PREFIX}/*"),
+        (HttpVerb.GET, "/get-artifact"),
+        (HttpVerb.GET, "/model-versions/*"),
+    ],
+    'model-approvers': [
+        (HttpVerb.POST, f"{AJAX_API_PREFIX}/runs/search"),
+        (HttpVerb.POST, f"{AJAX_API_PREFIX}/experiments/search"),
+        (HttpVerb.POST, f"{AJAX_API_PREFIX}/registered-models/*"),
+        (HttpVerb.ALL, f"{AJAX_API_PREFIX}/model-versions/*"),
+        (HttpVerb.GET, f"{AJAX_API_PREFIX}/*"),
+        (HttpVerb.GET, "/get-artifact"),
+        (HttpVerb.GET, "/model-versions/*"),
+    ],
+}
+
+def rules_for_groups(groups):
+    """Returns the merged, de-duplicated (verb, resource) rules of the given groups."""
+    rules = []
+    for group in sorted(groups):
+        for rule in ROLE_RULES[group]:
+            if rule not in rules:
+                rules.append(rule)
+    if (HttpVerb.ALL, "*") in rules:
+        return [(HttpVerb.ALL, "*")]
+    return rules
+
+@lru_cache(maxsize=256)
+def compile_policy(groups, region, awsAccountId, restApiId, stage):
+    """Builds the policy document for a set of groups on an API stage. The result is shared
+    between requests and must not be modified.
+    The policy covers every method the groups may invoke on the stage, so it is the same for
+    any request of the user and API Gateway can cache it."""
+    policy = AuthPolicy("", awsAccountId)
+    policy.restApiId = restApiId
+    policy.region = region
+    policy.stage = stage
+    for verb, resource in rules_for_groups(groups):
+        policy.allowMethod(verb, resource)
+    return policy.build()['policyDocument']
+
+def build_policy(principalId, groups, region, awsAccountId, restApiId, stage):
+    """Returns the authorizer response for a principal, or None if none of its groups is known."""
+    known_groups = frozenset(group for group in groups if group in ROLE_RULES)
+    if not known_groups:
+        return None
+    return {
+        'principalId': principalId,
+        'policyDocument': compile_policy(known_groups, region, awsAccountId, restApiId, stage)
+    }
+
+def warm():
+    """Pays the cold start costs ahead of the first request: imports the crypto backend,
+    constructs the public keys and compiles the policies of every group for the API stage."""
+    if not key_store._jwks:
+        key_store.refresh(force=True)
+    key_store.construct_all()
+    for key in key_store._keys.values():
+        # the result does not matter, it only loads the verification code paths
+        key.verify(b'warm', b'\0' * 256)
+    restApiId = os.environ.get('REST_API_ID')
+    account = os.environ.get('ACCOUNT')
+    if restApiId and account:
+        stage = os.environ.get('STAGE', 'prod')
+        for group in ROLE_RULES:
+            compile_policy(frozenset([group]), REGION, account, restApiId, stage)
+
+if WARM_ON_INIT:
+    warm()
+
 # the following is useful to make this script executable in both
 # AWS Lambda and any other local environments
 if __name__ == '__main__':
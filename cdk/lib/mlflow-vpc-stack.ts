@@ -25,6 +25,8 @@ const cidr = "10.0.0.0/16"
 const mlflowContainerPort = 5000
 const gatewayContainerPort = 5001
 const listenerMlflowPort= 8080
+const mlflowCacheContainerPort = 5050
+const mlflowCacheMemoryMiB = 160
 const listenerMlflowGatewayPort = 8081
 const gatewayPrivateHostname = "mlflow-gateway"
 const serverPrivateHostname = "mlflow-server"
@@ -204,6 +206,12 @@ export class MLflowVpcStack extends cdk.Stack {
     mlflowSecGrp.addIngressRule(ec2.Peer.ipv4(cidr), ec2.Port.tcp(listenerMlflowPort), 'Allow internal access to the container port');
     mlflowSecGrp.addIngressRule(ec2.Peer.ipv4(cidr), ec2.Port.tcp(listenerMlflowGatewayPort), 'Allow internal access to the container port');
 
+    // Optional read-through caching proxy in front of the MLflow server: cdk deploy -c mlflowCache=true
+    const mlflowCacheEnabled = `${this.node.tryGetContext('mlflowCache')}` === 'true';
+    if (mlflowCacheEnabled) {
+      mlflowSecGrp.addIngressRule(ec2.Peer.ipv4(cidr), ec2.Port.tcp(mlflowCacheContainerPort), 'Allow internal access to the mlflow cache port');
+    }
+
 
     // 👇 Cloud Map Namespace
     const dnsNamespace = new servicediscovery.PrivateDnsNamespace(
@@ -360,7 +368,7 @@ export class MLflowVpcStack extends cdk.Stack {
       {
         containerName: "mlflowServerContainer",
         essential: true,
-        memoryReservationMiB: 1024,
+        memoryReservationMiB: mlflowCacheEnabled ? 1024 - mlflowCacheMemoryMiB : 1024,
         cpu: 512,
         portMappings: [{
           containerPort: mlflowContainerPort,
@@ -378,6 +386,8 @@ export class MLflowVpcStack extends cdk.Stack {
           'DBHOST': rdsCluster.attrEndpointAddress,
           'DBPORT': `${dbPort}`,
           'DATABASE': dbName,
+          // Postgres connections of a task: 2 ACUs allow about 90 connections, shared by up to 6 tasks
+          'DB_MAX_CONNECTIONS': '15',
           'MLFLOW_DEPLOYMENTS_TARGET': `http://${gatewayPrivateHostname}.${privateHostname}:${gatewayContainerPort}`
         },
         secrets: {
@@ -387,6 +397,33 @@ export class MLflowVpcStack extends cdk.Stack {
         logging: mlflowServerServiceLogDriver,
       });
 
+    // The caching proxy shares the network namespace of the task and forwards to the server on localhost
+    if (mlflowCacheEnabled) {
+      mlflowServerTaskDefinition.addContainer(
+        "mlflowCacheContainer",
+        {
+          containerName: "mlflowCacheContainer",
+          essential: true,
+          memoryReservationMiB: mlflowCacheMemoryMiB,
+          portMappings: [{
+            containerPort: mlflowCacheContainerPort,
+            protocol: ecs.Protocol.TCP,
+          }],
+          image: ecs.ContainerImage.fromAsset('../src/mlflow-cache', {
+            platform: Platform.LINUX_AMD64,
+            buildArgs: {
+              PORT: `${mlflowCacheContainerPort}`
+            }
+          }),
+          environment: {
+            'PORT': `${mlflowCacheContainerPort}`,
+            'MLFLOW_UPSTREAM': `http://localhost:${mlflowContainerPort}`,
+            'ARTIFACT_CACHE_MB': '64'
+          },
+          logging: mlflowServerServiceLogDriver,
+        });
+    }
+
         // MlFlow Task Container
     const mlflowGatewayServiceContainer = mlflowGatewayTaskDefinition.addContainer(
       "mlflowGatewayContainer",
@@ -408,6 +445,10 @@ export class MLflowVpcStack extends cdk.Stack {
         environment: {
           'PORT': `${gatewayContainerPort}`,
           'WORKERS': '5',
+          // Bedrock calls in flight and queued per endpoint for the task, split between the workers
+          'MAX_CONCURRENCY': '10',
+          'MAX_QUEUE': '100',
+          'CACHE_TTL': '600',
           'AWS_REGION': this.region,
           'AWS_DEFAULT_REGION': this.region
         },
@@ -463,8 +504,8 @@ export class MLflowVpcStack extends cdk.Stack {
         targets: [
           mlflowServerService.loadBalancerTarget(
             {
-              containerName: 'mlflowServerContainer',
-              containerPort: mlflowContainerPort
+              containerName: mlflowCacheEnabled ? 'mlflowCacheContainer' : 'mlflowServerContainer',
+              containerPort: mlflowCacheEnabled ? mlflowCacheContainerPort : mlflowContainerPort
             }
           )
         ],
@@ -10,6 +10,7 @@ import * as logs from "aws-cdk-lib/aws-logs";
 import * as lambdapython from '@aws-cdk/aws-lambda-python-alpha';
 import * as ssm from 'aws-cdk-lib/aws-ssm';
 import * as iam from 'aws-cdk-lib/aws-iam';
+import * as ec2 from 'aws-cdk-lib/aws-ec2';
 import { IdentityPool, UserPoolAuthenticationProvider } from '@aws-cdk/aws-cognito-identitypool-alpha';
 
 import { NagSuppressions } from 'cdk-nag'
@@ -124,6 +125,24 @@ export class RestApiGatewayStack extends cdk.Stack {
       }
     })
 
+    // Optional experiment scoped authorization: cdk deploy -c experimentAuthz=true
+    // The policies become request specific, so the authorizer cache of the API Gateway is disabled, and the
+    // Lambda Authorizer runs in the VPC to look up the experiments on the tracking server
+    const experimentAuthzEnabled = `${this.node.tryGetContext('experimentAuthz')}` === 'true';
+    if (experimentAuthzEnabled) {
+      lambdaAuthorizerRole.addManagedPolicy(
+        iam.ManagedPolicy.fromAwsManagedPolicyName('service-role/AWSLambdaVPCAccessExecutionRole')
+      );
+    }
+    const experimentAuthzEnvironment: { [key: string]: string } = experimentAuthzEnabled ? {
+      EXPERIMENT_AUTHZ: 'true',
+      MLFLOW_TRACKING_INTERNAL_URI: `http://${httpApiInternalNLB.loadBalancerDnsName}:8080`
+    } : {};
+
+    // policies are cached per Authorization header. A cached policy can outlive the token expiration
+    // by at most the TTL. It must be 0 when the authorizer returns request specific policies
+    const authorizerCacheTtl = experimentAuthzEnabled ? cdk.Duration.seconds(0) : cdk.Duration.seconds(300); // Change as you see it fit
+
     const lambdaFunction = new lambdapython.PythonFunction(this, 'MyFunction', {
       entry: './lambda/authorizer/', // required
       runtime: lambda.Runtime.PYTHON_3_9, // required
@@ -131,20 +150,27 @@ export class RestApiGatewayStack extends cdk.Stack {
       handler: 'handler', // optional, defaults to 'handler',
       reservedConcurrentExecutions: 100, // change as you see it fit
       role: lambdaAuthorizerRole,
+      vpc: experimentAuthzEnabled ? httpApiInternalNLB.vpc : undefined,
+      vpcSubnets: experimentAuthzEnabled ? { subnetType: ec2.SubnetType.PRIVATE_WITH_EGRESS } : undefined,
       environment: { 
         REGION: this.region, 
         ACCOUNT: this.account,
         COGNITO_USER_POOL_ID: this.userPool.userPoolId,
         REST_API_ID: this.restApi.restApiId,
         COGNITO_KEYS_URL: `https://cognito-idp.${this.region}.amazonaws.com/${this.userPool.userPoolId}/.well-known/jwks.json`,
-        APP_CLIENT_ID: this.userPoolClient.userPoolClientId
+        APP_CLIENT_ID: this.userPoolClient.userPoolClientId,
+        // the authorizer refuses to return request specific policies that API Gateway would cache
+        AUTHORIZER_CACHE_TTL: `${authorizerCacheTtl.toSeconds()}`,
+        // verify the token signatures with the cryptography package directly
+        JWT_BACKEND: 'cryptography',
+        ...experimentAuthzEnvironment
       },
     });
 
     const lambdaAuthorizer = new apigateway.RequestAuthorizer(this, 'lambda-authorizer', {
       handler: lambdaFunction,
       identitySources: [apigateway.IdentitySource.header('Authorization')],
-      resultsCacheTtl: cdk.Duration.seconds(0) // Increase as you see it fit
+      resultsCacheTtl: authorizerCacheTtl
     });
 
     const proxyApiIntegration = new apigateway.Integration(
@@ -324,6 +350,11 @@ export class RestApiGatewayStack extends cdk.Stack {
         id: 'AwsSolutions-IAM5',
         reason: 'Lambda Authorizer permissions to log to CloudWatch',
         appliesTo: [`Resource::arn:aws:logs:${this.region}:${this.account}:*`]
+      },
+      {
+        id: 'AwsSolutions-IAM4',
+        reason: 'Network interfaces of the Lambda Authorizer in the VPC, with experiment scoped authorization',
+        appliesTo: ['Policy::arn:<AWS::Partition>:iam::aws:policy/service-role/AWSLambdaVPCAccessExecutionRole']
       }
     ])
 
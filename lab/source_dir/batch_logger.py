@@ -0,0 +1,166 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import threading
+import time
+
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.tracking import MlflowClient
+
+# limits of a single log-batch request enforced by the MLflow tracking server
+MAX_METRICS_PER_BATCH = 1000
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+MAX_ENTITIES_PER_BATCH = 1000
+
+
+def split_batches(metrics, params, tags):
+    """Splits metrics, params and tags into (metrics, params, tags) batches respecting the
+    log-batch limits of the tracking server."""
+    batches = []
+    while metrics or params or tags:
+        batch_params, params = params[:MAX_PARAMS_PER_BATCH], params[MAX_PARAMS_PER_BATCH:]
+        batch_tags, tags = tags[:MAX_TAGS_PER_BATCH], tags[MAX_TAGS_PER_BATCH:]
+        room = min(MAX_METRICS_PER_BATCH, MAX_ENTITIES_PER_BATCH - len(batch_params) - len(batch_tags))
+        batch_metrics, metrics = metrics[:room], metrics[room:]
+        batches.append((batch_metrics, batch_params, batch_tags))
+    return batches
+
+
+class BatchLogger(object):
+    """Buffers the params, metrics and tags of a run and sends them to the tracking server with
+    MlflowClient.log_batch from a background thread, so that the training never waits for the
+    tracking server. A batch that fails is put back in the buffer and sent again with the next
+    one. Everything still buffered is flushed when the logger is closed, also when the training
+    fails.
+
+        with mlflow.start_run() as run, BatchLogger(run.info.run_id) as batch_logger:
+            batch_logger.log_metric('rmse', 0.5)
+    """
+
+    def __init__(self, run_id, client=None, flush_interval=5.0, flush_size=MAX_ENTITIES_PER_BATCH,
+                 close_attempts=3, retry_backoff=1.0):
+        self.run_id = run_id
+        self.client = client or MlflowClient()
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.close_attempts = close_attempts
+        self.retry_backoff = retry_backoff
+        self.requests = 0
+        self.failed_requests = 0
+        self._metrics = []
+        # params and tags are keyed, the last value logged wins as with mlflow.log_param/set_tag
+        self._params = {}
+        self._tags = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='mlflow-batch-logger', daemon=True)
+        self._thread.start()
+
+    def log_param(self, key, value):
+        self.log_params({key: value})
+
+    def log_params(self, params):
+        with self._lock:
+            self._params.update({key: str(value) for key, value in params.items()})
+        self._maybe_wake()
+
+    def log_metric(self, key, value, step=0, timestamp=None):
+        self.log_metrics({key: value}, step, timestamp)
+
+    def log_metrics(self, metrics, step=0, timestamp=None):
+        timestamp = timestamp or int(time.time() * 1000)
+        with self._lock:
+            self._metrics.extend(Metric(key, float(value), timestamp, step) for key, value in metrics.items())
+        self._maybe_wake()
+
+    def set_tag(self, key, value):
+        self.set_tags({key: value})
+
+    def set_tags(self, tags):
+        with self._lock:
+            self._tags.update({key: str(value) for key, value in tags.items()})
+        self._maybe_wake()
+
+    def _maybe_wake(self):
+        if len(self._metrics) + len(self._params) + len(self._tags) >= self.flush_size:
+            self._wake.set()
+
+    def _send(self):
+        # a single sender at a time keeps the order of the batches
+        with self._send_lock:
+            with self._lock:
+                metrics, self._metrics = self._metrics, []
+                params = [Param(key, value) for key, value in self._params.items()]
+                tags = [RunTag(key, value) for key, value in self._tags.items()]
+                self._params, self._tags = {}, {}
+            batches = split_batches(metrics, params, tags)
+            for i, (batch_metrics, batch_params, batch_tags) in enumerate(batches):
+                try:
+                    self.client.log_batch(self.run_id, metrics=batch_metrics, params=batch_params, tags=batch_tags)
+                except Exception:
+                    self.failed_requests += 1
+                    self._requeue(batches[i:])
+                    raise
+                finally:
+                    self.requests += 1
+
+    def _requeue(self, batches):
+        """Puts the batches not sent back in front of the buffer, the values logged since then win."""
+        with self._lock:
+            self._metrics = [metric for batch_metrics, _, _ in batches for metric in batch_metrics] + self._metrics
+            params = {param.key: param.value for _, batch_params, _ in batches for param in batch_params}
+            tags = {tag.key: tag.value for _, _, batch_tags in batches for tag in batch_tags}
+            self._params, self._tags = {**params, **self._params}, {**tags, **self._tags}
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            # close() sends what is left
+            if self._closed:
+                return
+            try:
+                self._send()
+            except Exception as e:
+                # retried with the next flush
+                logging.warning(f"MLflow log_batch failed: {e}")
+
+    def flush(self):
+        """Sends everything buffered so far, in the calling thread."""
+        self._send()
+
+    def close(self):
+        """Stops the background thread and sends everything still buffered, making up to
+        close_attempts attempts. Raises the last error if the buffer could not be sent."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        attempts = max(1, self.close_attempts)
+        for attempt in range(attempts):
+            try:
+                self._send()
+                return
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+                logging.warning(f"MLflow log_batch failed: {e}")
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except Exception:
+            # do not hide the error of the training itself
+            if exc_type is None:
+                raise
+            logging.exception('MLflow log_batch failed')
+        return False
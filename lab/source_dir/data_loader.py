@@ -0,0 +1,139 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import os
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+
+CSV_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.zst')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+# sklearn trees work on float32 features, parsing straight into float32 halves the memory of float64
+DEFAULT_DTYPE = np.float32
+DEFAULT_CHUNK_ROWS = 1_000_000
+# a file is read in chunks when it is larger than this fraction of the available memory
+CHUNK_MEMORY_FRACTION = 0.25
+
+
+def file_format(path):
+    name = path.lower()
+    if name.endswith(PARQUET_EXTENSIONS):
+        return 'parquet'
+    if name.endswith(ARROW_EXTENSIONS):
+        return 'arrow'
+    if name.endswith(CSV_EXTENSIONS):
+        return 'csv'
+    raise ValueError(f"Unsupported data file {path}, expected one of "
+                     f"{CSV_EXTENSIONS + PARQUET_EXTENSIONS + ARROW_EXTENSIONS}")
+
+
+def available_memory():
+    """Returns the bytes of memory available to the process, or None if unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+            else:
+                return None
+    except OSError:
+        return None
+    # the container limit is lower than the memory of the host
+    for limit_file in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(limit_file) as f:
+                value = f.read().strip()
+            if value != 'max':
+                available = min(available, int(value))
+            break
+        except (OSError, ValueError):
+            continue
+    return available
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of the process in MiB."""
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def should_chunk(path, fraction=CHUNK_MEMORY_FRACTION):
+    available = available_memory()
+    return available is not None and os.path.getsize(path) > available * fraction
+
+
+def arrow_to_pandas(table, dtype):
+    """Converts an Arrow table or record batch to pandas, casting the columns in Arrow so that
+    no intermediate float64 copy is made."""
+    import pyarrow as pa
+    if isinstance(table, pa.RecordBatch):
+        table = pa.Table.from_batches([table])
+    arrow_type = pa.from_numpy_dtype(dtype)
+    schema = pa.schema([(field.name, arrow_type) for field in table.schema])
+    return table.cast(schema).to_pandas()
+
+
+def iter_chunks(path, columns, dtype=DEFAULT_DTYPE, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields DataFrames of at most chunk_rows rows holding only the given columns, cast to dtype.
+    Parquet and Arrow IPC files are memory-mapped, so only the selected columns are paged in."""
+    fmt = file_format(path)
+    if fmt == 'csv':
+        dtypes = {column: dtype for column in columns}
+        with pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                yield chunk[columns]
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield arrow_to_pandas(batch, dtype)
+    else:
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(columns)
+                for offset in range(0, batch.num_rows, chunk_rows):
+                    yield arrow_to_pandas(batch.slice(offset, chunk_rows), dtype)
+
+
+def read_columns(path, columns, dtype=DEFAULT_DTYPE, chunk_rows=None):
+    """Reads only the given columns of a CSV, Parquet or Arrow IPC file into a DataFrame of dtype.
+
+    chunk_rows=None reads the file in chunks only when it is large compared to the available
+    memory, 0 never reads it in chunks. Reading in chunks keeps the parser buffers bounded: the
+    peak memory is the pruned table plus a chunk, instead of the parser's copy of the whole file."""
+    if chunk_rows is None:
+        chunk_rows = DEFAULT_CHUNK_ROWS if should_chunk(path) else 0
+    if chunk_rows:
+        chunks = list(iter_chunks(path, columns, dtype, chunk_rows))
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns, dtype=dtype)
+
+    fmt = file_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, usecols=columns, dtype={column: dtype for column in columns})[columns]
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all().select(columns)
+    return arrow_to_pandas(table, dtype)
+
+
+def load_dataset(path, features, target, dtype=DEFAULT_DTYPE, chunk_rows=None):
+    """Returns the (X, y, load seconds) of a data channel, reading only the feature and target columns."""
+    start = time.perf_counter()
+    df = read_columns(path, list(features) + [target], dtype, chunk_rows)
+    elapsed = time.perf_counter() - start
+    logging.info(f'read {len(df)} rows of {path} in {elapsed:.2f}s, peak RSS {peak_rss_mb():.0f}MiB')
+    # pop the target instead of selecting the features, which would copy them
+    y = df.pop(target)
+    return df, y, elapsed
@@ -0,0 +1,207 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from data_loader import DEFAULT_CHUNK_ROWS, iter_chunks
+
+DEFAULT_QUANTILES = (10, 50, 90)
+
+
+class QuantileSketch(object):
+    """Mergeable t-digest of a stream of values, in bounded memory.
+
+    The values are buffered and merged into about compression / 2 centroids with the arcsine
+    scale function of the merging t-digest, so the centroids are small in the tails and larger
+    around the median. Quantiles are interpolated between the centroids, and min and max are
+    exact. With the default compression of 500 the quantiles in the 1st-99th percentile range
+    are within 0.5% of rank of the exact numpy quantiles (rank error = |F(estimate) - q|, it
+    stays below 0.05% for shuffled data of a million values or more).
+    """
+
+    def __init__(self, compression=500, buffer_size=100_000):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+        self._buffered = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.count += len(values)
+        self._buffer.append((values, None))
+        self._buffered += len(values)
+        if self._buffered >= self.buffer_size:
+            self._compress()
+
+    def merge(self, other):
+        """Adds the values summarized by another sketch."""
+        other._compress()
+        if not other.count:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self._buffer.append((other.means, other.weights))
+        self._buffered += len(other.means)
+        self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        means = np.concatenate([self.means] + [m for m, _ in self._buffer])
+        weights = np.concatenate([self.weights] +
+                                 [w if w is not None else np.ones(len(m)) for m, w in self._buffer])
+        self._buffer, self._buffered = [], 0
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        total = cumulative[-1]
+        # the scale function maps the quantile at the left edge of every value to k, a cluster
+        # spans at most one unit of k
+        q = (cumulative - weights) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+        cluster = np.floor(k - k[0]).astype(np.int64)
+        _, cluster = np.unique(cluster, return_inverse=True)
+        self.weights = np.bincount(cluster, weights=weights)
+        self.means = np.bincount(cluster, weights=means * weights) / self.weights
+
+    def quantiles(self, qs):
+        """Returns the estimated values at the quantiles qs, in [0, 1]."""
+        self._compress()
+        if not self.count:
+            return np.full(len(qs), np.nan)
+        # every centroid sits at the middle of its cumulative weight
+        centers = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.asarray(qs, dtype=np.float64) * self.count
+        return np.interp(ranks, np.concatenate(([0], centers, [self.count])),
+                         np.concatenate(([self.min], self.means, [self.max])))
+
+
+class RegressionMetrics(object):
+    """Mergeable accumulator of regression metrics over chunks of (y_true, y_pred)."""
+
+    def __init__(self):
+        self.count = 0
+        self.sum_abs_error = 0.0
+        self.sum_squared_error = 0.0
+        self.max_error = 0.0
+        # mean and sum of squared deviations of y_true, merged with Chan's formula
+        self.mean_true = 0.0
+        self.m2_true = 0.0
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        error = np.asarray(y_pred, dtype=np.float64) - y_true
+        n = len(y_true)
+        if not n:
+            return
+        abs_error = np.abs(error)
+        self.sum_abs_error += float(abs_error.sum())
+        self.sum_squared_error += float(np.dot(error, error))
+        self.max_error = max(self.max_error, float(abs_error.max()))
+        mean = float(y_true.mean())
+        deviation = y_true - mean
+        self._merge_moments(n, mean, float(np.dot(deviation, deviation)))
+
+    def _merge_moments(self, n, mean, m2):
+        total = self.count + n
+        delta = mean - self.mean_true
+        self.m2_true += m2 + delta * delta * self.count * n / total
+        self.mean_true += delta * n / total
+        self.count = total
+
+    def merge(self, other):
+        if not other.count:
+            return
+        self.sum_abs_error += other.sum_abs_error
+        self.sum_squared_error += other.sum_squared_error
+        self.max_error = max(self.max_error, other.max_error)
+        self._merge_moments(other.count, other.mean_true, other.m2_true)
+
+    def result(self):
+        if not self.count:
+            return {}
+        return {
+            'mean-absolute-error': self.sum_abs_error / self.count,
+            'root-mean-squared-error': math.sqrt(self.sum_squared_error / self.count),
+            'r2-score': 1 - self.sum_squared_error / self.m2_true if self.m2_true else float('nan'),
+            'max-error': self.max_error,
+        }
+
+
+def frame_chunks(X, y, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields (X, y) chunks of at most chunk_rows rows of in-memory data."""
+    for start in range(0, len(y), chunk_rows):
+        yield X[start:start + chunk_rows], y[start:start + chunk_rows]
+
+
+def file_chunks(path, features, target, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields (X, y) chunks of a CSV, Parquet or Arrow IPC file, without loading the whole file."""
+    for chunk in iter_chunks(path, list(features) + [target], chunk_rows=chunk_rows):
+        y = chunk.pop(target)
+        yield chunk, y
+
+
+def _predict(model, X, y):
+    return np.asarray(y, dtype=np.float64), np.asarray(model.predict(X), dtype=np.float64)
+
+
+def _predictions(model, chunks, workers):
+    """Yields the (y_true, y_pred) of every chunk in order, predicting up to `workers` chunks
+    concurrently without reading more than 2 * workers chunks ahead."""
+    if workers <= 1:
+        for X, y in chunks:
+            yield _predict(model, X, y)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for X, y in chunks:
+            pending.append(executor.submit(_predict, model, X, y))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def evaluate(model, chunks, quantiles=DEFAULT_QUANTILES, workers=1, exact=True, compression=500):
+    """Predicts the (X, y) chunks and returns the regression metrics and the absolute error at
+    each of the percentiles in `quantiles`, named as AE-at-{q}th-percentile.
+
+    With exact=True the absolute errors are kept, in float64, and all the percentiles are
+    computed by a single np.percentile call. With exact=False they are summarized in a
+    QuantileSketch, whose memory does not depend on the number of rows."""
+    metrics = RegressionMetrics()
+    sketch = None if exact else QuantileSketch(compression)
+    abs_errors = []
+    for y_true, y_pred in _predictions(model, chunks, workers):
+        metrics.update(y_true, y_pred)
+        abs_error = np.abs(y_pred - y_true)
+        if exact:
+            abs_errors.append(abs_error)
+        else:
+            sketch.update(abs_error)
+
+    result = metrics.result()
+    if exact:
+        abs_error = np.concatenate(abs_errors) if abs_errors else np.empty(0)
+        values = np.percentile(abs_error, quantiles) if len(abs_error) else [np.nan] * len(quantiles)
+    else:
+        values = sketch.quantiles([q / 100 for q in quantiles])
+    for q, value in zip(quantiles, values):
+        result[f'AE-at-{q}th-percentile'] = float(value)
+    logging.info(f'evaluated {metrics.count} rows: {result}')
+    return result
@@ -0,0 +1,146 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import threading
+import time
+
+# a trial component accepts at most 30 output artifacts, one is kept for SageMaker.ModelArtifact
+MAX_OUTPUT_ARTIFACTS = 29
+
+
+class RunSnapshot(object):
+    """The data of a finished MLflow run and the paths of its artifacts, fetched once."""
+
+    def __init__(self, run, artifacts):
+        self.run = run
+        self.artifacts = artifacts
+
+    @classmethod
+    def fetch(cls, client, run_id, artifact_path='model'):
+        run = client.get_run(run_id)
+        artifacts = [f.path for f in client.list_artifacts(run_id, artifact_path)]
+        return cls(run, artifacts)
+
+    @property
+    def run_id(self):
+        return self.run.info.run_id
+
+    @property
+    def params(self):
+        return self.run.data.params
+
+    @property
+    def metrics(self):
+        return self.run.data.metrics
+
+    def artifact_uris(self):
+        return {artifact: f"{self.run.info.artifact_uri}/{artifact}" for artifact in self.artifacts}
+
+    def print(self):
+        print("run_id: {}".format(self.run_id))
+        print("artifacts: {}".format(self.artifacts))
+        print("params: {}".format(self.params))
+        print("metrics: {}".format(self.metrics))
+
+
+def retry(fn, attempts=3, backoff=1.0):
+    """Calls fn until it succeeds, at most `attempts` times (at least once), doubling the wait
+    between the attempts."""
+    attempts = max(1, attempts)
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            logging.warning(f"{getattr(fn, '__name__', fn)} failed ({e}), retrying")
+            time.sleep(backoff * 2 ** attempt)
+
+
+class ExperimentsSync(object):
+    """Mirrors a RunSnapshot to the SageMaker Experiments trial component of the training job.
+
+    The tracker of the job is loaded, or a new one is created outside of a training job (e.g.,
+    in local mode), where metrics cannot be logged. Parameters, metrics and outputs are recorded
+    locally by the tracker and saved to SageMaker in one call when it is closed, the calls to
+    SageMaker are retried. `tracker_class` defaults to smexperiments.tracker.Tracker, any class
+    with the same load/create/log_* interface can be used instead.
+
+        sync = ExperimentsSync(RunSnapshot.fetch(MlflowClient(), run_id), {'run_id': run_id})
+        sync.start()
+        ...
+        sync.join(timeout=60)
+    """
+
+    def __init__(self, snapshot, tracker_parameters, tracker_class=None, attempts=3, backoff=1.0):
+        self.snapshot = snapshot
+        self.tracker_parameters = tracker_parameters
+        self.tracker_class = tracker_class
+        self.attempts = attempts
+        self.backoff = backoff
+        self.error = None
+        self._thread = None
+
+    def _open(self):
+        """Returns the (tracker, in_job) tuple."""
+        try:
+            return self.tracker_class.load(), True
+        except ValueError:
+            print("Could not load tracker (likely running in local mode). Create a new one")
+            create_date = time.strftime("%Y-%m-%d-%H-%M-%S")
+            return self.tracker_class.create(display_name=f"mlflow-tracker-{create_date}"), False
+
+    def _push(self, tracker, in_job):
+        tracker.log_parameters({**self.tracker_parameters, **self.snapshot.params})
+        if in_job:
+            for metric_name, value in self.snapshot.metrics.items():
+                tracker.log_metric(metric_name=metric_name, value=value)
+        else:
+            print("Metric cannot be logged when creating a tracker in this way")
+        artifact_uris = list(self.snapshot.artifact_uris().items())
+        if len(artifact_uris) > MAX_OUTPUT_ARTIFACTS:
+            logging.warning(f"Only the first {MAX_OUTPUT_ARTIFACTS} of {len(artifact_uris)} artifacts are tracked")
+        for artifact, uri in artifact_uris[:MAX_OUTPUT_ARTIFACTS]:
+            tracker.log_output(name=f"MLFlow.{artifact}", value=uri)
+        # Nullify default SageMaker.ModelArtifact
+        tracker.log_output(name="SageMaker.ModelArtifact", value="NA")
+
+    def sync(self):
+        if self.tracker_class is None:
+            from smexperiments.tracker import Tracker
+            self.tracker_class = Tracker
+        tracker, in_job = retry(self._open, self.attempts, self.backoff)
+        pushed = False
+        try:
+            with tracker:
+                self._push(tracker, in_job)
+                pushed = True
+        except Exception as e:
+            # the tracker is saved to SageMaker when it is closed, the first attempt is the one of
+            # the with statement
+            if not pushed or self.attempts <= 1:
+                raise
+            logging.warning(f"Could not save the tracker ({e}), retrying")
+            retry(tracker.close, self.attempts - 1, self.backoff)
+        print("Loaded existing tracker" if in_job else "Created new tracker")
+
+    def _run(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logging.exception('SageMaker Experiments sync failed')
+            self.error = e
+
+    def start(self):
+        """Syncs in a background thread."""
+        self._thread = threading.Thread(target=self._run, name='experiments-sync', daemon=True)
+        self._thread.start()
+
+    def join(self, timeout=None):
+        """Waits for the background sync, and returns True if it completed successfully."""
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.warning(f"SageMaker Experiments sync did not complete in {timeout}s")
+            return False
+        return self.error is None
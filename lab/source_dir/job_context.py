@@ -0,0 +1,72 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import base64
+import json
+import logging
+import zlib
+
+import mlflow
+from mlflow.tracking import MlflowClient
+
+# keys of SM_TRAINING_ENV kept as run tags, dots reach into nested dicts
+DEFAULT_SEARCHABLE_KEYS = ('job_name', 'current_instance_type', 'resource_config.current_instance_type')
+CONTEXT_ARTIFACT = 'sagemaker/job_context.json'
+CONTEXT_TAG = 'sagemaker.job_context'
+# length of a tag value accepted by the tracking server
+MAX_TAG_VALUE_LENGTH = 5000
+
+# 'tags' sets one tag per key of the context, as previous versions did
+STORAGE_MODES = ('artifact', 'tag', 'tags')
+
+
+def searchable_tags(context, keys=DEFAULT_SEARCHABLE_KEYS):
+    """Returns the tags of the searchable keys present in the context."""
+    tags = {}
+    for key in keys:
+        value = context
+        for part in key.split('.'):
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            tags[key] = value if isinstance(value, str) else json.dumps(value)
+    return tags
+
+
+def encode_context(context):
+    return base64.b64encode(zlib.compress(json.dumps(context, separators=(',', ':')).encode(), 9)).decode()
+
+
+def decode_context(value):
+    return json.loads(zlib.decompress(base64.b64decode(value)))
+
+
+def log_job_context(context, batch_logger, mode='artifact', keys=DEFAULT_SEARCHABLE_KEYS):
+    """Stores the SageMaker job context in the active run: the searchable keys as tags, and the
+    full context as one JSON artifact ('artifact') or one compressed tag ('tag'). A context too
+    large for a tag is stored as an artifact."""
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown job context storage {mode}, expected one of {STORAGE_MODES}")
+    if mode == 'tags':
+        batch_logger.set_tags(context)
+        return
+    batch_logger.set_tags(searchable_tags(context, keys))
+    if mode == 'tag':
+        value = encode_context(context)
+        if len(value) <= MAX_TAG_VALUE_LENGTH:
+            batch_logger.set_tag(CONTEXT_TAG, value)
+            return
+        logging.warning(f"job context of {len(value)} bytes is too large for a tag, logging it as an artifact")
+    mlflow.log_dict(context, CONTEXT_ARTIFACT)
+
+
+def load_job_context(run_id, client=None):
+    """Returns the full SageMaker job context stored by log_job_context, or None."""
+    client = client or MlflowClient()
+    run = client.get_run(run_id)
+    if CONTEXT_TAG in run.data.tags:
+        return decode_context(run.data.tags[CONTEXT_TAG])
+    if any(f.path == CONTEXT_ARTIFACT for f in client.list_artifacts(run_id, CONTEXT_ARTIFACT.rsplit('/', 1)[0])):
+        return mlflow.artifacts.load_dict(f"{run.info.artifact_uri}/{CONTEXT_ARTIFACT}")
+    return None
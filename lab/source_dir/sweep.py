@@ -0,0 +1,221 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Hyperparameter sweep of the RandomForestRegressor of train.py in a single job.
+
+The channels are read once and saved as .npy files that every worker memory-maps read-only,
+so the workers of the process pool share the same pages instead of holding a copy each.
+Every configuration is logged as a child run of the sweep run, and the best one is promoted:
+its params and metrics are copied to the sweep run and, with --registered-model-name, its
+model is registered with the 'champion' alias. Runs locally against a file store:
+
+    MLFLOW_TRACKING_URI=file:///tmp/mlruns MLFLOW_EXPERIMENT_NAME=sweep python sweep.py \\
+        --train .. --test .. --target target \\
+        --features 'MedInc HouseAge AveRooms AveBedrms Population AveOccup' \\
+        --search-space '{"n-estimators": [10, 50, 100], "min-samples-leaf": [1, 3, 5]}'
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+import mlflow
+import mlflow.sklearn
+from mlflow.tracking import MlflowClient
+from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID, MLFLOW_RUN_NAME
+
+from batch_logger import BatchLogger
+from data_loader import load_dataset, peak_rss_mb
+from evaluation import evaluate, frame_chunks
+
+logging.basicConfig(level=logging.INFO)
+
+tracking_uri = os.environ.get('MLFLOW_TRACKING_URI')
+experiment_name = os.environ.get('MLFLOW_EXPERIMENT_NAME')
+
+# metrics of evaluation.evaluate for which higher is better, the others are minimized
+MAXIMIZED_METRICS = {'r2-score'}
+
+# read-only memory-mapped datasets of a worker process, set by attach_datasets
+datasets = {}
+
+
+def grid_configurations(search_space):
+    """Returns every combination of the values listed in the search space."""
+    names = sorted(search_space)
+    return [dict(zip(names, values)) for values in itertools.product(*(search_space[name] for name in names))]
+
+
+def random_configurations(search_space, trials, seed):
+    """Returns `trials` configurations sampled from the search space. A hyperparameter is either a
+    list of values or a {"min": ..., "max": ...} range, of integers if both bounds are integers."""
+    rng = random.Random(seed)
+    configurations = []
+    for _ in range(trials):
+        configuration = {}
+        for name in sorted(search_space):
+            space = search_space[name]
+            if isinstance(space, dict):
+                low, high = space['min'], space['max']
+                if isinstance(low, int) and isinstance(high, int):
+                    configuration[name] = rng.randint(low, high)
+                else:
+                    configuration[name] = rng.uniform(low, high)
+            else:
+                configuration[name] = rng.choice(space)
+        configurations.append(configuration)
+    return configurations
+
+
+def save_datasets(directory, **arrays):
+    """Saves the arrays as .npy files and returns their paths, to be memory-mapped by the workers."""
+    paths = {}
+    for name, array in arrays.items():
+        paths[name] = os.path.join(directory, f'{name}.npy')
+        np.save(paths[name], np.asarray(array))
+    return paths
+
+
+def attach_datasets(paths, uri):
+    """Initializer of the worker processes."""
+    for name, path in paths.items():
+        datasets[name] = np.load(path, mmap_mode='r')
+    mlflow.set_tracking_uri(uri)
+
+
+def train_configuration(parent_run_id, experiment_id, configuration, quantiles, n_jobs):
+    """Trains and evaluates one configuration in a child run, and returns (run_id, metrics)."""
+    client = MlflowClient()
+    run_name = ' '.join(f'{name}={value}' for name, value in sorted(configuration.items()))
+    run = client.create_run(experiment_id, tags={MLFLOW_PARENT_RUN_ID: parent_run_id, MLFLOW_RUN_NAME: run_name})
+    run_id = run.info.run_id
+    with mlflow.start_run(run_id=run_id), BatchLogger(run_id, client) as batch_logger:
+        batch_logger.log_params(configuration)
+        model = RandomForestRegressor(
+            n_jobs=n_jobs,
+            **{name.replace('-', '_'): value for name, value in configuration.items()}
+        )
+        model.fit(datasets['X_train'], datasets['y_train'])
+        metrics = evaluate(model, frame_chunks(datasets['X_test'], datasets['y_test']), quantiles)
+        batch_logger.log_metrics(metrics)
+        mlflow.sklearn.log_model(model, 'model')
+    return run_id, metrics
+
+
+def best_run(results, objective):
+    """Returns the (run_id, metrics) with the best objective metric."""
+    sign = -1 if objective in MAXIMIZED_METRICS else 1
+    return min(results, key=lambda result: sign * result[1][objective])
+
+
+def run_sweep(configurations, paths, quantiles, workers, objective):
+    """Runs every configuration in a child run of the active run, on a pool of `workers`
+    processes, and returns the list of (run_id, metrics)."""
+    parent = mlflow.active_run()
+    # the cores are split between the workers and the trees of each forest
+    n_jobs = max(1, (os.cpu_count() or 1) // workers)
+    results = []
+    # spawned workers do not inherit the active run of the parent, nor copies of its memory
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=attach_datasets, initargs=(paths, mlflow.get_tracking_uri())) as executor:
+        futures = [executor.submit(train_configuration, parent.info.run_id, parent.info.experiment_id,
+                                   configuration, quantiles, n_jobs)
+                   for configuration in configurations]
+        for future in as_completed(futures):
+            run_id, metrics = future.result()
+            logging.info(f'run {run_id} {objective}={metrics[objective]}')
+            results.append((run_id, metrics))
+    return results
+
+
+def promote(run_id, metrics, registered_model_name=None):
+    """Copies the params and metrics of the best child run to the active run and, if a model name
+    is given, registers its model with the 'champion' alias."""
+    client = MlflowClient()
+    best = client.get_run(run_id)
+    mlflow.log_params({f'best-{name}': value for name, value in best.data.params.items()})
+    mlflow.log_metrics(metrics)
+    mlflow.set_tag('best-run-id', run_id)
+    if registered_model_name:
+        version = mlflow.register_model(f'runs:/{run_id}/model', registered_model_name)
+        client.set_registered_model_alias(registered_model_name, 'champion', version.version)
+        logging.info(f'registered model {registered_model_name} version {version.version} as champion')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--train', type=str, default=os.environ.get('SM_CHANNEL_TRAIN'))
+    parser.add_argument('--test', type=str, default=os.environ.get('SM_CHANNEL_TEST'))
+    parser.add_argument('--train-file', type=str, default='california_train.csv')
+    parser.add_argument('--test-file', type=str, default='california_test.csv')
+    parser.add_argument('--features', type=str)
+    parser.add_argument('--target', type=str)
+    parser.add_argument('--chunk-rows', type=int, default=None)
+    parser.add_argument('--quantiles', type=str, default='10 50 90')
+    # JSON object of RandomForestRegressor hyperparameters, in the --n-estimators style of train.py
+    parser.add_argument('--search-space', type=str, default='{"n-estimators": [10, 50], "min-samples-leaf": [1, 3, 5]}')
+    parser.add_argument('--search-strategy', type=str, default='grid', choices=['grid', 'random'])
+    parser.add_argument('--trials', type=int, default=10)  # number of random configurations
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--objective', type=str, default='root-mean-squared-error')
+    parser.add_argument('--registered-model-name', type=str, default=None)
+    parser.add_argument('--scratch-dir', type=str, default=None)  # where the memory-mapped datasets are saved
+
+    args, _ = parser.parse_known_args()
+
+    search_space = json.loads(args.search_space)
+    if args.search_strategy == 'grid':
+        configurations = grid_configurations(search_space)
+    else:
+        configurations = random_configurations(search_space, args.trials, args.seed)
+    quantiles = [int(q) for q in args.quantiles.split()]
+    workers = max(1, min(args.workers, len(configurations)))
+
+    logging.info('reading data')
+    features = args.features.split()
+    X_train, y_train, train_load_seconds = load_dataset(
+        os.path.join(args.train, args.train_file), features, args.target, chunk_rows=args.chunk_rows)
+    X_test, y_test, test_load_seconds = load_dataset(
+        os.path.join(args.test, args.test_file), features, args.target, chunk_rows=args.chunk_rows)
+
+    scratch_dir = tempfile.mkdtemp(prefix='sweep-', dir=args.scratch_dir)
+    try:
+        paths = save_datasets(scratch_dir, X_train=X_train, y_train=y_train, X_test=X_test, y_test=y_test)
+        # the workers only see the memory-mapped copies
+        del X_train, y_train, X_test, y_test
+
+        if tracking_uri:
+            mlflow.set_tracking_uri(tracking_uri)
+        if experiment_name:
+            mlflow.set_experiment(experiment_name)
+
+        with mlflow.start_run(run_name=f'sweep-{args.search_strategy}'):
+            mlflow.log_params({
+                'search-space': args.search_space,
+                'search-strategy': args.search_strategy,
+                'configurations': len(configurations),
+                'features': args.features,
+                'objective': args.objective
+            })
+            mlflow.log_metrics({
+                'train-load-seconds': train_load_seconds,
+                'test-load-seconds': test_load_seconds,
+                'load-peak-rss-mb': peak_rss_mb()
+            })
+            logging.info(f'sweeping {len(configurations)} configurations on {workers} workers')
+            results = run_sweep(configurations, paths, quantiles, workers, args.objective)
+            run_id, metrics = best_run(results, args.objective)
+            logging.info(f'best run {run_id} {args.objective}={metrics[args.objective]}')
+            promote(run_id, metrics, args.registered_model_name)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
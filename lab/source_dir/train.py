@@ -4,8 +4,6 @@
 import os
 import logging
 import argparse
-import numpy as np
-import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
 
 import mlflow
@@ -15,9 +13,12 @@ from mlflow.tracking import MlflowClient
 import joblib
 import boto3
 import json
-import time
 
-from smexperiments.tracker import Tracker
+from batch_logger import BatchLogger
+from data_loader import DEFAULT_CHUNK_ROWS, load_dataset, peak_rss_mb, should_chunk
+from evaluation import evaluate, file_chunks, frame_chunks
+from experiments_sync import ExperimentsSync, RunSnapshot
+from job_context import DEFAULT_SEARCHABLE_KEYS, STORAGE_MODES, log_job_context
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("mlflow").setLevel(logging.INFO)
@@ -27,15 +28,6 @@ experiment_name = os.environ.get('MLFLOW_EXPERIMENT_NAME')
 mlflow_amplify_ui = os.environ.get('MLFLOW_AMPLIFY_UI_URI')
 user = os.environ.get('MLFLOW_USER')
 
-def print_auto_logged_info(r):
-    tags = {k: v for k, v in r.data.tags.items()}
-    artifacts = [f.path for f in MlflowClient().list_artifacts(r.info.run_id, "model")]
-    print("run_id: {}".format(r.info.run_id))
-    print("artifacts: {}".format(artifacts))
-    print("params: {}".format(r.data.params))
-    print("metrics: {}".format(r.data.metrics))
-    #print("tags: {}".format(tags))
-    
 if __name__ =='__main__':
     parser = argparse.ArgumentParser()
     # hyperparameters sent by the client are passed as command-line arguments to the script.
@@ -52,18 +44,31 @@ if __name__ =='__main__':
     parser.add_argument('--user', type=str, default='sagemaker')
     parser.add_argument('--features', type=str)  # we ask user to explicitly name features
     parser.add_argument('--target', type=str) # we ask user to explicitly name the target
+    # CSV, Parquet or Arrow IPC files are read in chunks of this many rows when larger than the
+    # available memory allows (default), 0 never reads them in chunks
+    parser.add_argument('--chunk-rows', type=int, default=None)
+    parser.add_argument('--eval-workers', type=int, default=1)  # chunks predicted concurrently
+    parser.add_argument('--quantiles', type=str, default='10 50 90')  # percentiles of the absolute error
+    parser.add_argument('--sync-timeout', type=float, default=120)  # seconds to wait for SageMaker Experiments
+    # SM_TRAINING_ENV is stored as one JSON artifact ('artifact'), one compressed tag ('tag'),
+    # or one tag per key ('tags'), the --context-tags keys are always tags
+    parser.add_argument('--job-context', type=str, default='artifact', choices=STORAGE_MODES)
+    parser.add_argument('--context-tags', type=str, default=' '.join(DEFAULT_SEARCHABLE_KEYS))
 
     args, _ = parser.parse_known_args()
 
     logging.info('reading data')
-    train_df = pd.read_csv(os.path.join(args.train, args.train_file))
-    test_df = pd.read_csv(os.path.join(args.test, args.test_file))
-    
-    logging.info('building training and testing datasets')
-    X_train = train_df[args.features.split()]
-    X_test = test_df[args.features.split()]
-    y_train = train_df[args.target]
-    y_test = test_df[args.target]
+    # only the features and the target are parsed, as float32
+    features = args.features.split()
+    X_train, y_train, train_load_seconds = load_dataset(
+        os.path.join(args.train, args.train_file), features, args.target, chunk_rows=args.chunk_rows)
+    test_path = os.path.join(args.test, args.test_file)
+    # a test channel too large for the memory is streamed and its quantiles are approximated,
+    # unless --chunk-rows 0
+    stream_test = args.chunk_rows != 0 and should_chunk(test_path)
+    if not stream_test:
+        X_test, y_test, test_load_seconds = load_dataset(test_path, features, args.target, chunk_rows=args.chunk_rows)
+    load_peak_rss_mb = peak_rss_mb()
 
     region = os.environ.get('AWS_DEFAULT_REGION')
     
@@ -73,13 +78,20 @@ if __name__ =='__main__':
 
     mlflow.autolog()
 
-    with mlflow.start_run() as run:
+    # params, metrics and tags are sent in batches from a background thread
+    with mlflow.start_run() as run, BatchLogger(run.info.run_id) as batch_logger:
         params = {
             "n-estimators": args.n_estimators,
             "min-samples-leaf": args.min_samples_leaf,
             "features": args.features
         }
-        mlflow.log_params(params)
+        batch_logger.log_params(params)
+        batch_logger.log_metrics({
+            'train-load-seconds': train_load_seconds,
+            'load-peak-rss-mb': load_peak_rss_mb
+        })
+        if not stream_test:
+            batch_logger.log_metric('test-load-seconds', test_load_seconds)
 
         # TRAIN
         logging.info('training model')
@@ -91,13 +103,18 @@ if __name__ =='__main__':
 
         model.fit(X_train, y_train)
 
-        # ABS ERROR AND LOG COUPLE PERF METRICS
+        # ABS ERROR QUANTILES AND REGRESSION METRICS
         logging.info('evaluating model')
-        abs_err = np.abs(model.predict(X_test) - y_test)
-
-        for q in [10, 50, 90]:
-            logging.info(f'AE-at-{q}th-percentile: {np.percentile(a=abs_err, q=q)}')
-            mlflow.log_metric(f'AE-at-{str(q)}th-percentile', np.percentile(a=abs_err, q=q))
+        chunk_rows = args.chunk_rows or DEFAULT_CHUNK_ROWS
+        if stream_test:
+            chunks = file_chunks(test_path, features, args.target, chunk_rows)
+        else:
+            chunks = frame_chunks(X_test, y_test, chunk_rows)
+        quantiles = [int(q) for q in args.quantiles.split()]
+        eval_metrics = evaluate(model, chunks, quantiles, workers=args.eval_workers, exact=not stream_test)
+        for name, value in eval_metrics.items():
+            logging.info(f'{name}: {value}')
+        batch_logger.log_metrics(eval_metrics)
 
         # SAVE MODEL
         logging.info('saving model in MLflow')
@@ -113,51 +130,31 @@ if __name__ =='__main__':
         input_data = {}
         for item in input_data_config:
             input_data[item['ChannelName']] = item['DataSource']['S3DataSource']['S3Uri']
-        mlflow.set_tags(input_data)
+        batch_logger.set_tags(input_data)
 
         # Overwrite system tags
-        mlflow.set_tags(
+        batch_logger.set_tags(
             {
                 'mlflow.source.name': f"https://{region}.console.aws.amazon.com/sagemaker/home?region={region}#/jobs/{job_name}",
                 'mlflow.source.type': 'JOB',
                 'mlflow.user': user
             }
         )
-        # Shovel all SageMaker related data into mlflow
-        mlflow.set_tags(sm_data)
+        # Store the SageMaker related data in mlflow, see job_context.load_job_context
+        log_job_context(sm_data, batch_logger, args.job_context, args.context_tags.split())
 
     run_id = run.info.run_id
     experiment_id = experiment.experiment_id
 
-    r = mlflow.get_run(run_id=run_id)
-    print_auto_logged_info(r)
-
-    artifacts = [f.path for f in MlflowClient().list_artifacts(r.info.run_id, "model")]
+    # the run is fetched once, and mirrored to SageMaker Experiments in the background
+    snapshot = RunSnapshot.fetch(MlflowClient(), run_id)
+    snapshot.print()
 
     tracker_parameters = {
             "run_id": run_id,
             "experiment_id": experiment_id,
             "mlflow-run-url": f"{mlflow_amplify_ui}/#/experiments/{experiment_id}/runs/{run_id}"
         }
-    try:
-        with Tracker.load() as tracker:
-            tracker.log_parameters(tracker_parameters)
-            tracker.log_parameters(r.data.params)
-            for metric_name, value in r.data.metrics.items():
-                tracker.log_metric(metric_name=metric_name, value=value)
-            for artifact in artifacts:
-                tracker.log_output(name=f"MLFlow.{artifact}", value=f"{r.info.artifact_uri}/{artifact}")
-            # Nullify default SageMaker.ModelArtifact
-            tracker.log_output(name="SageMaker.ModelArtifact", value="NA")
-        print("Loaded existing tracker")
-    except:
-        print("Could not load tracker (likely running in local mode). Create a new one")
-        create_date = time.strftime("%Y-%m-%d-%H-%M-%S")
-        tracker_name = f"mlflow-tracker-{create_date}"
-        with Tracker.create(display_name=tracker_name) as tracker:
-            tracker.log_parameters(tracker_parameters)
-            tracker.log_parameters(r.data.params)
-            print("Metric cannot be logged when creating a tracker in this way")
-            for artifact in artifacts:
-                tracker.log_output(name=f"MLFlow.{artifact}", value=f"{r.info.artifact_uri}/{artifact}")
-            tracker.log_output(name="SageMaker.ModelArtifact", value="NA")
\ No newline at end of file
+    sync = ExperimentsSync(snapshot, tracker_parameters)
+    sync.start()
+    sync.join(timeout=args.sync_timeout)
@@ -1,13 +1,14 @@
-import boto3
-import os
+import argparse
+import csv
 import getpass
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
 
-cognito_client = boto3.client('cognito-idp')
-user_pools = cognito_client.list_user_pools(MaxResults=60)['UserPools']
-user_pool_id = [user_pool['Id'] for user_pool in user_pools if user_pool['Name']=='mlflow-user-pool'][0]
+USER_POOL_NAME = 'mlflow-user-pool'
+# groups known to the Lambda Authorizer (ROLE_RULES in cdk/lambda/authorizer/index.py)
 groups = ['admins', 'readers', 'model-approvers']
-list_groups = cognito_client.list_groups(UserPoolId=user_pool_id)['Groups']
-existing_group_names = [group['GroupName'] for group in list_groups]
 users_groups = [
     {
         'username': 'mlflow-admin@example.com',
@@ -22,50 +23,228 @@ users_groups = [
         'group': 'model-approvers'
     }
 ]
-list_users = cognito_client.list_users(UserPoolId=user_pool_id)['Users']
 
-existing_email_list = []
-for user in list_users:
-    attributes = user['Attributes']
-    email = [attribute['Value'] for attribute in attributes if attribute['Name']=='email'][0]
-    existing_email_list.append(email)
 
-        
+def get_cognito_client(max_attempts=10):
+    # adaptive retries back off and rate limit the client when Cognito throttles
+    # (TooManyRequestsException), which happens quickly with concurrent admin calls
+    return boto3.client('cognito-idp', config=Config(retries={'max_attempts': max_attempts, 'mode': 'adaptive'}))
+
+
+def get_user_pool_id(cognito_client, name=USER_POOL_NAME):
+    paginator = cognito_client.get_paginator('list_user_pools')
+    for page in paginator.paginate(MaxResults=60):
+        for user_pool in page['UserPools']:
+            if user_pool['Name'] == name:
+                return user_pool['Id']
+    raise Exception(f"Cognito user pool {name} not found")
+
+
+def get_existing_group_names(cognito_client, user_pool_id):
+    paginator = cognito_client.get_paginator('list_groups')
+    return {group['GroupName'] for page in paginator.paginate(UserPoolId=user_pool_id) for group in page['Groups']}
+
+
+def get_existing_users(cognito_client, user_pool_id):
+    """Returns the email -> {'username', 'status'} index of all the users in the pool."""
+    users = {}
+    paginator = cognito_client.get_paginator('list_users')
+    for page in paginator.paginate(UserPoolId=user_pool_id, AttributesToGet=['email']):
+        for user in page['Users']:
+            for attribute in user.get('Attributes', []):
+                if attribute['Name'] == 'email':
+                    users[attribute['Value']] = {'username': user['Username'], 'status': user.get('UserStatus')}
+    return users
+
+
+def get_group_members(cognito_client, user_pool_id, group_names):
+    """Returns the group -> set of usernames index of the given groups."""
+    members = {}
+    paginator = cognito_client.get_paginator('list_users_in_group')
+    for group in group_names:
+        members[group] = {user['Username']
+                          for page in paginator.paginate(UserPoolId=user_pool_id, GroupName=group)
+                          for user in page['Users']}
+    return members
+
+
+def load_users(path):
+    """Reads the users to provision from a CSV file (columns: username, groups, password) or a
+    YAML file (a list of mappings with the same keys). Several groups are separated by ';' in a
+    CSV file, and given as a list in a YAML file. The password is optional: without it, Cognito
+    emails a temporary password to the user."""
+    if path.endswith(('.yaml', '.yml')):
+        import yaml
+        with open(path) as f:
+            rows = yaml.safe_load(f)
+    else:
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    users = []
+    for row in rows:
+        user_groups = row.get('groups', row.get('group', []))
+        if isinstance(user_groups, str):
+            user_groups = [group.strip() for group in user_groups.split(';') if group.strip()]
+        users.append({
+            'username': row['username'].strip(),
+            'groups': list(user_groups),
+            'password': row.get('password') or None
+        })
+    return users
+
+
+def plan_changes(users, existing_group_names, existing_users, group_members, allow_new_groups=False):
+    """Returns the groups to create, the users to create, the (username, group) memberships to
+    add and the (username, password) passwords to set for the users that already exist.
+
+    A user whose password was never set (e.g., a previous run failed right after creating it)
+    gets the password of the file. Groups that are neither known to the Lambda Authorizer nor in
+    the pool are most likely misspelled, and are only created with allow_new_groups."""
+    wanted_groups = sorted({group for user in users for group in user['groups']})
+    unknown_groups = [group for group in wanted_groups if group not in groups and group not in existing_group_names]
+    if unknown_groups and not allow_new_groups:
+        raise ValueError(f"Unknown groups {', '.join(unknown_groups)}: the known groups are {', '.join(groups)}. "
+                         f"Fix the users file, or allow the creation of new groups")
+    groups_to_create = [group for group in wanted_groups if group not in existing_group_names]
+    users_to_create = []
+    memberships_to_add = []
+    passwords_to_set = []
+    for user in users:
+        existing = existing_users.get(user['username'])
+        if existing is None:
+            users_to_create.append(user)
+            continue
+        username = existing['username']
+        if user['password'] and existing['status'] == 'FORCE_CHANGE_PASSWORD':
+            passwords_to_set.append((username, user['password']))
+        for group in user['groups']:
+            if username not in group_members.get(group, set()):
+                memberships_to_add.append((username, group))
+    return groups_to_create, users_to_create, memberships_to_add, passwords_to_set
+
+
+def print_plan(groups_to_create, users_to_create, memberships_to_add, passwords_to_set):
+    for group in groups_to_create:
+        print(f"+ group {group}")
+    for user in users_to_create:
+        print(f"+ user {user['username']} groups={','.join(user['groups'])}"
+              f" password={'set' if user['password'] else 'temporary'}")
+    for username, password in passwords_to_set:
+        print(f"~ user {username} set password")
+    for username, group in memberships_to_add:
+        print(f"~ user {username} add to group {group}")
+    print(f"{len(groups_to_create)} groups, {len(users_to_create)} users to create, "
+          f"{len(passwords_to_set)} passwords to set, {len(memberships_to_add)} group memberships to add")
+
+
+def create_user(cognito_client, user_pool_id, user):
+    username = user['username']
+    if user['password']:
+        cognito_client.admin_create_user(
+            UserPoolId=user_pool_id,
+            Username=username,
+            MessageAction='SUPPRESS'
+        )
+        set_password(cognito_client, user_pool_id, username, user['password'])
+    else:
+        # Cognito emails a temporary password to the user
+        cognito_client.admin_create_user(
+            UserPoolId=user_pool_id,
+            Username=username
+        )
+    for group in user['groups']:
+        cognito_client.admin_add_user_to_group(
+            UserPoolId=user_pool_id,
+            Username=username,
+            GroupName=group
+        )
+    return username
+
+
+def set_password(cognito_client, user_pool_id, username, password):
+    cognito_client.admin_set_user_password(
+        UserPoolId=user_pool_id,
+        Username=username,
+        Password=password,
+        Permanent=True # does not force a user to change the password
+    )
+    return username
+
+
+def add_user_to_group(cognito_client, user_pool_id, username, group):
+    cognito_client.admin_add_user_to_group(
+        UserPoolId=user_pool_id,
+        Username=username,
+        GroupName=group
+    )
+    return username
+
+
+def bulk_provision(cognito_client, user_pool_id, users, workers=8, dry_run=False, allow_new_groups=False):
+    """Creates the missing groups and users, sets the passwords never set, and adds the existing
+    users to their groups, on a bounded thread pool. A run that failed half way is completed by
+    running it again. Returns the planned changes."""
+    existing_group_names = get_existing_group_names(cognito_client, user_pool_id)
+    existing_users = get_existing_users(cognito_client, user_pool_id)
+    wanted_groups = {group for user in users for group in user['groups']}
+    group_members = get_group_members(cognito_client, user_pool_id, wanted_groups & existing_group_names)
+    changes = plan_changes(users, existing_group_names, existing_users, group_members, allow_new_groups)
+    print_plan(*changes)
+    if dry_run:
+        return changes
+
+    groups_to_create, users_to_create, memberships_to_add, passwords_to_set = changes
+    for group in groups_to_create:
+        cognito_client.create_group(GroupName=group, UserPoolId=user_pool_id)
+    failures = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(create_user, cognito_client, user_pool_id, user) for user in users_to_create]
+        futures += [executor.submit(set_password, cognito_client, user_pool_id, username, password)
+                    for username, password in passwords_to_set]
+        futures += [executor.submit(add_user_to_group, cognito_client, user_pool_id, username, group)
+                    for username, group in memberships_to_add]
+        for future in futures:
+            try:
+                print(f"provisioned user {future.result()}")
+            except Exception as e:
+                failures += 1
+                print(f"failed: {e}")
+    if failures:
+        raise Exception(f"{failures} operations failed, run the script again to complete them")
+    return changes
+
+
 if __name__=="__main__":
-    # Create groups
-    for group in groups:
-        if group in existing_group_names:
-            print(f"group {group} already exists")
-        else:
-            print(f"create group {group} for cognito user pool {user_pool_id}")
-            cognito_client.create_group(
-                GroupName=group,
-                UserPoolId=user_pool_id
-            )
-    # Create users and associate them with a group
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users-file', type=str, help='CSV or YAML file with the users to provision in bulk')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent Cognito calls in bulk mode')
+    parser.add_argument('--dry-run', action='store_true', help='print the planned changes without applying them')
+    parser.add_argument('--user-pool-name', type=str, default=USER_POOL_NAME)
+    parser.add_argument('--allow-new-groups', action='store_true',
+                        help='create the groups of the users file that are neither known nor in the pool')
+    args = parser.parse_args()
+
+    cognito_client = get_cognito_client()
+    user_pool_id = get_user_pool_id(cognito_client, args.user_pool_name)
+
+    if args.users_file:
+        bulk_provision(cognito_client, user_pool_id, load_users(args.users_file), args.workers, args.dry_run,
+                       args.allow_new_groups)
+        raise SystemExit(0)
+
+    # Create the groups and the users, and associate each user with a group. The users whose
+    # password was never set (new ones, or left half created by a failed run) are asked for one
+    existing_users = get_existing_users(cognito_client, user_pool_id)
+    users = []
     for user_group in users_groups:
         username = user_group['username']
-        group = user_group['group']
-        if username in existing_email_list:
-            print(f"user {username} already exist. skip it")
+        existing = existing_users.get(username)
+        password = None
+        if existing is not None and existing['status'] != 'FORCE_CHANGE_PASSWORD':
+            print(f"user {username} already exist")
+        elif args.dry_run:
+            password = '<prompted>'
         else:
-            print(f"create user {username}")
-            cognito_client.admin_create_user(
-                UserPoolId=user_pool_id,
-                Username=username,
-                #TemporaryPassword=args.password
-            )
-            pwd = getpass.getpass(prompt = f"Enter the password for {username}: ")
-            cognito_client.admin_set_user_password(
-                UserPoolId=user_pool_id,
-                Username=username,
-                Password=pwd,
-                Permanent=True # does not force a user to change the password
-            )
-            
-            print(f"add user {username} to group {group}")
-            cognito_client.admin_add_user_to_group(
-                UserPoolId=user_pool_id,
-                Username=username,
-                GroupName=group
-            )
\ No newline at end of file
+            password = getpass.getpass(prompt = f"Enter the password for {username}: ")
+        users.append({'username': username, 'groups': [user_group['group']], 'password': password})
+    bulk_provision(cognito_client, user_pool_id, users, workers=1, dry_run=args.dry_run)
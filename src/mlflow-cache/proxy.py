@@ -0,0 +1,451 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Read-through caching reverse proxy for the MLflow tracking server.
+
+Runs as a sidecar of the MLflow server container: the NLB sends the requests to the proxy, which
+answers the hot read-only endpoints of the UI and of the notebooks from memory and forwards
+everything else to the server.
+
+* every cached endpoint has a TTL (per endpoint group, see CACHED_ENDPOINTS)
+* identical requests in flight are coalesced into a single request to the server, whose
+  response is shared when it is a 200
+* artifact bytes (get-artifact) are kept in a separate LRU bounded in bytes
+* a write going through the proxy (runs/create, runs/log-batch, model-versions/transition-stage,
+  ...) invalidates the cached responses it can change, before and after it is forwarded
+
+The requests reaching the proxy were already authorized by API Gateway, so the responses are
+shared by all the users. Every task has its own cache, so a write received by another task is
+only seen after the TTL: keep the TTLs of the run endpoints short. Artifacts written directly to
+S3 are not seen by the proxy either, the artifact TTL bounds how long an overwritten artifact is
+served.
+
+    MLFLOW_UPSTREAM=http://localhost:5000 PORT=5050 python proxy.py
+"""
+
+import http.client
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+UPSTREAM = os.environ.get('MLFLOW_UPSTREAM', 'http://localhost:5000')
+PORT = int(os.environ.get('PORT', 5050))
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', 180))
+
+# TTLs in seconds of the endpoint groups, 0 disables the caching of a group
+TTLS = {
+    'experiments': float(os.environ.get('EXPERIMENTS_TTL', 10)),
+    'runs': float(os.environ.get('RUNS_TTL', 5)),
+    'models': float(os.environ.get('MODELS_TTL', 30)),
+    'artifacts': float(os.environ.get('ARTIFACTS_TTL', 300)),
+}
+METADATA_CACHE_MB = float(os.environ.get('METADATA_CACHE_MB', 32))
+ARTIFACT_CACHE_MB = float(os.environ.get('ARTIFACT_CACHE_MB', 64))
+# larger artifacts are streamed through without being cached
+ARTIFACT_MAX_ENTRY_MB = float(os.environ.get('ARTIFACT_MAX_ENTRY_MB', 8))
+
+API_PREFIXES = ('/api/2.0/mlflow/', '/ajax-api/2.0/mlflow/')
+
+# (method, endpoint) -> group of the read-only endpoints that are cached
+CACHED_ENDPOINTS = {
+    ('POST', 'experiments/search'): 'experiments',
+    ('GET', 'experiments/search'): 'experiments',
+    ('GET', 'experiments/get'): 'experiments',
+    ('GET', 'experiments/get-by-name'): 'experiments',
+    ('POST', 'runs/search'): 'runs',
+    ('GET', 'runs/get'): 'runs',
+    ('GET', 'metrics/get-history'): 'runs',
+    ('GET', 'artifacts/list'): 'runs',
+    ('GET', 'registered-models/search'): 'models',
+    ('GET', 'registered-models/get'): 'models',
+    ('GET', 'registered-models/alias'): 'models',
+    ('GET', 'registered-models/get-latest-versions'): 'models',
+    ('POST', 'registered-models/get-latest-versions'): 'models',
+    ('GET', 'model-versions/search'): 'models',
+    ('GET', 'model-versions/get'): 'models',
+    ('GET', 'model-versions/get-download-uri'): 'models',
+}
+ARTIFACT_PATHS = ('/get-artifact', '/model-versions/get-artifact')
+
+# response headers kept in the cache and hop-by-hop headers that are not forwarded
+CACHED_HEADERS = ('content-type', 'content-disposition', 'content-encoding', 'cache-control', 'last-modified', 'etag')
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+                      'transfer-encoding', 'upgrade', 'host', 'content-length'}
+
+ALL = '*'
+# methods that can be sent twice without changing the result
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class CachedResponse(object):
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class ResponseCache(object):
+    """LRU cache of responses bounded in bytes, whose entries expire after the TTL of their group
+    and can be invalidated by tag. Every tag has a generation, bumped by an invalidation: a
+    response is only stored if none of its tags was invalidated since the request started."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (expires, tags, response)
+        self._tagged = {}  # tag -> keys
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() > entry[0]:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def generations(self, tags):
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags + (ALL,))
+
+    def put(self, key, tags, response, ttl, generations):
+        size = len(response.body)
+        with self._lock:
+            if generations != tuple(self._generations.get(tag, 0) for tag in tags + (ALL,)):
+                return False
+            if size > self.max_bytes:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, tags, response)
+            self.size += size
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def _remove(self, key):
+        _, tags, response = self._entries.pop(key)
+        self.size -= len(response.body)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def invalidate(self, tags):
+        """Drops the entries with any of the tags, ALL drops every entry."""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                keys = list(self._entries) if tag == ALL else list(self._tagged.get(tag, ()))
+                for key in keys:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+class Inflight(object):
+    """Coalesces identical requests: the first one (the leader) is sent to the server, the others
+    wait for its response, which they share if it is a 200."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """Returns (call, is_leader)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = {'done': threading.Event(), 'response': None, 'error': None}
+            return call, True
+
+    def shared(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def finish(self, key, call, response=None, error=None):
+        with self._lock:
+            del self._calls[key]
+        call['response'], call['error'] = response, error
+        call['done'].set()
+
+
+def endpoint_of(path):
+    for prefix in API_PREFIXES:
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return None
+
+
+def query_run_id(query):
+    values = query.get('run_id') or query.get('run_uuid')
+    return values[0] if values else None
+
+
+def entry_tags(group, query):
+    """Tags of a cached response: a response about a single run is only invalidated by the
+    writes to that run."""
+    if group == 'runs':
+        run_id = query_run_id(query)
+        return (f'run:{run_id}',) if run_id else ('runs',)
+    return (group,)
+
+
+def write_tags(endpoint, body):
+    """Tags of the cached responses a write to the endpoint can change."""
+    if endpoint is None:
+        return (ALL,)
+    if endpoint.startswith('runs/'):
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            payload = {}
+        run_id = payload.get('run_id') or payload.get('run_uuid') if isinstance(payload, dict) else None
+        # runs/create has no run yet, only the searches can change
+        return ('runs', f'run:{run_id}') if run_id else ('runs',)
+    if endpoint.startswith('experiments/'):
+        # deleting or restoring an experiment changes the runs that are searched
+        return ('experiments', 'runs')
+    if endpoint.startswith(('registered-models/', 'model-versions/')):
+        return ('models',)
+    return (ALL,)
+
+
+class Upstream(object):
+    """Keep-alive connections to the MLflow server, one per thread."""
+
+    def __init__(self, base_url, timeout):
+        url = urllib.parse.urlsplit(base_url)
+        self.netloc = url.netloc
+        self.https = url.scheme == 'https'
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            connection = self._local.connection = connection_class(self.netloc, timeout=self.timeout)
+        return connection
+
+    def _discard(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def request(self, method, path, body, headers, idempotent=None):
+        """Returns the http.client response, the caller reads it.
+
+        The request is sent again on a new connection only when a reused keep-alive connection
+        was closed by the server: when sending fails, or after the request was sent if it is
+        idempotent (the method, or idempotent=True for the read-only POST endpoints). A timeout
+        is never retried, the server may still apply the request."""
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        for attempt in range(2):
+            connection = self._connection()
+            reused = connection.sock is not None
+            sent = False
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                sent = True
+                return connection.getresponse()
+            except Exception as e:
+                self._discard()
+                # RemoteDisconnected is a ConnectionResetError
+                stale = reused and isinstance(e, (BrokenPipeError, ConnectionResetError))
+                if attempt or not stale or (sent and not idempotent):
+                    raise
+
+
+metadata_cache = ResponseCache(int(METADATA_CACHE_MB * 1024 * 1024))
+artifact_cache = ResponseCache(int(ARTIFACT_CACHE_MB * 1024 * 1024))
+inflight = Inflight()
+upstream = Upstream(UPSTREAM, UPSTREAM_TIMEOUT)
+
+
+def stats():
+    return {'metadata': metadata_cache.stats(), 'artifacts': artifact_cache.stats(), 'coalesced': inflight.coalesced}
+
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are separate writes, without it every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            return self.rfile.read(length)
+        if 'chunked' in self.headers.get('Transfer-Encoding', ''):
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return b''
+
+    def _forward_headers(self):
+        return {key: value for key, value in self.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+
+    def _send(self, response, cache_status):
+        self.send_response(response.status)
+        for key, value in response.headers:
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(response.body)))
+        self.send_header('X-Cache', cache_status)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(response.body)
+
+    def _stream(self, upstream_response):
+        """Sends an upstream response to the client while reading it."""
+        self.send_response(upstream_response.status)
+        length = upstream_response.getheader('Content-Length')
+        for key, value in upstream_response.getheaders():
+            if key.lower() not in HOP_BY_HOP_HEADERS:
+                self.send_header(key, value)
+        if length is None:
+            body = upstream_response.read()
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-Cache', 'BYPASS')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_header('Content-Length', length)
+        self.send_header('X-Cache', 'BYPASS')
+        self.end_headers()
+        while True:
+            chunk = upstream_response.read(64 * 1024)
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+
+    def _fetch(self, body, max_bytes):
+        """Returns the upstream response as a CachedResponse, or the unread http.client response
+        if it is larger than max_bytes."""
+        # only the read-only endpoints are fetched
+        upstream_response = upstream.request(self.command, self.path, body, self._forward_headers(), idempotent=True)
+        length = upstream_response.getheader('Content-Length')
+        if length is not None and int(length) > max_bytes:
+            return upstream_response
+        headers = [(key, value) for key, value in upstream_response.getheaders() if key.lower() in CACHED_HEADERS]
+        return CachedResponse(upstream_response.status, headers, upstream_response.read())
+
+    def _cached(self, cache, key, tags, ttl, body, max_bytes):
+        response = cache.get(key)
+        if response is not None:
+            self._send(response, 'HIT')
+            return
+        call, leader = inflight.join(key)
+        if not leader:
+            call['done'].wait()
+            response = call['response']
+            if isinstance(response, CachedResponse) and response.status == 200:
+                inflight.shared()
+                self._send(response, 'COALESCED')
+                return
+            # the leader failed, got an error or streamed a large response: send our own request
+            call = None
+        generations = cache.generations(tags)
+        try:
+            response = self._fetch(body, max_bytes)
+        except Exception as e:
+            if call is not None:
+                inflight.finish(key, call, error=e)
+            raise
+        if call is not None:
+            inflight.finish(key, call, response)
+        if not isinstance(response, CachedResponse):
+            self._stream(response)
+            return
+        if response.status == 200:
+            cache.put(key, tags, response, ttl, generations)
+        self._send(response, 'MISS')
+
+    def _forward(self, body, tags=()):
+        if tags:
+            metadata_cache.invalidate(tags)
+        upstream_response = upstream.request(self.command, self.path, body, self._forward_headers())
+        self._stream(upstream_response)
+        if tags:
+            # the reads that started while the write was in progress may have stored stale data
+            metadata_cache.invalidate(tags)
+
+    def _handle(self):
+        try:
+            body = self._read_body()
+            url = urllib.parse.urlsplit(self.path)
+            if url.path == '/cache/stats':
+                payload = json.dumps(stats()).encode()
+                self._send(CachedResponse(200, [('Content-Type', 'application/json')], payload), 'BYPASS')
+                return
+            query = urllib.parse.parse_qs(url.query)
+            canonical_query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(url.query)))
+            key = (self.command, url.path, canonical_query, body)
+            endpoint = endpoint_of(url.path)
+            group = CACHED_ENDPOINTS.get((self.command, endpoint))
+            if group is not None and TTLS[group] > 0:
+                self._cached(metadata_cache, key, entry_tags(group, query), TTLS[group], body, metadata_cache.max_bytes)
+            elif self.command == 'GET' and url.path in ARTIFACT_PATHS and TTLS['artifacts'] > 0:
+                self._cached(artifact_cache, key, ('artifacts',), TTLS['artifacts'], body,
+                             int(ARTIFACT_MAX_ENTRY_MB * 1024 * 1024))
+            elif self.command in ('GET', 'HEAD', 'OPTIONS'):
+                self._forward(body)
+            else:
+                self._forward(body, write_tags(endpoint, body))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            logging.exception(f'{self.command} {self.path} failed')
+            self.close_connection = True
+            try:
+                self.send_error(502, f'MLflow server error: {e}')
+            except OSError:
+                pass
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _handle
+
+
+class ProxyServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+    server = ProxyServer(('0.0.0.0', PORT), ProxyHandler)
+    logging.info(f"caching proxy on port {PORT} for {UPSTREAM}, TTLs {TTLS}, metadata cache {METADATA_CACHE_MB}MiB,"
+                 f" artifact cache {ARTIFACT_CACHE_MB}MiB")
+    server.serve_forever()
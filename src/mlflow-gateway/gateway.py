@@ -0,0 +1,349 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Starts the MLflow deployments gateway behind a layer that protects the providers.
+
+The layer wraps the ASGI app of `mlflow deployments start-server` and handles the invocations of
+the endpoints (/endpoints/<name>/invocations and /gateway/<name>/invocations):
+
+* deterministic requests (temperature 0, not streamed) are answered from an exact-match response
+  cache, keyed on the endpoint and the canonical JSON of the payload
+* identical deterministic requests in flight are coalesced into a single provider call, whose
+  response is shared when it is a 200
+* every endpoint has a concurrency limit and a bounded queue: the requests over the limit wait in
+  the queue, and are rejected with 429 when the queue is full or after QUEUE_TIMEOUT seconds,
+  instead of piling up on the provider and being throttled there
+
+The X-Cache response header tells how a request was served (HIT, MISS, COALESCED or BYPASS), a
+`Cache-Control: no-cache` request header skips the cache lookup. GET /gateway-stats returns the
+cache and queue metrics of the worker process, which are also logged every STATS_INTERVAL seconds.
+Every gunicorn worker has its own cache, and the concurrency limit of the task is split between
+the workers.
+
+    python gateway.py                                           # config.yaml, WORKERS workers
+    CONFIG_PATH=config.mock.yaml python gateway.py --workers 1  # with mock_provider.py
+"""
+
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+
+# exact-match response cache of the worker, 0 disables it
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 600))
+CACHE_MAX_MB = float(os.environ.get('CACHE_MAX_MB', 64))
+# provider calls in flight per endpoint for the task, and requests waiting for one of them
+MAX_CONCURRENCY = int(os.environ.get('MAX_CONCURRENCY', 8))
+MAX_QUEUE = int(os.environ.get('MAX_QUEUE', 64))
+QUEUE_TIMEOUT = float(os.environ.get('QUEUE_TIMEOUT', 30))
+# per endpoint overrides, e.g. {"completions": {"concurrency": 4, "queue": 16, "cache_ttl": 0}}
+ENDPOINT_LIMITS = json.loads(os.environ.get('ENDPOINT_LIMITS', '{}'))
+WORKERS = int(os.environ.get('WORKERS', 1))
+STATS_INTERVAL = float(os.environ.get('STATS_INTERVAL', 60))
+
+STATS_PATH = '/gateway-stats'
+INVOCATIONS = re.compile(r'^/(?:endpoints|gateway)/([^/]+)/invocations/?$')
+
+logger = logging.getLogger('gateway')
+
+
+class CachedResponse(object):
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class ResponseCache(object):
+    """LRU cache of responses bounded in bytes, whose entries expire after their TTL."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires, response)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() > entry[0]:
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, response, ttl):
+        size = len(response.body)
+        if ttl <= 0 or size > self.max_bytes:
+            return False
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, response)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return True
+
+    def _remove(self, key):
+        _, response = self._entries.pop(key)
+        self.size -= len(response.body)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0, 'evictions': self.evictions}
+
+
+class EndpointLimiter(object):
+    """Concurrency limit of an endpoint, with a bounded FIFO queue of the requests waiting."""
+
+    def __init__(self, concurrency, max_queue, timeout):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waits = collections.deque(maxlen=1000)
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def acquire(self):
+        """Returns False if the request is rejected, the caller must release() otherwise."""
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            return False
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return False
+        finally:
+            self.queued -= 1
+            self._waits.append(time.monotonic() - start)
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def percentile(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 2) if waits else 0.0
+
+        return {'concurrency': self.concurrency, 'max_queue': self.max_queue, 'in_flight': self.in_flight,
+                'queued': self.queued, 'max_queued': self.max_queued, 'admitted': self.admitted,
+                'rejected': self.rejected, 'timed_out': self.timed_out,
+                'queue_wait_p50_ms': percentile(0.5), 'queue_wait_p95_ms': percentile(0.95)}
+
+
+def endpoint_settings(name, workers=WORKERS):
+    """Returns (concurrency, max queue, cache TTL) of an endpoint in a worker process."""
+    settings = ENDPOINT_LIMITS.get(name, {})
+    concurrency = max(1, int(settings.get('concurrency', MAX_CONCURRENCY)) // max(1, workers))
+    max_queue = max(0, int(settings.get('queue', MAX_QUEUE)) // max(1, workers))
+    return concurrency, max_queue, float(settings.get('cache_ttl', CACHE_TTL))
+
+
+def cache_key(endpoint, payload):
+    """Returns the key of a deterministic request, None if its response must not be reused."""
+    if not isinstance(payload, dict) or payload.get('stream'):
+        return None
+    # temperature defaults to 0 in the request schemas of the gateway
+    try:
+        if float(payload.get('temperature') or 0) != 0:
+            return None
+    except (TypeError, ValueError):
+        return None
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{endpoint}\n{canonical}".encode()).hexdigest()
+
+
+def with_header(headers, name, value):
+    return [(k, v) for k, v in headers if k.lower() != name] + [(name, value)]
+
+
+async def send_response(send, response, cache_status):
+    await send({'type': 'http.response.start', 'status': response.status,
+                'headers': with_header(response.headers, b'x-cache', cache_status)})
+    await send({'type': 'http.response.body', 'body': response.body})
+
+
+def json_response(status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    return CachedResponse(status, [(b'content-type', b'application/json'),
+                                   (b'content-length', str(len(body)).encode())] + list(headers), body)
+
+
+class GatewayLayer(object):
+    """ASGI middleware adding the response cache, the coalescing and the limits to the gateway."""
+
+    def __init__(self, app, workers=WORKERS):
+        self.app = app
+        self.workers = workers
+        self.cache = ResponseCache(int(CACHE_MAX_MB * 1024 * 1024))
+        self.limiters = {}
+        self.inflight = {}  # cache key -> future of the response
+        self.coalesced = 0
+        self.bypassed = 0
+        self._reporter = None
+
+    def limiter(self, endpoint):
+        if endpoint not in self.limiters:
+            concurrency, max_queue, _ = endpoint_settings(endpoint, self.workers)
+            self.limiters[endpoint] = EndpointLimiter(concurrency, max_queue, QUEUE_TIMEOUT)
+        return self.limiters[endpoint]
+
+    def stats(self):
+        cache = self.cache.stats()
+        cache.update({'coalesced': self.coalesced, 'bypassed': self.bypassed, 'in_flight_keys': len(self.inflight)})
+        return {'pid': os.getpid(), 'cache': cache,
+                'endpoints': {name: limiter.stats() for name, limiter in self.limiters.items()}}
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            logger.info("gateway stats %s", json.dumps(self.stats()))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self._reporter is None and STATS_INTERVAL > 0:
+            self._reporter = asyncio.ensure_future(self._report())
+        if scope['path'] == STATS_PATH and scope['method'] == 'GET':
+            return await send_response(send, json_response(200, self.stats()), b'BYPASS')
+        match = INVOCATIONS.match(scope['path'])
+        if scope['method'] != 'POST' or not match or self.app.get_dynamic_route(match.group(1)) is None:
+            return await self.app(scope, receive, send)
+        await self._invoke(match.group(1), scope, receive, send)
+
+    async def _invoke(self, endpoint, scope, receive, send):
+        body = await read_body(receive)
+        try:
+            key = cache_key(endpoint, json.loads(body))
+        except ValueError:
+            key = None
+        ttl = endpoint_settings(endpoint, self.workers)[2]
+        if key is None or ttl <= 0:
+            self.bypassed += 1
+            return await self._call(endpoint, scope, body, receive, send, b'BYPASS')
+
+        no_cache = b'no-cache' in dict(scope['headers']).get(b'cache-control', b'')
+        if not no_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return await send_response(send, cached, b'HIT')
+            leader = self.inflight.get(key)
+            if leader is not None:
+                response = await asyncio.shield(leader)
+                if response is not None:
+                    self.coalesced += 1
+                    return await send_response(send, response, b'COALESCED')
+                # the leader got a 429 or an error, which is not shared: the follower sends its own
+                # request, without becoming a leader
+                await self._call_and_cache(endpoint, scope, body, receive, send, key, ttl)
+                return
+
+        future = asyncio.get_running_loop().create_future()
+        if not no_cache:
+            self.inflight[key] = future
+        response = None
+        try:
+            response = await self._call_and_cache(endpoint, scope, body, receive, send, key, ttl)
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+            # only a 200 is shared with the followers
+            future.set_result(response if response is not None and response.status == 200 else None)
+
+    async def _call_and_cache(self, endpoint, scope, body, receive, send, key, ttl):
+        response = await self._call(endpoint, scope, body, receive, send, b'MISS', capture=True)
+        if response is not None and response.status == 200:
+            self.cache.put(key, response, ttl)
+        return response
+
+    async def _call(self, endpoint, scope, body, receive, send, cache_status, capture=False):
+        """Calls the gateway app within the limits of the endpoint, returns the response if captured."""
+        limiter = self.limiter(endpoint)
+        if not await limiter.acquire():
+            rejected = json_response(429, {'detail': f"Too many requests queued for the endpoint '{endpoint}'"},
+                                     [(b'retry-after', b'1')])
+            await send_response(send, rejected, cache_status)
+            return rejected if capture else None
+        status, headers, chunks = None, [], []
+
+        async def replay_receive():
+            nonlocal body
+            if body is not None:
+                message, body = {'type': 'http.request', 'body': body, 'more_body': False}, None
+                return message
+            return await receive()
+
+        async def capture_send(message):
+            nonlocal status, headers
+            if message['type'] == 'http.response.start':
+                status, headers = message['status'], list(message.get('headers', []))
+                message = dict(message, headers=with_header(headers, b'x-cache', cache_status))
+            elif message['type'] == 'http.response.body' and capture:
+                chunks.append(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            limiter.release()
+        return CachedResponse(status, headers, b''.join(chunks)) if capture and status is not None else None
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def create_app():
+    """gunicorn app factory: the gateway app of the config in MLFLOW_DEPLOYMENTS_CONFIG, wrapped."""
+    from mlflow.deployments.server.app import create_app_from_env
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    return GatewayLayer(create_app_from_env())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config-path', type=str, default=os.environ.get('CONFIG_PATH', 'config.yaml'))
+    parser.add_argument('--host', type=str, default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5001)))
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    # the same server as mlflow deployments start-server, with the app wrapped
+    os.environ['MLFLOW_DEPLOYMENTS_CONFIG'] = os.path.abspath(args.config_path)
+    os.environ['WORKERS'] = str(args.workers)
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f"{args.host}:{args.port}",
+               '--workers', str(args.workers), '--worker-class', 'uvicorn.workers.UvicornWorker',
+               '--chdir', os.path.dirname(os.path.abspath(__file__)), 'gateway:create_app()']
+    os.execv(command[0], command)
@@ -0,0 +1,176 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Local stand-in for Bedrock, to run the gateway without AWS credentials nor model costs.
+
+Serves the OpenAI chat completions and embeddings APIs, which the `openai` provider of the
+gateway calls (see config.mock.yaml), with a latency per request drawn from a profile: fixed,
+uniform (median +/- spread * median) or lognormal (median and sigma = spread). Like Bedrock, it
+throttles the requests over its concurrency quota with a 429. The answers are derived from the
+prompt, so identical temperature 0 prompts get identical answers. GET /stats returns the requests
+served, the requests throttled and the highest concurrency seen.
+
+    python mock_provider.py --port 8088 --latency-ms 200 --latency-profile lognormal --max-concurrency 16
+"""
+
+import argparse
+import hashlib
+import http.server
+import json
+import math
+import os
+import random
+import threading
+import time
+
+# median latency of a completion, and of an embedding, in ms
+LATENCY_MS = float(os.environ.get('MOCK_LATENCY_MS', 200))
+LATENCY_PROFILES = ('fixed', 'uniform', 'lognormal')
+LATENCY_PROFILE = os.environ.get('MOCK_LATENCY_PROFILE', 'fixed')
+LATENCY_SPREAD = float(os.environ.get('MOCK_LATENCY_SPREAD', 0.5))
+# requests in flight above which the mock answers 429, 0 for no quota
+MAX_CONCURRENCY = int(os.environ.get('MOCK_MAX_CONCURRENCY', 0))
+
+
+class ProviderStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def enter(self, max_concurrency):
+        with self._lock:
+            if max_concurrency and self.in_flight >= max_concurrency:
+                self.throttled += 1
+                return False
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.throttled = self.max_in_flight = 0
+
+    def as_dict(self):
+        return {'requests': self.requests, 'throttled': self.throttled, 'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight}
+
+
+def sample_latency(profile, median_ms, spread):
+    """Returns a latency in seconds."""
+    if profile == 'uniform':
+        latency = random.uniform(median_ms * (1 - spread), median_ms * (1 + spread))
+    elif profile == 'lognormal':
+        latency = random.lognormvariate(math.log(median_ms), spread)
+    else:
+        latency = median_ms
+    return max(0.0, latency) / 1000
+
+
+def completion_text(messages, temperature):
+    seed = json.dumps(messages, sort_keys=True)
+    if temperature:
+        seed += f"-{random.random()}"
+    return f"mock answer {hashlib.sha256(seed.encode()).hexdigest()[:24]}"
+
+
+def chat_completion(payload):
+    text = completion_text(payload.get('messages', []), payload.get('temperature', 0))
+    prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in payload.get('messages', []))
+    completion_tokens = len(text.split())
+    return {
+        'id': f"chatcmpl-{int(time.time() * 1000)}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': payload.get('model', 'mock'),
+        'choices': [{'index': i, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}
+                    for i in range(payload.get('n', 1))],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                  'total_tokens': prompt_tokens + completion_tokens},
+    }
+
+
+def embeddings(payload):
+    inputs = payload.get('input', [])
+    inputs = [inputs] if isinstance(inputs, str) else inputs
+    data = []
+    for i, text in enumerate(inputs):
+        digest = hashlib.sha256(text.encode()).digest()
+        data.append({'object': 'embedding', 'index': i, 'embedding': [b / 255 for b in digest[:16]]})
+    tokens = sum(len(text.split()) for text in inputs)
+    return {'object': 'list', 'data': data, 'model': payload.get('model', 'mock'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}}
+
+
+class MockProviderHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are separate writes, without it every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    stats = ProviderStats()
+    latency_ms = LATENCY_MS
+    latency_profile = LATENCY_PROFILE
+    latency_spread = LATENCY_SPREAD
+    max_concurrency = MAX_CONCURRENCY
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            return self._send(200, self.stats.as_dict())
+        self._send(404, {'error': {'message': f"{self.path} not found"}})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path == '/stats/reset':
+            self.stats.reset()
+            return self._send(200, self.stats.as_dict())
+        handler = {'/v1/chat/completions': chat_completion, '/v1/embeddings': embeddings}.get(self.path)
+        if handler is None:
+            return self._send(404, {'error': {'message': f"{self.path} not found"}})
+        if not self.stats.enter(self.max_concurrency):
+            return self._send(429, {'error': {'message': 'ThrottlingException: Too many requests, please wait '
+                                                         'before trying again.'}})
+        try:
+            time.sleep(sample_latency(self.latency_profile, self.latency_ms, self.latency_spread))
+            self._send(200, handler(payload))
+        finally:
+            self.stats.leave()
+
+
+class MockProviderServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--latency-ms', type=float, default=LATENCY_MS)
+    parser.add_argument('--latency-profile', type=str, default=LATENCY_PROFILE, choices=LATENCY_PROFILES)
+    parser.add_argument('--latency-spread', type=float, default=LATENCY_SPREAD)
+    parser.add_argument('--max-concurrency', type=int, default=MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    MockProviderHandler.latency_ms = args.latency_ms
+    MockProviderHandler.latency_profile = args.latency_profile
+    MockProviderHandler.latency_spread = args.latency_spread
+    MockProviderHandler.max_concurrency = args.max_concurrency
+    print(f"mock provider on http://{args.host}:{args.port}/v1", flush=True)
+    MockProviderServer((args.host, args.port), MockProviderHandler).serve_forever()
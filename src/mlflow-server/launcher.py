@@ -0,0 +1,176 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Starts the MLflow tracking server with gunicorn and database pool sizes derived from the CPU
+and memory limits of the container, read from cgroup v2 or v1, or from the ECS task metadata
+when the cgroup of the container has no limit (Fargate enforces the limits of the task).
+
+    python launcher.py              # print the configuration and exec mlflow server
+    python launcher.py --print-only # only print the configuration
+
+Every derived value can be overridden with an environment variable (see below).
+"""
+
+import argparse
+import json
+import math
+import os
+import urllib.request
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# memory of an MLflow worker process after fork, and memory kept for the gunicorn arbiter
+WORKER_MEMORY_MB = int(os.environ.get('WORKER_MEMORY_MB', 200))
+RESERVED_MEMORY_MB = int(os.environ.get('RESERVED_MEMORY_MB', 256))
+# gthread threads per vCPU, the server mostly waits on the database and S3
+THREADS_PER_CPU = int(os.environ.get('THREADS_PER_CPU', 16))
+MAX_THREADS = int(os.environ.get('MAX_THREADS', 16))
+# Postgres connections this task may open, shared by all the workers
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 15))
+# the tracking and the model registry stores each have their own SQLAlchemy engine
+ENGINES_PER_WORKER = 2
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info')
+GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT', 180))
+
+
+def read_file(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def ecs_task_limits():
+    """Returns the {'CPU': vCPUs, 'Memory': MiB} limits of the ECS task, or an empty dict."""
+    metadata_uri = os.environ.get('ECS_CONTAINER_METADATA_URI_V4')
+    if not metadata_uri:
+        return {}
+    try:
+        with urllib.request.urlopen(f"{metadata_uri}/task", timeout=1) as response:
+            return json.load(response).get('Limits', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def cpu_limit(root=CGROUP_ROOT, task_limits=None):
+    """Returns the number of CPUs the container may use, possibly fractional."""
+    task_limits = task_limits or {}
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    value = read_file(os.path.join(root, 'cpu.max'))
+    if value:
+        quota, period = value.split()
+        if quota != 'max':
+            return int(quota) / int(period)
+    # cgroup v1, -1 is unlimited
+    for directory in ('cpu', 'cpu,cpuacct'):
+        quota = read_file(os.path.join(root, directory, 'cpu.cfs_quota_us'))
+        period = read_file(os.path.join(root, directory, 'cpu.cfs_period_us'))
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    if task_limits.get('CPU'):
+        return float(task_limits['CPU'])
+    return float(len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1)
+
+
+def memory_limit_mb(root=CGROUP_ROOT, task_limits=None, meminfo_path='/proc/meminfo'):
+    """Returns the memory the container may use in MiB."""
+    task_limits = task_limits or {}
+    total = None
+    for line in (read_file(meminfo_path) or '').splitlines():
+        if line.startswith('MemTotal:'):
+            total = int(line.split()[1]) // 1024
+    for path in ('memory.max', os.path.join('memory', 'memory.limit_in_bytes')):
+        value = read_file(os.path.join(root, path))
+        # cgroup v1 reports a huge number when unlimited
+        if value and value != 'max' and int(value) < 1 << 60:
+            limit = int(value) // (1024 * 1024)
+            return min(limit, total) if total else limit
+    if task_limits.get('Memory'):
+        return int(task_limits['Memory'])
+    return total or 1024
+
+
+def derive_config(cpus, memory_mb, db_max_connections=DB_MAX_CONNECTIONS, env=os.environ):
+    """Returns the gunicorn and SQLAlchemy settings for the given CPU and memory limits.
+
+    Every engine of a worker needs a pool of at least one connection and an overflow of at least
+    one, so the workers are capped to keep workers * ENGINES_PER_WORKER * (pool_size +
+    max_overflow) within db_max_connections."""
+    min_connections = ENGINES_PER_WORKER * 2
+    if db_max_connections < min_connections:
+        raise ValueError(f"DB_MAX_CONNECTIONS must be at least {min_connections}, got {db_max_connections}")
+    # 2 * CPUs + 1 workers, as many as the memory and the database connections allow
+    by_cpu = int(2 * cpus) + 1
+    by_memory = max(1, (memory_mb - RESERVED_MEMORY_MB) // WORKER_MEMORY_MB)
+    by_connections = db_max_connections // min_connections
+    workers = int(env.get('WORKERS', max(1, min(by_cpu, by_memory, by_connections))))
+    if workers > by_connections:
+        raise ValueError(f"{workers} workers need {workers * min_connections} database connections, "
+                         f"DB_MAX_CONNECTIONS is {db_max_connections}")
+    # a thread holds at most one connection of each engine, there are no more threads than
+    # connections so that a request never waits for the pool
+    per_engine = db_max_connections // (workers * ENGINES_PER_WORKER)
+    threads = int(env.get('THREADS', max(2, min(MAX_THREADS, round(THREADS_PER_CPU * cpus / workers), per_engine))))
+    if threads > per_engine:
+        raise ValueError(f"{threads} threads need {threads} database connections per engine, "
+                         f"{workers} workers of DB_MAX_CONNECTIONS={db_max_connections} allow {per_engine}")
+    connections = max(2, min(threads, per_engine))
+    pool_size = int(env.get('MLFLOW_SQLALCHEMYSTORE_POOL_SIZE', math.ceil(connections / 2)))
+    # mlflow ignores a max overflow of 0, which would fall back to the SQLAlchemy default of 10
+    max_overflow = int(env.get('MLFLOW_SQLALCHEMYSTORE_MAX_OVERFLOW', max(1, connections - pool_size)))
+    if pool_size < 1 or max_overflow < 1:
+        raise ValueError(f"The pool size and the max overflow must be at least 1, got {pool_size} and {max_overflow}")
+    if pool_size + max_overflow > per_engine:
+        raise ValueError(f"A pool of {pool_size} + {max_overflow} connections per engine exceeds the {per_engine} "
+                         f"that {workers} workers of DB_MAX_CONNECTIONS={db_max_connections} allow")
+    return {
+        'cpus': cpus,
+        'memory_mb': memory_mb,
+        'workers': workers,
+        'threads': threads,
+        'timeout': GUNICORN_TIMEOUT,
+        'log_level': LOG_LEVEL,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+    }
+
+
+def gunicorn_opts(config):
+    # the app is loaded before forking, so that the workers share its memory; the database
+    # engines are created on the first request, in each worker. The number of workers is given
+    # to mlflow server with --workers: mlflow appends "-w 4" to the gunicorn options otherwise,
+    # which overrides a --workers option there
+    return (f"--preload --log-level {config['log_level']} --timeout {config['timeout']} "
+            f"--threads={config['threads']} --worker-class=gthread")
+
+
+def server_command(config, env=os.environ):
+    backend_store_uri = (f"postgresql+psycopg2://{env['USERNAME']}:{env['PASSWORD']}"
+                         f"@{env['DBHOST']}:{env['DBPORT']}/{env['DATABASE']}")
+    return [
+        'mlflow', 'server',
+        '--host', '0.0.0.0',
+        '--port', env.get('PORT', '5000'),
+        '--default-artifact-root', env['BUCKET'],
+        '--workers', str(config['workers']),
+        '--gunicorn-opts', gunicorn_opts(config),
+        '--backend-store-uri', backend_store_uri,
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--print-only', action='store_true', help='print the configuration without starting the server')
+    parser.add_argument('--cgroup-root', type=str, default=CGROUP_ROOT)
+    args = parser.parse_args()
+
+    task_limits = ecs_task_limits()
+    config = derive_config(cpu_limit(args.cgroup_root, task_limits), memory_limit_mb(args.cgroup_root, task_limits))
+    print(f"mlflow server configuration: {json.dumps(config)}", flush=True)
+    if args.print_only:
+        raise SystemExit(0)
+
+    os.environ['MLFLOW_SQLALCHEMYSTORE_POOL_SIZE'] = str(config['pool_size'])
+    os.environ['MLFLOW_SQLALCHEMYSTORE_MAX_OVERFLOW'] = str(config['max_overflow'])
+    command = server_command(config)
+    os.execvp(command[0], command)
@@ -0,0 +1,148 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Local stand-ins for Cognito used by the authorizer tests and benchmarks: an RSA signing key,
+a matching JWKS document and synthetic ID tokens."""
+
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+AUTHORIZER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cdk', 'lambda', 'authorizer')
+REGION = 'us-west-2'
+ACCOUNT = '123456789012'
+REST_API_ID = 'abcdef1234'
+STAGE = 'prod'
+APP_CLIENT_ID = 'local-app-client'
+
+
+class LocalIssuer(object):
+    """Signs ID tokens the same way a Cognito User Pool does (RS256, 'kid' header)."""
+
+    def __init__(self, kid=None):
+        self.public_jwk = None
+        self.retired_jwks = []
+        self.rotate(kid)
+
+    def rotate(self, kid=None):
+        """Signs with a new key. The JWKS keeps the previous public keys, so that the tokens
+        signed before the rotation can still be verified."""
+        if self.public_jwk is not None:
+            self.retired_jwks.insert(0, self.public_jwk)
+        self.kid = kid or uuid.uuid4().hex
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = self.private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        public_pem = self.private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.public_jwk = jwk.construct(public_pem, 'RS256').to_dict()
+        self.public_jwk['kid'] = self.kid
+        self.public_jwk['use'] = 'sig'
+        # python-jose returns bytes for some versions
+        self.public_jwk = {k: v.decode('utf-8') if isinstance(v, bytes) else v for k, v in self.public_jwk.items()}
+
+    def jwks(self):
+        return {'keys': [self.public_jwk] + self.retired_jwks}
+
+    def write_jwks(self, path=None):
+        """Writes the JWKS document to a file and returns a file:// URL pointing to it."""
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='-jwks.json')
+            os.close(fd)
+        with open(path, 'w') as f:
+            json.dump(self.jwks(), f)
+        return f"file://{path}"
+
+    def serve_jwks(self):
+        """Serves the JWKS document over HTTP on a local port, like the Cognito
+        /.well-known/jwks.json endpoint. Returns the URL and the server, which counts the
+        requests in `fetches` and answers them with `status` after `latency` seconds."""
+        issuer = self
+
+        class JwksHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server = self.server
+                with server.lock:
+                    server.fetches += 1
+                time.sleep(server.latency)
+                # the current keys, after any rotation
+                body = json.dumps(issuer.jwks()).encode('utf-8')
+                self.send_response(server.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), JwksHandler)
+        server.daemon_threads = True
+        server.fetches = 0
+        server.status = 200
+        server.latency = 0
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_address[1]}/.well-known/jwks.json", server
+
+    def sign(self, username, groups, audience=APP_CLIENT_ID, ttl=3600, **extra_claims):
+        now = int(time.time())
+        claims = {
+            'sub': str(uuid.uuid4()),
+            'aud': audience,
+            'token_use': 'id',
+            'auth_time': now,
+            'iat': now,
+            'exp': now + ttl,
+            'cognito:username': username,
+            'cognito:groups': list(groups),
+        }
+        claims.update(extra_claims)
+        return jwt.encode(claims, self.private_pem, algorithm='RS256', headers={'kid': self.kid})
+
+
+def load_authorizer(keys_url, **env):
+    """Imports (or re-imports) the authorizer Lambda module configured against a local JWKS."""
+    os.environ.update({
+        'REGION': REGION,
+        'APP_CLIENT_ID': APP_CLIENT_ID,
+        'COGNITO_KEYS_URL': keys_url,
+    })
+    os.environ.update({k: str(v) for k, v in env.items()})
+    if AUTHORIZER_DIR not in sys.path:
+        sys.path.insert(0, AUTHORIZER_DIR)
+    if 'index' in sys.modules:
+        return importlib.reload(sys.modules['index'])
+    return importlib.import_module('index')
+
+
+def method_arn(verb, path):
+    return f"arn:aws:execute-api:{REGION}:{ACCOUNT}:{REST_API_ID}/{STAGE}/{verb}/{path.lstrip('/')}"
+
+
+def request_event(token, verb, path, query=None):
+    """Builds a REQUEST authorizer event as API Gateway sends it for the proxy resource."""
+    return {
+        'type': 'REQUEST',
+        'methodArn': method_arn(verb, path),
+        'resource': '/{proxy+}',
+        'path': path,
+        'httpMethod': verb,
+        'headers': {'Authorization': f"Bearer {token}"},
+        'queryStringParameters': query or {},
+        'requestContext': {'accountId': ACCOUNT, 'apiId': REST_API_ID, 'stage': STAGE},
+    }
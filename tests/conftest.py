@@ -0,0 +1,42 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""The modules under test are scripts in their own directories (the Lambda authorizer, the SageMaker
+source_dir, the containers, the bench checks), so their directories are put on the path."""
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for directory in ('bench', 'cdk/lambda/authorizer', 'src/cognito', 'src/mlflow-cache', 'src/mlflow-gateway',
+                  'src/mlflow-server', 'lab/source_dir'):
+    sys.path.insert(0, os.path.join(REPO_DIR, directory))
+
+
+@pytest.fixture(scope='session')
+def issuer():
+    from authorizer_fixtures import LocalIssuer
+    return LocalIssuer()
+
+
+@pytest.fixture
+def load_index():
+    """Loads the authorizer module with the given environment, restored after the test."""
+    from authorizer_fixtures import load_authorizer
+    environ = dict(os.environ)
+    yield load_authorizer
+    os.environ.clear()
+    os.environ.update(environ)
+
+
+@pytest.fixture
+def tracking_uri(tmp_path):
+    """Points the fluent MLflow API at a local file store, reset after the test."""
+    import mlflow
+    uri = f"file:{tmp_path}/mlruns"
+    mlflow.set_tracking_uri(uri)
+    yield uri
+    while mlflow.active_run():
+        mlflow.end_run()
+    mlflow.set_tracking_uri(None)
@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Bulk provisioning of the Cognito users against a moto Cognito User Pool."""
+
+import pytest
+
+pytest.importorskip('moto')
+
+from moto import mock_aws  # noqa: E402
+
+import add_users_and_groups  # noqa: E402
+from add_users_and_groups import bulk_provision, get_cognito_client, load_users  # noqa: E402
+
+PASSWORD = 'Passw0rd!'
+
+
+@pytest.fixture
+def cognito(monkeypatch):
+    """Returns the client and the id of a user pool signing in with the email, as the stack's."""
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        client = get_cognito_client()
+        user_pool_id = client.create_user_pool(PoolName='mlflow-user-pool', UsernameAttributes=['email'])['UserPool']['Id']
+        yield client, user_pool_id
+
+
+class FailingClient(object):
+    """Delegates to the Cognito client, and fails the first calls of an operation."""
+
+    def __init__(self, client, operation, failures=1):
+        self.client = client
+        self.operation = operation
+        self.failures = failures
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if name != self.operation:
+            return method
+
+        def fail_first(**kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise Exception(f"{name} failed")
+            return method(**kwargs)
+        return fail_first
+
+
+def users_file(tmp_path, rows):
+    path = tmp_path / 'users.csv'
+    path.write_text('username,groups,password\n' + ''.join(f"{row}\n" for row in rows))
+    return load_users(str(path))
+
+
+def pool_state(client, user_pool_id):
+    """Returns the email -> (status, groups) index of the pool."""
+    state = {}
+    for user in client.list_users(UserPoolId=user_pool_id)['Users']:
+        email = next(a['Value'] for a in user['Attributes'] if a['Name'] == 'email')
+        groups = {g['GroupName'] for g in client.admin_list_groups_for_user(UserPoolId=user_pool_id,
+                                                                            Username=user['Username'])['Groups']}
+        state[email] = (user['UserStatus'], groups)
+    return state
+
+
+def test_provision_then_nothing_left_to_do(cognito, tmp_path):
+    client, user_pool_id = cognito
+    users = users_file(tmp_path, [f"reader@example.com,readers,{PASSWORD}",
+                                  f"approver@example.com,readers;model-approvers,{PASSWORD}",
+                                  'invited@example.com,readers,'])
+    groups, created, memberships, passwords = bulk_provision(client, user_pool_id, users, workers=2)
+    assert (groups, len(created), memberships, passwords) == (['model-approvers', 'readers'], 3, [], [])
+    assert pool_state(client, user_pool_id) == {
+        'reader@example.com': ('CONFIRMED', {'readers'}),
+        'approver@example.com': ('CONFIRMED', {'readers', 'model-approvers'}),
+        'invited@example.com': ('FORCE_CHANGE_PASSWORD', {'readers'}),
+    }
+    # the user without a password keeps the temporary one emailed by Cognito
+    assert bulk_provision(client, user_pool_id, users) == ([], [], [], [])
+
+
+@pytest.mark.parametrize('operation,status_after_failure', [('admin_set_user_password', 'FORCE_CHANGE_PASSWORD'),
+                                                            ('admin_add_user_to_group', 'CONFIRMED')])
+def test_a_failed_run_is_completed_by_the_next_one(cognito, tmp_path, operation, status_after_failure):
+    client, user_pool_id = cognito
+    users = users_file(tmp_path, [f"reader@example.com,readers,{PASSWORD}"])
+    with pytest.raises(Exception, match='1 operations failed'):
+        bulk_provision(FailingClient(client, operation), user_pool_id, users)
+    assert pool_state(client, user_pool_id)['reader@example.com'] == (status_after_failure, set())
+
+    _, created, memberships, passwords = bulk_provision(client, user_pool_id, users)
+    assert created == [] and [group for _, group in memberships] == ['readers']
+    assert len(passwords) == (status_after_failure == 'FORCE_CHANGE_PASSWORD')
+    assert pool_state(client, user_pool_id) == {'reader@example.com': ('CONFIRMED', {'readers'})}
+    assert bulk_provision(client, user_pool_id, users) == ([], [], [], [])
+
+
+def test_unknown_groups_are_not_created(cognito, tmp_path):
+    client, user_pool_id = cognito
+    users = users_file(tmp_path, [f"reader@example.com,raeders,{PASSWORD}"])
+    with pytest.raises(ValueError, match='raeders'):
+        bulk_provision(client, user_pool_id, users)
+    assert client.list_groups(UserPoolId=user_pool_id)['Groups'] == []
+    assert client.list_users(UserPoolId=user_pool_id)['Users'] == []
+
+    groups, _, _, _ = bulk_provision(client, user_pool_id, users, allow_new_groups=True)
+    assert groups == ['raeders']
+    # once in the pool, the group is not new anymore
+    client.admin_delete_user(UserPoolId=user_pool_id, Username='reader@example.com')
+    assert bulk_provision(client, user_pool_id, users)[0] == []
+
+
+def test_dry_run_changes_nothing(cognito, tmp_path):
+    client, user_pool_id = cognito
+    users = users_file(tmp_path, [f"reader@example.com,readers,{PASSWORD}"])
+    groups, created, _, _ = bulk_provision(client, user_pool_id, users, dry_run=True)
+    assert groups == ['readers'] and len(created) == 1
+    assert client.list_users(UserPoolId=user_pool_id)['Users'] == []
+
+
+def test_known_groups_match_the_authorizer(issuer, load_index):
+    index = load_index(issuer.write_jwks())
+    assert set(add_users_and_groups.groups) == set(index.ROLE_RULES)
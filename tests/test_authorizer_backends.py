@@ -0,0 +1,26 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Both signature verification backends of the authorizer accept and reject the same tokens."""
+
+import pytest
+
+from authorizer_backends import BACKENDS, decisions, token_cases
+from authorizer_fixtures import LocalIssuer
+
+
+@pytest.fixture(scope='module')
+def cases(issuer):
+    return token_cases(issuer, LocalIssuer())
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backend_decisions(issuer, load_index, cases, backend):
+    index = load_index(issuer.write_jwks(), JWT_BACKEND=backend, JWKS_MIN_REFRESH_INTERVAL=3600)
+    assert decisions(index, cases) == {name: name == 'valid' for name, _ in cases}
+
+
+def test_backends_return_the_same_claims(issuer, load_index, cases):
+    token = dict(cases)['valid']
+    claims = [load_index(issuer.write_jwks(), JWT_BACKEND=backend).verify_token(token) for backend in BACKENDS]
+    assert claims[0]['cognito:username'] == 'user@example.com'
+    assert all(other == claims[0] for other in claims[1:])
@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Schema of the CloudWatch Embedded Metric Format lines printed by the authorizer handler."""
+
+import json
+
+import pytest
+
+from authorizer_fixtures import request_event
+
+NAMESPACE = 'MLflowAuthorizerTest'
+METRIC_NAMES = {'Decode', 'KeyLookup', 'SignatureVerification', 'Claims', 'PolicyBuild', 'ExperimentAuthz', 'Total',
+                'TokenCacheHit', 'TokenCacheMiss', 'Denied'}
+
+
+@pytest.fixture
+def index(issuer, load_index):
+    return load_index(issuer.write_jwks(), AUTHORIZER_METRICS='true', METRICS_NAMESPACE=NAMESPACE)
+
+
+def invoke(index, capsys, event):
+    """Returns the result of the handler (or the exception raised) and the EMF document printed."""
+    capsys.readouterr()
+    try:
+        result = index.handler(event, None)
+    except Exception as e:
+        result = e
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    document = json.loads(lines[0])
+    check_schema(document)
+    return result, document
+
+
+def check_schema(document):
+    directive = document['_aws']['CloudWatchMetrics'][0]
+    assert isinstance(document['_aws']['Timestamp'], int)
+    assert directive['Namespace'] == NAMESPACE
+    assert directive['Dimensions'] == [['Service']]
+    for dimensions in directive['Dimensions']:
+        assert all(isinstance(document[dimension], str) for dimension in dimensions)
+    declared = {metric['Name']: metric['Unit'] for metric in directive['Metrics']}
+    assert set(declared) == METRIC_NAMES
+    assert all(unit in ('Milliseconds', 'Count') for unit in declared.values())
+    for name in declared:
+        if name in document:
+            assert isinstance(document[name], (int, float)) and not isinstance(document[name], bool), name
+            assert document[name] >= 0
+
+
+def test_allow_then_cache_hit(index, issuer, capsys):
+    event = request_event(issuer.sign('reader@example.com', ['readers']), 'GET', '/ajax-api/2.0/mlflow/runs/get')
+    result, document = invoke(index, capsys, event)
+    assert result['principalId'] == 'reader@example.com'
+    assert (document['TokenCacheMiss'], document['TokenCacheHit'], document['Denied']) == (1, 0, 0)
+    assert {'Decode', 'KeyLookup', 'SignatureVerification', 'Claims', 'PolicyBuild'} <= set(document)
+    assert 'DenyReason' not in document
+
+    result, document = invoke(index, capsys, event)
+    assert result['principalId'] == 'reader@example.com'
+    assert (document['TokenCacheMiss'], document['TokenCacheHit'], document['Denied']) == (0, 1, 0)
+    assert 'SignatureVerification' not in document and document['Total'] >= 0
+
+
+def test_denies_carry_their_reason(index, issuer, capsys):
+    token = issuer.sign('reader@example.com', ['readers'])
+    tampered = token[:-4] + ('AAAA' if not token.endswith('AAAA') else 'BBBB')
+    result, document = invoke(index, capsys, request_event(tampered, 'GET', '/get-artifact'))
+    assert isinstance(result, Exception) and str(result) == 'Unauthorized'
+    assert document['Denied'] == 1 and document['DenyReason'] == 'Signature verification failed'
+
+    result, document = invoke(index, capsys, request_event('not-a-token', 'GET', '/get-artifact'))
+    assert document['DenyReason'] == 'Malformed token' and 'KeyLookup' not in document
+
+    result, document = invoke(index, capsys, request_event(issuer.sign('guest', ['guests']), 'GET', '/get-artifact'))
+    assert result is False
+    assert document['Denied'] == 1 and document['DenyReason'] == 'Unknown user group'
+
+
+def test_metrics_can_be_turned_off(issuer, load_index, capsys):
+    index = load_index(issuer.write_jwks(), AUTHORIZER_METRICS='false')
+    capsys.readouterr()
+    index.handler(request_event(issuer.sign('admin', ['admins']), 'GET', '/get-artifact'), None)
+    assert capsys.readouterr().out == ''
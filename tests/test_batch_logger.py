@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Contents of a run logged with the BatchLogger to a local file store, with failing requests."""
+
+import time
+
+import pytest
+
+pytest.importorskip('mlflow')
+
+from mlflow.tracking import MlflowClient  # noqa: E402
+
+from batch_logger import BatchLogger, split_batches  # noqa: E402
+
+PARAMS = {f"param-{i}": i for i in range(150)}
+METRICS = {f"metric-{i}": i / 10 for i in range(600)}
+TAGS = {'estimator': 'xgboost', 'dataset': 's3://bucket/train.csv'}
+
+
+class FailingClient(object):
+    """Delegates to the MlflowClient, and fails the given log_batch requests (0 being the first)."""
+
+    def __init__(self, client, failures=()):
+        self.client = client
+        self.failures = set(failures)
+        self.calls = 0
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=()):
+        call, self.calls = self.calls, self.calls + 1
+        if call in self.failures:
+            raise Exception('tracking server unavailable')
+        self.client.log_batch(run_id, metrics=metrics, params=params, tags=tags)
+
+
+@pytest.fixture
+def client(tmp_path):
+    return MlflowClient(f"file:{tmp_path}/mlruns")
+
+
+@pytest.fixture
+def run_id(client):
+    return client.create_run(client.create_experiment('batch-logger')).info.run_id
+
+
+def log_run(batch_logger):
+    """Logs the params, the tags and two steps of the metrics."""
+    batch_logger.log_params(PARAMS)
+    batch_logger.set_tags(TAGS)
+    for step in range(2):
+        batch_logger.log_metrics(METRICS, step=step)
+
+
+def check_run(client, run_id, params=PARAMS):
+    data = client.get_run(run_id).data
+    assert data.params == {key: str(value) for key, value in params.items()}
+    assert {key: data.tags[key] for key in TAGS} == TAGS
+    assert data.metrics == METRICS
+    for key in ('metric-0', 'metric-599'):
+        assert [m.step for m in client.get_metric_history(run_id, key)] == [0, 1]
+
+
+def batches_needed():
+    return len(split_batches([None] * len(METRICS) * 2, [None] * len(PARAMS), [None] * len(TAGS)))
+
+
+def test_everything_is_sent_in_batches(client, run_id):
+    failing = FailingClient(client)
+    with BatchLogger(run_id, failing, flush_interval=3600) as batch_logger:
+        log_run(batch_logger)
+    check_run(client, run_id)
+    assert batch_logger.requests == failing.calls == batches_needed() == 2
+
+
+def test_a_failed_batch_is_sent_again(client, run_id):
+    # the second batch fails, the first one is not sent twice
+    failing = FailingClient(client, failures={1})
+    batch_logger = BatchLogger(run_id, failing, flush_interval=3600)
+    log_run(batch_logger)
+    with pytest.raises(Exception, match='unavailable'):
+        batch_logger.flush()
+    # a param logged again before the retry keeps its last value
+    batch_logger.log_param('param-149', 'last')
+    batch_logger.close()
+    check_run(client, run_id, dict(PARAMS, **{'param-149': 'last'}))
+    assert (batch_logger.requests, batch_logger.failed_requests) == (3, 1)
+
+
+def test_failures_of_the_background_thread_are_retried(client, run_id):
+    failing = FailingClient(client, failures={0, 1})
+    with BatchLogger(run_id, failing, flush_interval=0.05) as batch_logger:
+        log_run(batch_logger)
+        while failing.calls < 3:
+            time.sleep(0.01)
+    check_run(client, run_id)
+    # the batches depend on what was buffered at each flush
+    assert batch_logger.failed_requests == 2 and batch_logger.requests == failing.calls
+
+
+def test_close_retries_then_raises(client, run_id):
+    failing = FailingClient(client, failures={0, 1, 2})
+    batch_logger = BatchLogger(run_id, failing, flush_interval=3600, close_attempts=3, retry_backoff=0)
+    log_run(batch_logger)
+    with pytest.raises(Exception, match='unavailable'):
+        batch_logger.close()
+    assert (batch_logger.requests, batch_logger.failed_requests) == (3, 3)
+    assert client.get_run(run_id).data.params == {}
+
+    failing = FailingClient(client, failures={0, 1})
+    with BatchLogger(run_id, failing, flush_interval=3600, close_attempts=3, retry_backoff=0) as batch_logger:
+        log_run(batch_logger)
+    check_run(client, run_id)
+    assert batch_logger.requests == batches_needed() + 2
+
+
+def test_the_error_of_the_training_is_not_hidden(client, run_id):
+    failing = FailingClient(client, failures={0})
+    with pytest.raises(ValueError, match='training failed'):
+        with BatchLogger(run_id, failing, flush_interval=3600, close_attempts=1) as batch_logger:
+            log_run(batch_logger)
+            raise ValueError('training failed')
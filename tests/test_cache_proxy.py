@@ -0,0 +1,191 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Invalidation, coalescing and upstream retries of the caching proxy, in front of a stub server."""
+
+import concurrent.futures
+import http.client
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+import proxy
+
+API = '/api/2.0/mlflow'
+SEARCH = ('POST', f"{API}/runs/search", {'experiment_ids': ['1']})
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """Stub MLflow server: answers with the next status of `statuses` (200 when empty) after
+    `latency` seconds, and records the requests it received."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.statuses = []
+        self.latency = 0
+        # close the keep-alive connections after answering, without telling the client
+        self.drop_connections = False
+        # requests read and then dropped without an answer
+        self.hang_ups = 0
+        self.received = []
+        self.lock = threading.Lock()
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with server.lock:
+            server.received.append((self.command, self.path, body))
+            call = len(server.received)
+            if server.hang_ups:
+                server.hang_ups -= 1
+                self.close_connection = True
+                return
+            status = server.statuses.pop(0) if server.statuses else 200
+        time.sleep(server.latency)
+        payload = json.dumps({'call': call, 'status': status}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.close_connection = server.drop_connections
+
+    do_GET = do_POST = do_PATCH = _handle
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def proxy_url(stub, monkeypatch):
+    monkeypatch.setattr(proxy, 'upstream', proxy.Upstream(f"http://127.0.0.1:{stub.server_port}", 2))
+    monkeypatch.setattr(proxy, 'metadata_cache', proxy.ResponseCache(1024 * 1024))
+    monkeypatch.setattr(proxy, 'inflight', proxy.Inflight())
+    server = proxy.ProxyServer(('127.0.0.1', 0), proxy.ProxyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def call(proxy_url, method, path, payload=None):
+    """Returns (status, X-Cache header, JSON body)."""
+    connection = http.client.HTTPConnection(proxy_url, timeout=10)
+    body = json.dumps(payload).encode() if payload is not None else None
+    connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    result = response.status, response.getheader('X-Cache'), response.read()
+    connection.close()
+    return result[0], result[1], json.loads(result[2]) if result[0] != 502 else None
+
+
+def concurrent_calls(proxy_url, stub, requests):
+    """Sends `requests` identical searches while the first one is in flight."""
+    stub.latency = 0.2
+    with concurrent.futures.ThreadPoolExecutor(requests) as executor:
+        first = executor.submit(call, proxy_url, *SEARCH)
+        time.sleep(0.05)
+        others = [executor.submit(call, proxy_url, *SEARCH) for _ in range(requests - 1)]
+        return [first.result()] + [future.result() for future in others]
+
+
+def test_writes_invalidate_the_cached_reads(proxy_url, stub):
+    run, other = f"{API}/runs/get?run_id=a", f"{API}/runs/get?run_id=b"
+    for path in (run, other, run, other):
+        call(proxy_url, 'GET', path)
+    assert [call(proxy_url, 'GET', path)[1] for path in (run, other)] == ['HIT', 'HIT']
+    assert call(proxy_url, *SEARCH)[1] == 'MISS' and call(proxy_url, *SEARCH)[1] == 'HIT'
+
+    call(proxy_url, 'POST', f"{API}/runs/log-batch", {'run_id': 'a', 'metrics': []})
+    # the write reaches the server, the run and the searches are fetched again, the other run is not
+    assert stub.received[-1][1] == f"{API}/runs/log-batch"
+    assert [call(proxy_url, 'GET', path)[1] for path in (run, other)] == ['MISS', 'HIT']
+    assert call(proxy_url, *SEARCH)[1] == 'MISS'
+
+    call(proxy_url, 'POST', f"{API}/runs/create", {'experiment_id': '1'})
+    assert call(proxy_url, *SEARCH)[1] == 'MISS' and call(proxy_url, 'GET', other)[1] == 'HIT'
+
+
+def test_identical_reads_in_flight_share_a_200(proxy_url, stub):
+    responses = concurrent_calls(proxy_url, stub, 4)
+    assert [(status, cache) for status, cache, _ in responses] == [(200, 'MISS')] + [(200, 'COALESCED')] * 3
+    assert len(stub.received) == 1 and proxy.inflight.coalesced == 3
+    assert call(proxy_url, *SEARCH)[1] == 'HIT'
+
+
+@pytest.mark.parametrize('status', [404, 500, 503])
+def test_an_error_of_the_leader_is_not_shared(proxy_url, stub, status):
+    stub.statuses = [status]
+    responses = concurrent_calls(proxy_url, stub, 4)
+    assert responses[0][:2] == (status, 'MISS')
+    # every follower sent its own request
+    assert [(status, cache) for status, cache, _ in responses[1:]] == [(200, 'MISS')] * 3
+    assert len({body['call'] for _, _, body in responses}) == len(stub.received) == 4
+    assert proxy.inflight.coalesced == 0
+    assert call(proxy_url, *SEARCH)[1] == 'HIT'
+
+
+def upstream_request(upstream, method, idempotent=None):
+    response = upstream.request(method, f"{API}/runs/get", b'{}', {'Content-Type': 'application/json'},
+                                idempotent=idempotent)
+    return response.status, response.read()
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+def test_a_request_not_sent_is_retried(stub, method):
+    upstream = proxy.Upstream(f"http://127.0.0.1:{stub.server_port}", 2)
+    stub.drop_connections = True
+    assert upstream_request(upstream, method)[0] == 200
+    time.sleep(0.1)
+    # sending on the connection closed by the server fails, the request is sent on a new one
+    assert upstream_request(upstream, method)[0] == 200
+    assert len(stub.received) == 2
+
+
+@pytest.mark.parametrize('method,idempotent,retried', [('GET', None, True), ('POST', True, True),
+                                                       ('POST', None, False), ('PATCH', None, False)])
+def test_a_request_sent_is_only_retried_if_idempotent(stub, method, idempotent, retried):
+    upstream = proxy.Upstream(f"http://127.0.0.1:{stub.server_port}", 2)
+    assert upstream_request(upstream, method, idempotent)[0] == 200
+    # the server reads the request on the reused connection and closes it without an answer
+    stub.hang_ups = 1
+    if retried:
+        assert upstream_request(upstream, method, idempotent)[0] == 200
+    else:
+        with pytest.raises(ConnectionResetError):
+            upstream_request(upstream, method, idempotent)
+        # the next request opens a new connection
+        assert upstream_request(upstream, method, idempotent)[0] == 200
+    assert len(stub.received) == 3
+    # a request is never retried on a new connection
+    stub.hang_ups = 1
+    upstream._discard()
+    with pytest.raises(ConnectionResetError):
+        upstream_request(upstream, 'GET')
+
+
+@pytest.mark.parametrize('method,idempotent', [('GET', None), ('POST', None), ('POST', True)])
+def test_timeouts_are_not_retried(stub, method, idempotent):
+    upstream = proxy.Upstream(f"http://127.0.0.1:{stub.server_port}", 0.2)
+    assert upstream_request(upstream, method, idempotent)[0] == 200
+    stub.latency = 0.5
+    with pytest.raises(TimeoutError):
+        upstream_request(upstream, method, idempotent)
+    time.sleep(0.5)
+    assert len(stub.received) == 2
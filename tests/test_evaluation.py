@@ -0,0 +1,108 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Chunked evaluation of the training script, with exact and sketched error quantiles."""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pandas')
+
+from evaluation import QuantileSketch, evaluate, file_chunks, frame_chunks  # noqa: E402
+
+QUANTILES = [1, 10, 50, 90, 99]
+# the documented bound of the sketch in the 1st-99th percentile range
+MAX_RANK_ERROR = 0.005
+
+
+class ColumnModel(object):
+    """Predicts the first feature."""
+
+    def predict(self, X):
+        return np.asarray(X)[:, 0]
+
+
+def rank_error(values, estimate, q):
+    values = np.sort(values)
+    low = np.searchsorted(values, estimate, side='left') / len(values)
+    high = np.searchsorted(values, estimate, side='right') / len(values)
+    return 0.0 if low <= q <= high else min(abs(low - q), abs(high - q))
+
+
+def errors(size, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        'normal': rng.normal(size=size),
+        'lognormal': rng.lognormal(size=size),
+        'discrete': rng.integers(0, 20, size=size).astype(np.float64),
+        'sorted': np.sort(rng.exponential(size=size)),
+    }
+
+
+def test_exact_matches_numpy_and_sklearn():
+    metrics = pytest.importorskip('sklearn.metrics')
+    rng = np.random.default_rng(1)
+    y = rng.normal(2, 1, 10_001)
+    X = (y + rng.normal(0, 0.5, len(y)))[:, None]
+    result = evaluate(ColumnModel(), frame_chunks(X, y, 999), QUANTILES)
+    abs_error = np.abs(X[:, 0] - y)
+    # the percentiles are the float64 ones, not rounded to float32
+    for q, expected in zip(QUANTILES, np.percentile(abs_error, QUANTILES)):
+        assert result[f'AE-at-{q}th-percentile'] == expected
+    assert result['mean-absolute-error'] == pytest.approx(metrics.mean_absolute_error(y, X[:, 0]), rel=1e-12)
+    assert result['root-mean-squared-error'] == pytest.approx(np.sqrt(metrics.mean_squared_error(y, X[:, 0])),
+                                                              rel=1e-12)
+    assert result['r2-score'] == pytest.approx(metrics.r2_score(y, X[:, 0]), rel=1e-12)
+    assert result['max-error'] == metrics.max_error(y, X[:, 0])
+    # concurrent predictions give the same result
+    assert evaluate(ColumnModel(), frame_chunks(X, y, 999), QUANTILES, workers=3) == result
+
+
+@pytest.mark.parametrize('distribution', ['normal', 'lognormal', 'discrete', 'sorted'])
+def test_sketch_quantiles(distribution):
+    values = errors(200_000)[distribution]
+    sketch = QuantileSketch(buffer_size=10_000)
+    for start in range(0, len(values), 7_000):
+        sketch.update(values[start:start + 7_000])
+    estimates = sketch.quantiles([q / 100 for q in QUANTILES])
+    for q, estimate in zip(QUANTILES, estimates):
+        assert rank_error(values, estimate, q / 100) < MAX_RANK_ERROR, (q, estimate)
+    assert (sketch.count, sketch.min, sketch.max) == (len(values), values.min(), values.max())
+    assert len(sketch.means) <= sketch.compression
+
+
+@pytest.mark.parametrize('distribution', ['normal', 'lognormal', 'discrete', 'sorted'])
+def test_merged_sketches(distribution):
+    values = errors(200_000, seed=2)[distribution]
+    merged = QuantileSketch()
+    # uneven parts, one of them empty
+    for part in np.split(values, [10, 50_000, 50_000, 170_000]):
+        sketch = QuantileSketch()
+        sketch.update(part)
+        merged.merge(sketch)
+    estimates = merged.quantiles([q / 100 for q in QUANTILES])
+    for q, estimate in zip(QUANTILES, estimates):
+        assert rank_error(values, estimate, q / 100) < MAX_RANK_ERROR, (q, estimate)
+    assert (merged.count, merged.min, merged.max) == (len(values), values.min(), values.max())
+
+
+def test_empty_inputs():
+    assert np.isnan(QuantileSketch().quantiles([0.5])).all()
+    for exact in (True, False):
+        result = evaluate(ColumnModel(), iter([]), QUANTILES, exact=exact)
+        assert set(result) == {f'AE-at-{q}th-percentile' for q in QUANTILES}
+        assert all(np.isnan(value) for value in result.values())
+
+
+def test_streamed_file_is_sketched(tmp_path):
+    rng = np.random.default_rng(3)
+    y = rng.normal(size=50_000)
+    x = y + rng.lognormal(size=len(y))
+    path = tmp_path / 'test.csv'
+    path.write_text('x,y\n' + ''.join(f"{a!r},{b!r}\n" for a, b in zip(x, y)))
+    exact = evaluate(ColumnModel(), frame_chunks(x[:, None], y, 4_000), QUANTILES)
+    streamed = evaluate(ColumnModel(), file_chunks(str(path), ['x'], 'y', 4_000), QUANTILES, exact=False)
+    # the file is parsed in float32
+    assert streamed['mean-absolute-error'] == pytest.approx(exact['mean-absolute-error'], rel=1e-5)
+    abs_error = np.abs(x - y)
+    for q in QUANTILES:
+        assert rank_error(abs_error, streamed[f'AE-at-{q}th-percentile'], q / 100) < MAX_RANK_ERROR
@@ -0,0 +1,168 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Experiment scoped authorization against a local `mlflow server` backed by sqlite."""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+from authorizer_fixtures import method_arn, request_event
+from experiment_authz import ExperimentAuthz, TrackingClient
+from policy_eval import is_allowed
+
+GROUPS_TAG = 'mlflow.authorizer.groups'
+AJAX = '/ajax-api/2.0/mlflow'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def tracking_server(tmp_path_factory):
+    """Starts the server and seeds an experiment shared with the readers, one restricted to the
+    model approvers and one without the tag, with a run each and a model version of the
+    restricted run."""
+    pytest.importorskip('mlflow')
+    from mlflow.tracking import MlflowClient
+
+    directory = tmp_path_factory.mktemp('mlflow')
+    url = f"http://127.0.0.1:{free_port()}"
+    server = subprocess.Popen([sys.executable, '-m', 'mlflow', 'server', '--host', '127.0.0.1',
+                               '--port', url.rsplit(':', 1)[1], '--workers', '1',
+                               '--backend-store-uri', f"sqlite:///{directory}/mlflow.db",
+                               '--default-artifact-root', f"file://{directory}/artifacts"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        deadline = time.time() + 120
+        while True:
+            try:
+                urllib.request.urlopen(f"{url}/health", timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise Exception('mlflow server did not start')
+                time.sleep(0.5)
+        client = MlflowClient(url)
+        seeded = {'url': url}
+        for name, groups in (('shared', 'readers, model-approvers'), ('restricted', 'model-approvers'), ('open', None)):
+            experiment_id = client.create_experiment(name, tags={GROUPS_TAG: groups} if groups else None)
+            seeded[name] = client.create_run(experiment_id).info.run_id
+            seeded[f"{name}_experiment"] = experiment_id
+        client.create_registered_model('restricted-model')
+        client.create_model_version('restricted-model', f"runs:/{seeded['restricted']}/model", seeded['restricted'])
+        yield seeded
+    finally:
+        # mlflow server does not stop its gunicorn workers when terminated
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+
+
+class CountingClient(TrackingClient):
+
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.requests = 0
+
+    def get(self, endpoint, **params):
+        self.requests += 1
+        return super().get(endpoint, **params)
+
+
+def group_policy():
+    return {'principalId': 'user', 'policyDocument': {'Version': '2012-10-17', 'Statement': [
+        {'Action': 'execute-api:Invoke', 'Effect': 'Allow', 'Resource': [method_arn('*', '*')]}]}}
+
+
+def allowed(authz, groups, verb, path, query=None, multi_value_query=None):
+    event = request_event('token', verb, path, query)
+    if multi_value_query:
+        event['multiValueQueryStringParameters'] = multi_value_query
+    return is_allowed(authz.authorize(event, groups, group_policy())['policyDocument'], event['methodArn'])
+
+
+@pytest.fixture
+def authz(tracking_server):
+    return ExperimentAuthz(CountingClient(tracking_server['url']), GROUPS_TAG)
+
+
+def test_runs_are_scoped_to_their_experiment(tracking_server, authz):
+    run = f"{AJAX}/runs/get"
+    assert allowed(authz, ['readers'], 'GET', run, {'run_id': tracking_server['shared']})
+    assert allowed(authz, ['readers'], 'GET', run, {'run_id': tracking_server['open']})
+    assert not allowed(authz, ['readers'], 'GET', run, {'run_id': tracking_server['restricted']})
+    assert allowed(authz, ['model-approvers'], 'GET', run, {'run_id': tracking_server['restricted']})
+    assert allowed(authz, ['admins'], 'GET', run, {'run_id': tracking_server['restricted']})
+    assert not allowed(authz, ['readers'], 'GET', '/get-artifact',
+                       {'run_uuid': tracking_server['restricted'], 'path': 'model/MLmodel'})
+    # the server answers 404 to an unknown run
+    assert allowed(authz, ['readers'], 'GET', run, {'run_id': '0' * 32})
+
+
+def test_every_run_of_a_bulk_request_is_checked(tracking_server, authz):
+    runs = [tracking_server['shared'], tracking_server['restricted']]
+    assert not allowed(authz, ['readers'], 'GET', f"{AJAX}/metrics/get-history-bulk", {'metric_key': 'rmse'},
+                       {'run_id': runs})
+    assert not allowed(authz, ['readers'], 'GET', f"{AJAX}/metrics/get-history-bulk-interval",
+                       {'metric_key': 'rmse'}, {'run_ids': runs})
+    assert allowed(authz, ['model-approvers'], 'GET', f"{AJAX}/metrics/get-history-bulk", {'metric_key': 'rmse'},
+                   {'run_id': runs})
+
+
+def test_experiments_and_model_versions_are_scoped(tracking_server, authz):
+    assert not allowed(authz, ['readers'], 'GET', f"{AJAX}/experiments/get",
+                       {'experiment_id': tracking_server['restricted_experiment']})
+    assert not allowed(authz, ['readers'], 'GET', f"{AJAX}/experiments/get-by-name", {'experiment_name': 'restricted'})
+    assert allowed(authz, ['readers'], 'GET', f"{AJAX}/experiments/get-by-name", {'experiment_name': 'shared'})
+    version = {'name': 'restricted-model', 'version': '1'}
+    assert not allowed(authz, ['readers'], 'GET', f"{AJAX}/model-versions/get", version)
+    assert not allowed(authz, ['readers'], 'GET', '/model-versions/get-artifact', dict(version, path='MLmodel'))
+    assert allowed(authz, ['model-approvers'], 'GET', f"{AJAX}/model-versions/get", version)
+
+
+def test_searches_are_denied_to_non_admins(tracking_server, authz):
+    for path in (f"{AJAX}/runs/search", f"{AJAX}/experiments/search"):
+        assert not allowed(authz, ['readers'], 'POST', path)
+        assert not allowed(authz, ['readers', 'model-approvers'], 'POST', path)
+        assert allowed(authz, ['admins'], 'POST', path)
+    open_search = ExperimentAuthz(TrackingClient(tracking_server['url']), GROUPS_TAG, deny_search=False)
+    assert allowed(open_search, ['readers'], 'POST', f"{AJAX}/runs/search")
+
+
+def test_warm_checks_do_not_call_the_server(tracking_server, authz):
+    query = {'run_id': tracking_server['shared']}
+    assert allowed(authz, ['readers'], 'GET', f"{AJAX}/runs/get", query)
+    requests = authz.client.requests
+    assert requests == 2
+    for _ in range(10):
+        assert allowed(authz, ['readers'], 'GET', f"{AJAX}/runs/get", query)
+    assert authz.client.requests == requests
+
+
+def test_lookup_errors_deny_the_request():
+    authz = ExperimentAuthz(TrackingClient(f"http://127.0.0.1:{free_port()}", timeout=0.5), GROUPS_TAG)
+    assert not allowed(authz, ['readers'], 'GET', f"{AJAX}/runs/get", {'run_id': 'a' * 32})
+    assert allowed(authz, ['readers'], 'GET', f"{AJAX}/registered-models/search")
+
+
+def test_authorizer_refuses_cached_policies(issuer, load_index):
+    with pytest.raises(Exception, match='AUTHORIZER_CACHE_TTL=300'):
+        load_index(issuer.write_jwks(), EXPERIMENT_AUTHZ='true', AUTHORIZER_CACHE_TTL='300',
+                   MLFLOW_TRACKING_INTERNAL_URI='http://127.0.0.1:5000')
+
+
+def test_authorizer_handler(issuer, load_index, tracking_server):
+    index = load_index(issuer.write_jwks(), EXPERIMENT_AUTHZ='true', AUTHORIZER_CACHE_TTL='0',
+                       MLFLOW_TRACKING_INTERNAL_URI=tracking_server['url'])
+    token = issuer.sign('reader@example.com', ['readers'])
+    for run, expected in ((tracking_server['shared'], True), (tracking_server['restricted'], False)):
+        event = request_event(token, 'GET', f"{AJAX}/runs/get", {'run_id': run})
+        assert is_allowed(index.handler(event, None)['policyDocument'], event['methodArn']) == expected
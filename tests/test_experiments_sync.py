@@ -0,0 +1,139 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Mirroring of an MLflow run to SageMaker Experiments, with a stub tracker."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from experiments_sync import MAX_OUTPUT_ARTIFACTS, ExperimentsSync, RunSnapshot
+
+ARTIFACT_URI = 's3://mlflow-artifacts/1/run/artifacts'
+
+
+class StubTracker(object):
+    """Records the calls of ExperimentsSync, with the load/create/log_*/close interface of
+    smexperiments.tracker.Tracker. `close_failures` closes fail before one succeeds."""
+
+    # set by the tests
+    in_job = True
+    load_failures = 0
+    close_failures = 0
+    instances = []
+
+    def __init__(self, display_name=None):
+        self.display_name = display_name
+        self.parameters = {}
+        self.metrics = {}
+        self.outputs = {}
+        self.closes = 0
+        self.saved = False
+        type(self).instances.append(self)
+
+    @classmethod
+    def load(cls):
+        if cls.load_failures:
+            cls.load_failures -= 1
+            raise Exception('ThrottlingException')
+        if not cls.in_job:
+            raise ValueError('Cannot load a tracker outside of a SageMaker job')
+        return cls()
+
+    @classmethod
+    def create(cls, display_name=None):
+        return cls(display_name)
+
+    def log_parameters(self, parameters):
+        self.parameters.update(parameters)
+
+    def log_metric(self, metric_name, value):
+        self.metrics[metric_name] = value
+
+    def log_output(self, name, value):
+        self.outputs[name] = value
+
+    def close(self):
+        self.closes += 1
+        if self.closes <= self.close_failures:
+            raise Exception('ThrottlingException')
+        self.saved = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+@pytest.fixture
+def tracker_class():
+    class Tracker(StubTracker):
+        instances = []
+    return Tracker
+
+
+def snapshot(artifacts=('model/MLmodel', 'model/model.pkl')):
+    run = SimpleNamespace(info=SimpleNamespace(run_id='run', artifact_uri=ARTIFACT_URI),
+                          data=SimpleNamespace(params={'n-estimators': '10'}, metrics={'rmse': 0.5}))
+    return RunSnapshot(run, list(artifacts))
+
+
+def sync(tracker_class, attempts=3, artifacts=('model/MLmodel', 'model/model.pkl')):
+    experiments_sync = ExperimentsSync(snapshot(artifacts), {'run_id': 'run'}, tracker_class, attempts, backoff=0)
+    experiments_sync.start()
+    return experiments_sync.join(timeout=10), experiments_sync
+
+
+def test_the_tracker_of_the_job_is_loaded(tracker_class):
+    completed, _ = sync(tracker_class)
+    tracker, = tracker_class.instances
+    assert completed and tracker.saved and tracker.display_name is None
+    assert tracker.parameters == {'run_id': 'run', 'n-estimators': '10'}
+    assert tracker.metrics == {'rmse': 0.5}
+    assert tracker.outputs == {'MLFlow.model/MLmodel': f"{ARTIFACT_URI}/model/MLmodel",
+                               'MLFlow.model/model.pkl': f"{ARTIFACT_URI}/model/model.pkl",
+                               'SageMaker.ModelArtifact': 'NA'}
+
+
+def test_a_tracker_is_created_outside_of_a_job(tracker_class):
+    tracker_class.in_job = False
+    completed, _ = sync(tracker_class)
+    tracker, = tracker_class.instances
+    assert completed and tracker.saved and tracker.display_name.startswith('mlflow-tracker-')
+    assert tracker.parameters == {'run_id': 'run', 'n-estimators': '10'}
+    # metrics can only be logged from a training job
+    assert tracker.metrics == {}
+
+
+def test_calls_are_retried(tracker_class):
+    tracker_class.load_failures, tracker_class.close_failures = 2, 2
+    completed, _ = sync(tracker_class)
+    tracker, = tracker_class.instances
+    assert completed and tracker.saved and tracker.closes == 3
+
+
+@pytest.mark.parametrize('attempts', [1, 2, 3])
+def test_a_tracker_not_saved_is_a_failure(tracker_class, attempts):
+    tracker_class.close_failures = attempts
+    completed, experiments_sync = sync(tracker_class, attempts)
+    tracker, = tracker_class.instances
+    assert not completed and str(experiments_sync.error) == 'ThrottlingException'
+    assert tracker.closes == attempts and not tracker.saved
+
+
+def test_the_outputs_are_capped(tracker_class):
+    artifacts = [f"model/file-{i}" for i in range(MAX_OUTPUT_ARTIFACTS + 5)]
+    completed, _ = sync(tracker_class, artifacts=artifacts)
+    tracker, = tracker_class.instances
+    assert completed and len(tracker.outputs) == MAX_OUTPUT_ARTIFACTS + 1
+    assert tracker.outputs['SageMaker.ModelArtifact'] == 'NA'
+
+
+def test_an_error_before_the_save_is_not_retried(tracker_class):
+    def log_metric(self, metric_name, value):
+        raise TypeError('unsupported metric')
+    tracker_class.log_metric = log_metric
+    completed, experiments_sync = sync(tracker_class)
+    tracker, = tracker_class.instances
+    assert not completed and isinstance(experiments_sync.error, TypeError)
+    assert tracker.closes == 1
@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Response cache and coalescing of the gateway layer, in front of a stub gateway app."""
+
+import asyncio
+import json
+
+import pytest
+
+import gateway
+from gateway import GatewayLayer
+
+PATH = '/endpoints/completions/invocations'
+PAYLOAD = {'prompt': 'What is MLflow?', 'temperature': 0}
+
+
+class StubGateway(object):
+    """ASGI app answering the invocations of the 'completions' endpoint with the given statuses,
+    after `latency` seconds."""
+
+    def __init__(self, statuses, latency=0.05):
+        self.statuses = list(statuses)
+        self.latency = latency
+        self.calls = 0
+
+    def get_dynamic_route(self, name):
+        return name if name == 'completions' else None
+
+    async def __call__(self, scope, receive, send):
+        await receive()
+        self.calls += 1
+        call = self.calls
+        status = self.statuses.pop(0) if self.statuses else 200
+        await asyncio.sleep(self.latency)
+        body = json.dumps({'status': status, 'call': call}).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+@pytest.fixture(autouse=True)
+def no_stats_reporter(monkeypatch):
+    monkeypatch.setattr(gateway, 'STATS_INTERVAL', 0)
+
+
+async def invoke(layer, payload=PAYLOAD, delay=0):
+    """Returns the status, the X-Cache header and the JSON body of the response."""
+    await asyncio.sleep(delay)
+    body = json.dumps(payload).encode()
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': PATH, 'headers': [(b'content-type', b'application/json')]}
+    await layer(scope, receive, send)
+    start, response = messages
+    return start['status'], dict(start['headers'])[b'x-cache'].decode(), json.loads(response['body'])
+
+
+async def concurrent(layer, followers):
+    # the leader is in flight when the followers arrive
+    return await asyncio.gather(invoke(layer), *(invoke(layer, delay=0.01) for _ in range(followers)))
+
+
+def test_followers_share_a_200():
+    app = StubGateway([200])
+    layer = GatewayLayer(app, workers=1)
+    responses = asyncio.run(concurrent(layer, 3))
+    assert [(status, cache) for status, cache, _ in responses] == [(200, 'MISS')] + [(200, 'COALESCED')] * 3
+    assert app.calls == 1 and layer.coalesced == 3
+    assert asyncio.run(invoke(layer))[:2] == (200, 'HIT')
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_followers_of_a_failed_leader_call_the_provider(status):
+    app = StubGateway([status])
+    layer = GatewayLayer(app, workers=1)
+    responses = asyncio.run(concurrent(layer, 3))
+    assert responses[0][:2] == (status, 'MISS')
+    # every follower got its own answer, not the error of the leader
+    assert [(status, cache) for status, cache, _ in responses[1:]] == [(200, 'MISS')] * 3
+    assert len({body['call'] for _, _, body in responses}) == 4
+    assert app.calls == 4 and layer.coalesced == 0 and layer.inflight == {}
+    # the 200 of a follower is cached
+    assert asyncio.run(invoke(layer))[:2] == (200, 'HIT')
+
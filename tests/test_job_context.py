@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Round trip of the SageMaker job context through a run of a local file store, in every storage mode."""
+
+import os
+
+import pytest
+
+pytest.importorskip('mlflow')
+
+import mlflow  # noqa: E402
+from mlflow.tracking import MlflowClient  # noqa: E402
+
+from batch_logger import BatchLogger  # noqa: E402
+from job_context import CONTEXT_ARTIFACT, CONTEXT_TAG, load_job_context, log_job_context  # noqa: E402
+
+CONTEXT = {
+    'job_name': 'sagemaker-scikit-learn-2024-01-01-00-00-000001',
+    'current_instance_type': 'ml.c5.xlarge',
+    'hosts': ['algo-1'],
+    'hyperparameters': {'n-estimators': 100, 'features': 'MedInc HouseAge AveRooms'},
+    'num_cpus': 4,
+    'resource_config': {'current_host': 'algo-1', 'current_instance_type': 'ml.c5.xlarge'},
+}
+SEARCHABLE_TAGS = {'job_name': CONTEXT['job_name'], 'current_instance_type': 'ml.c5.xlarge',
+                   'resource_config.current_instance_type': 'ml.c5.xlarge'}
+
+
+@pytest.fixture
+def client(tracking_uri):
+    return MlflowClient(tracking_uri)
+
+
+def log_context(client, context, mode):
+    """Logs the context in a new run and returns the run."""
+    with mlflow.start_run() as run, BatchLogger(run.info.run_id, client, flush_interval=3600) as batch_logger:
+        log_job_context(context, batch_logger, mode)
+    return client.get_run(run.info.run_id)
+
+
+def user_tags(run):
+    return {key: value for key, value in run.data.tags.items() if not key.startswith('mlflow.')}
+
+
+def context_artifacts(client, run):
+    return [f.path for f in client.list_artifacts(run.info.run_id, os.path.dirname(CONTEXT_ARTIFACT))]
+
+
+def test_artifact(client):
+    run = log_context(client, CONTEXT, 'artifact')
+    assert load_job_context(run.info.run_id, client) == CONTEXT
+    assert user_tags(run) == SEARCHABLE_TAGS
+    assert context_artifacts(client, run) == [CONTEXT_ARTIFACT]
+    # the runs can be searched by the searchable keys
+    found = client.search_runs([run.info.experiment_id], f"tags.job_name = '{CONTEXT['job_name']}'")
+    assert [r.info.run_id for r in found] == [run.info.run_id]
+
+
+def test_tag(client):
+    run = log_context(client, CONTEXT, 'tag')
+    assert load_job_context(run.info.run_id, client) == CONTEXT
+    assert set(user_tags(run)) == set(SEARCHABLE_TAGS) | {CONTEXT_TAG}
+    assert context_artifacts(client, run) == []
+
+
+def test_tags(client):
+    run = log_context(client, CONTEXT, 'tags')
+    # one tag per key, the full context is not stored
+    assert user_tags(run) == {key: str(value) for key, value in CONTEXT.items()}
+    assert load_job_context(run.info.run_id, client) is None
+    assert context_artifacts(client, run) == []
+
+
+def test_a_context_too_large_for_a_tag_is_an_artifact(client):
+    # random host names do not compress
+    context = dict(CONTEXT, hosts=[os.urandom(16).hex() for _ in range(500)])
+    run = log_context(client, context, 'tag')
+    assert CONTEXT_TAG not in run.data.tags
+    assert context_artifacts(client, run) == [CONTEXT_ARTIFACT]
+    assert load_job_context(run.info.run_id, client) == context
+
+
+def test_unknown_mode(client):
+    with pytest.raises(ValueError, match='Unknown job context storage'):
+        log_context(client, CONTEXT, 'params')
@@ -0,0 +1,128 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Key rotation, refetches and failures of the JWKS key store of the authorizer, against a local
+JWKS endpoint that counts its fetches."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from authorizer_fixtures import LocalIssuer, request_event
+
+
+@pytest.fixture
+def cognito():
+    # rotated by the tests, not shared with the other modules
+    return LocalIssuer()
+
+
+@pytest.fixture
+def jwks(cognito):
+    url, server = cognito.serve_jwks()
+    yield url, server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def index(jwks, load_index):
+    return load_index(jwks[0], JWKS_MIN_REFRESH_INTERVAL='0')
+
+
+def key_store(index, url, **kwargs):
+    store = index.JwksKeyStore(url, **kwargs)
+    assert store.refresh(force=True)
+    return store
+
+
+def authorize(index, token):
+    return index.handler(request_event(token, 'GET', '/get-artifact'), None)
+
+
+def test_keys_are_fetched_and_constructed_once(index, cognito, jwks):
+    url, server = jwks
+    fetches = server.fetches
+    store = key_store(index, url)
+    key = store.get(cognito.kid)
+    assert key is not None and store.get(cognito.kid) is key
+    assert server.fetches == fetches + 1
+
+
+def test_a_rotated_key_is_fetched(index, cognito, jwks):
+    url, server = jwks
+    before = cognito.sign('reader', ['readers'])
+    assert authorize(index, before)['principalId'] == 'reader'
+    fetches = server.fetches
+    cognito.rotate()
+    after = cognito.sign('reader', ['readers'])
+    assert authorize(index, after)['principalId'] == 'reader'
+    # the tokens signed before the rotation are still accepted
+    index.token_cache.clear()
+    assert authorize(index, before)['principalId'] == 'reader'
+    assert server.fetches == fetches + 1
+
+
+def test_an_unknown_kid_is_rejected(index, jwks):
+    url, server = jwks
+    fetches = server.fetches
+    with pytest.raises(Exception, match='Unauthorized'):
+        authorize(index, LocalIssuer().sign('reader', ['readers']))
+    # the JWKS is fetched again in case the key was rotated, the kid is still unknown
+    assert server.fetches == fetches + 1
+    assert index.key_store.get('unknown') is None
+
+
+def test_concurrent_lookups_share_one_refetch(index, cognito, jwks):
+    url, server = jwks
+    store = key_store(index, url, min_refresh_interval=0)
+    cognito.rotate()
+    server.latency = 0.3
+    fetches = server.fetches
+    with ThreadPoolExecutor(8) as executor:
+        keys = list(executor.map(store.get, [cognito.kid] * 8))
+    assert all(key is not None for key in keys)
+    assert server.fetches == fetches + 1
+
+
+def test_refetches_are_rate_limited(index, cognito, jwks):
+    url, server = jwks
+    store = key_store(index, url, min_refresh_interval=0.5)
+    fetches = server.fetches
+    cognito.rotate()
+    # the fetch of the cold start counts as the last attempt
+    for _ in range(10):
+        assert store.get('unknown') is None and store.get(cognito.kid) is None
+    assert server.fetches == fetches
+    time.sleep(0.5)
+    assert store.get(cognito.kid) is not None
+    for _ in range(10):
+        assert store.get('unknown') is None
+    assert server.fetches == fetches + 1
+
+
+def test_a_failed_refetch_keeps_the_last_good_keys(index, cognito, jwks):
+    url, server = jwks
+    store = key_store(index, url, min_refresh_interval=0)
+    kid = cognito.kid
+    server.status = 503
+    cognito.rotate()
+    assert not store.refresh(force=True)
+    assert store.get(cognito.kid) is None
+    assert store.get(kid) is not None
+    # the next lookup of the rotated key fetches it once the JWKS is served again
+    server.status = 200
+    assert store.get(cognito.kid) is not None
+
+
+def test_old_keys_are_refreshed_in_the_background(index, cognito, jwks):
+    url, server = jwks
+    store = key_store(index, url, max_age=0)
+    key = store.get(cognito.kid)
+    fetches = server.fetches
+    server.status = 503
+    # the known key is returned at once, the refresh fails in the background
+    assert store.get(cognito.kid) is key
+    store._background.join(timeout=5)
+    assert server.fetches == fetches + 1
+    assert store.get(cognito.kid) is not None
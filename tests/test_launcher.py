@@ -0,0 +1,153 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Sizing of the MLflow tracking server from faked cgroup files and ECS task metadata."""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import launcher
+from launcher import ENGINES_PER_WORKER, cpu_limit, derive_config, ecs_task_limits, memory_limit_mb
+
+GIB = 1024 * 1024 * 1024
+UNLIMITED_V1 = str((1 << 63) - 4096)
+# Fargate task sizes, (vCPU, MiB)
+TASK_SIZES = [(0.25, 512), (0.5, 1024), (1, 2048), (2, 4096), (4, 8192), (8, 16384), (16, 32768)]
+
+
+def cgroup(tmp_path, files):
+    """Writes the {relative path: content} files under a fake cgroup root, returns the root."""
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(tmp_path / path), exist_ok=True)
+        (tmp_path / path).write_text(f"{content}\n")
+    return str(tmp_path)
+
+
+@pytest.fixture
+def meminfo(tmp_path):
+    path = tmp_path / 'meminfo'
+    path.write_text('MemTotal:       16318480 kB\nMemFree:         1234567 kB\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('files,expected', [
+    ({'cpu.max': '200000 100000'}, 2.0),
+    ({'cpu.max': '25000 100000'}, 0.25),
+    ({'cpu/cpu.cfs_quota_us': '50000', 'cpu/cpu.cfs_period_us': '100000'}, 0.5),
+    ({'cpu,cpuacct/cpu.cfs_quota_us': '400000', 'cpu,cpuacct/cpu.cfs_period_us': '100000'}, 4.0),
+])
+def test_cpu_limit(tmp_path, files, expected):
+    assert cpu_limit(cgroup(tmp_path, files), {'CPU': 16}) == expected
+
+
+@pytest.mark.parametrize('files', [{'cpu.max': 'max 100000'},
+                                   {'cpu/cpu.cfs_quota_us': '-1', 'cpu/cpu.cfs_period_us': '100000'},
+                                   {}])
+def test_unlimited_cpu(tmp_path, files):
+    root = cgroup(tmp_path, files)
+    # Fargate enforces the limits of the task
+    assert cpu_limit(root, {'CPU': 0.5}) == 0.5
+    assert cpu_limit(root) == len(os.sched_getaffinity(0))
+
+
+@pytest.mark.parametrize('files,expected', [
+    ({'memory.max': str(2 * GIB)}, 2048),
+    ({'memory/memory.limit_in_bytes': str(GIB)}, 1024),
+    # a limit above the memory of the host
+    ({'memory.max': str(64 * GIB)}, 15936),
+])
+def test_memory_limit(tmp_path, meminfo, files, expected):
+    assert memory_limit_mb(cgroup(tmp_path, files), {'Memory': 512}, meminfo) == expected
+
+
+@pytest.mark.parametrize('files', [{'memory.max': 'max'}, {'memory/memory.limit_in_bytes': UNLIMITED_V1}, {}])
+def test_unlimited_memory(tmp_path, meminfo, files):
+    root = cgroup(tmp_path, files)
+    assert memory_limit_mb(root, {'Memory': 512}, meminfo) == 512
+    assert memory_limit_mb(root, {}, meminfo) == 15936
+    assert memory_limit_mb(root, {}, str(tmp_path / 'missing')) == 1024
+
+
+def test_ecs_task_limits(monkeypatch):
+    class TaskMetadata(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps({'Cluster': 'mlflow', 'Limits': {'CPU': 0.5, 'Memory': 1024}}).encode()
+            self.send_response(200 if self.path == '/v4/container/task' else 404)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), TaskMetadata)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.delenv('ECS_CONTAINER_METADATA_URI_V4', raising=False)
+        assert ecs_task_limits() == {}
+        monkeypatch.setenv('ECS_CONTAINER_METADATA_URI_V4', f"http://127.0.0.1:{server.server_port}/v4/container")
+        assert ecs_task_limits() == {'CPU': 0.5, 'Memory': 1024}
+        monkeypatch.setenv('ECS_CONTAINER_METADATA_URI_V4', f"http://127.0.0.1:{server.server_port}/missing")
+        assert ecs_task_limits() == {}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def check_connections(config, db_max_connections):
+    assert config['workers'] >= 1 and config['pool_size'] >= 1
+    # mlflow falls back to the SQLAlchemy overflow of 10 when it is 0
+    assert config['max_overflow'] >= 1
+    per_engine = config['pool_size'] + config['max_overflow']
+    assert config['workers'] * ENGINES_PER_WORKER * per_engine <= db_max_connections
+    # a request never waits for a connection of the pool
+    assert config['threads'] <= per_engine
+
+
+@pytest.mark.parametrize('db_max_connections', [4, 5, 15, 40, 100])
+@pytest.mark.parametrize('cpus,memory_mb', TASK_SIZES)
+def test_derived_config_stays_within_the_connections(cpus, memory_mb, db_max_connections):
+    config = derive_config(cpus, memory_mb, db_max_connections, env={})
+    check_connections(config, db_max_connections)
+    assert config['workers'] <= int(2 * cpus) + 1
+    assert config['workers'] <= max(1, (memory_mb - launcher.RESERVED_MEMORY_MB) // launcher.WORKER_MEMORY_MB)
+
+
+def test_default_task_size():
+    # the 2 vCPU / 4 GiB task of the stack with DB_MAX_CONNECTIONS=15
+    config = derive_config(2, 4096, 15, env={})
+    assert (config['workers'], config['threads'], config['pool_size'], config['max_overflow']) == (3, 2, 1, 1)
+    config = derive_config(0.25, 512, 15, env={})
+    assert (config['workers'], config['threads'], config['pool_size'], config['max_overflow']) == (1, 4, 2, 2)
+
+
+def test_overrides():
+    config = derive_config(4, 8192, 40, env={'WORKERS': '2'})
+    # the threads and the pools follow the workers
+    assert (config['workers'], config['threads'], config['pool_size'], config['max_overflow']) == (2, 10, 5, 5)
+    check_connections(config, 40)
+    with pytest.raises(ValueError, match='4 workers need 16'):
+        derive_config(4, 8192, 15, env={'WORKERS': '4'})
+    with pytest.raises(ValueError, match='at least 4'):
+        derive_config(1, 2048, 3, env={})
+
+
+def test_pool_overrides():
+    # 2 workers of 40 connections have 10 connections per engine
+    config = derive_config(4, 8192, 40, env={'WORKERS': '2', 'THREADS': '6', 'MLFLOW_SQLALCHEMYSTORE_POOL_SIZE': '4'})
+    assert (config['threads'], config['pool_size'], config['max_overflow']) == (6, 4, 2)
+    check_connections(config, 40)
+    config = derive_config(4, 8192, 40, env={'WORKERS': '2', 'MLFLOW_SQLALCHEMYSTORE_POOL_SIZE': '8',
+                                             'MLFLOW_SQLALCHEMYSTORE_MAX_OVERFLOW': '2'})
+    assert (config['pool_size'], config['max_overflow']) == (8, 2)
+    with pytest.raises(ValueError, match='11 threads need 11'):
+        derive_config(4, 8192, 40, env={'WORKERS': '2', 'THREADS': '11'})
+    with pytest.raises(ValueError, match='exceeds the 10'):
+        derive_config(4, 8192, 40, env={'WORKERS': '2', 'MLFLOW_SQLALCHEMYSTORE_POOL_SIZE': '10'})
+    with pytest.raises(ValueError, match='exceeds the 2'):
+        derive_config(2, 4096, 15, env={'MLFLOW_SQLALCHEMYSTORE_MAX_OVERFLOW': '10'})
+    with pytest.raises(ValueError, match='at least 1'):
+        derive_config(2, 4096, 15, env={'MLFLOW_SQLALCHEMYSTORE_MAX_OVERFLOW': '0'})
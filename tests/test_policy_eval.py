@@ -0,0 +1,51 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import pytest
+
+from authorizer_fixtures import method_arn
+from policy_eval import MLFLOW_ROUTES, check_cached_policies, expected_decision, is_allowed
+
+
+def test_cached_policy_matches_reference_on_every_route(issuer, load_index):
+    index = load_index(issuer.write_jwks())
+    assert check_cached_policies(index, issuer) == []
+
+
+def test_policy_of_the_first_request_only_is_caught(issuer):
+    class PerRequestAuthorizer(object):
+        """Allows only the invoked method, as a policy that must not be cached."""
+
+        class token_cache(object):
+            @staticmethod
+            def clear():
+                pass
+
+        @staticmethod
+        def handler(event, context):
+            return {'principalId': 'user', 'policyDocument': {'Version': '2012-10-17', 'Statement': [
+                {'Action': 'execute-api:Invoke', 'Effect': 'Allow', 'Resource': [event['methodArn']]}]}}
+
+    mismatches = check_cached_policies(PerRequestAuthorizer, issuer)
+    assert any(groups == ['readers'] and (first_verb, verb) == ('POST', 'GET') and expected and not cached
+               for groups, first_verb, _, verb, _, expected, cached in mismatches)
+
+
+def test_reference_decisions_of_multi_group_users():
+    search = ('POST', '/ajax-api/2.0/mlflow/runs/search')
+    transition = ('POST', '/ajax-api/2.0/mlflow/model-versions/transition-stage')
+    delete = ('DELETE', '/ajax-api/2.0/mlflow/registered-models/delete')
+    assert expected_decision(['readers'], *search) and not expected_decision(['readers'], *transition)
+    assert expected_decision(['readers', 'model-approvers'], *transition)
+    assert not expected_decision(['readers', 'model-approvers'], *delete)
+    assert expected_decision(['admins', 'readers'], *delete)
+    assert not any(expected_decision(['unknown-group'], verb, path) for verb, path, _ in MLFLOW_ROUTES)
+
+
+def test_explicit_deny_wins():
+    arn = method_arn('DELETE', '/ajax-api/2.0/mlflow/runs/delete')
+    policy = {'Statement': [
+        {'Effect': 'Allow', 'Resource': 'arn:aws:execute-api:*'},
+        {'Effect': 'Deny', 'Resource': [method_arn('DELETE', '*')]},
+    ]}
+    assert not is_allowed(policy, arn)
+    assert is_allowed(policy, method_arn('GET', '/get-artifact'))
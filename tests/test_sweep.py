@@ -0,0 +1,80 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""Configurations of the sweep, and selection and promotion of its best child run on a local file store."""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+pytest.importorskip('mlflow')
+
+import mlflow  # noqa: E402
+from mlflow.tracking import MlflowClient  # noqa: E402
+from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID  # noqa: E402
+
+import sweep  # noqa: E402
+from sweep import best_run, grid_configurations, promote, random_configurations, train_configuration  # noqa: E402
+
+
+def test_grid_configurations():
+    configurations = grid_configurations({'n-estimators': [10, 50, 100], 'min-samples-leaf': [1, 3]})
+    assert configurations == [{'min-samples-leaf': leaf, 'n-estimators': trees} for leaf in (1, 3)
+                              for trees in (10, 50, 100)]
+    assert grid_configurations({'n-estimators': [10], 'min-samples-leaf': []}) == []
+
+
+def test_random_configurations():
+    search_space = {'n-estimators': {'min': 10, 'max': 20}, 'max-features': {'min': 0.1, 'max': 1.0},
+                    'min-samples-leaf': [1, 3, 5]}
+    configurations = random_configurations(search_space, 50, seed=7)
+    assert len(configurations) == 50
+    for configuration in configurations:
+        assert isinstance(configuration['n-estimators'], int) and 10 <= configuration['n-estimators'] <= 20
+        assert isinstance(configuration['max-features'], float) and 0.1 <= configuration['max-features'] <= 1.0
+        assert configuration['min-samples-leaf'] in (1, 3, 5)
+    # both bounds of an integer range are sampled
+    assert {c['n-estimators'] for c in configurations} == set(range(10, 21))
+    # the seed makes the sweep reproducible
+    assert random_configurations(search_space, 50, seed=7) == configurations
+    assert random_configurations(search_space, 50, seed=8) != configurations
+
+
+def test_best_run():
+    results = [('a', {'root-mean-squared-error': 0.5, 'r2-score': 0.7}),
+               ('b', {'root-mean-squared-error': 0.3, 'r2-score': 0.6}),
+               ('c', {'root-mean-squared-error': 0.4, 'r2-score': 0.9})]
+    assert best_run(results, 'root-mean-squared-error')[0] == 'b'
+    # higher is better
+    assert best_run(results, 'r2-score')[0] == 'c'
+
+
+@pytest.fixture
+def datasets(monkeypatch):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 3))
+    y = X[:, 0] + 0.1 * rng.normal(size=len(X))
+    for name, array in {'X_train': X[:300], 'y_train': y[:300], 'X_test': X[300:], 'y_test': y[300:]}.items():
+        monkeypatch.setitem(sweep.datasets, name, array)
+
+
+def test_the_best_child_run_is_promoted(tracking_uri, datasets):
+    client = MlflowClient()
+    # a forest of a single shallow tree is the worst
+    configurations = [{'n-estimators': 20, 'max-depth': 6}, {'n-estimators': 1, 'max-depth': 1}]
+    parent = client.create_run(client.create_experiment('sweep')).info
+    # as in the worker processes, which do not share the active run of the sweep
+    results = [train_configuration(parent.run_id, parent.experiment_id, configuration, [50], 1)
+               for configuration in configurations]
+    run_id, metrics = best_run(results, 'root-mean-squared-error')
+    with mlflow.start_run(run_id=parent.run_id):
+        promote(run_id, metrics, 'sweep-model')
+
+    assert run_id == results[0][0]
+    for child_id, _ in results:
+        assert client.get_run(child_id).data.tags[MLFLOW_PARENT_RUN_ID] == parent.run_id
+    data = client.get_run(parent.run_id).data
+    assert data.params == {'best-n-estimators': '20', 'best-max-depth': '6'}
+    assert data.metrics == metrics
+    assert data.tags['best-run-id'] == run_id
+    champion = client.get_model_version_by_alias('sweep-model', 'champion')
+    assert champion.run_id == run_id